@@ -1,18 +1,161 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
 import os
 
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./mode_design.db"
+    DB_QUERY_COUNT_HEADER: bool = False  # add X-DB-Query-Count to responses
+    DEBUG: bool = False
+    DB_ECHO: Optional[bool] = None  # log SQL; defaults to DEBUG
+
+    # Connection pool (PostgreSQL, and file-backed SQLite)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100  # asyncpg prepared statements; 0 behind pgbouncer
+    DB_POOL_WARM_CONNECTIONS: int = 4  # opened during startup warm-up
+    ALEMBIC_CONFIG: str = "alembic.ini"  # when present, startup migrates to head instead of calling create_all
+
+    # SQLite pragmas, applied to every connection
+    DB_SQLITE_JOURNAL_MODE: str = "WAL"
+    DB_SQLITE_SYNCHRONOUS: str = "NORMAL"  # safe with WAL; FULL for extra durability
+    DB_SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    DB_SQLITE_CACHE_SIZE_KB: int = 20000
     
     # Stack Auth
     STACK_AUTH_PROJECT_ID: str
     STACK_AUTH_SECRET_KEY: str
     STACK_AUTH_PUBLISHABLE_KEY: str
-    
+    STACK_AUTH_API_URL: str = "https://api.stack-auth.com"
+
+    # Token verification cache
+    AUTH_CACHE_TTL_SECONDS: float = 60.0
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_HTTP_MAX_CONNECTIONS: int = 100
+    AUTH_HTTP_MAX_KEEPALIVE: int = 20
+    AUTH_CONNECT_TIMEOUT_SECONDS: float = 2.0
+    AUTH_TIMEOUT_SECONDS: float = 5.0
+
+    # Token verification mode: 'remote' asks Stack Auth, 'local' checks the JWT signature
+    STACK_AUTH_VERIFICATION_MODE: str = "remote"
+    STACK_AUTH_JWKS_URL: Optional[str] = None  # defaults to the project's well-known JWKS
+    STACK_AUTH_JWT_ALGORITHMS: List[str] = ["ES256", "RS256"]
+    STACK_AUTH_JWT_AUDIENCE: Optional[str] = None  # defaults to the project id
+    STACK_AUTH_JWT_ISSUER: Optional[str] = None
+    STACK_AUTH_JWKS_MAX_AGE_SECONDS: float = 3600.0
+    STACK_AUTH_JWKS_MIN_REFRESH_SECONDS: float = 30.0
+
+    # stack_user_id -> User identity map
+    USER_CACHE_TTL_SECONDS: float = 300.0
+    USER_CACHE_MAX_ENTRIES: int = 10000
+
     # Fal.ai
     FAL_KEY: str
+    FAL_WEBHOOK_BASE_URL: Optional[str] = None  # public URL of this API; enables webhooks
+    FAL_WEBHOOK_SECRET: str = ""
+    FAL_QUEUE_URL: str = "https://queue.fal.run"
+    FAL_HTTP_MAX_CONNECTIONS: int = 200
+    FAL_HTTP_MAX_KEEPALIVE: int = 50
+    FAL_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    FAL_READ_TIMEOUT_SECONDS: float = 30.0
+    FAL_SUBMIT_TIMEOUT_SECONDS: float = 30.0
+    FAL_STATUS_TIMEOUT_SECONDS: float = 10.0
+    FAL_RESULT_TIMEOUT_SECONDS: float = 30.0
+
+    # Background generation poller
+    GENERATION_POLLER_ENABLED: bool = True
+    GENERATION_POLL_INTERVAL_SECONDS: float = 2.0
+    GENERATION_POLL_BATCH_SIZE: int = 100
+    GENERATION_POLL_CONCURRENCY: int = 10
+    GENERATION_POLL_BACKOFF_BASE_SECONDS: float = 1.0
+    GENERATION_POLL_BACKOFF_MAX_SECONDS: float = 60.0
+    GENERATION_POLL_WEBHOOK_GRACE_SECONDS: float = 30.0  # first poll delay when webhooks are on
+    GENERATION_MAX_PROCESSING_SECONDS: float = 3600.0  # a generation still processing after this is failed
+    GENERATION_STREAM_HEARTBEAT_SECONDS: float = 15.0
+
+    # Fair-share admission in front of fal
+    FAL_MAX_ACTIVE_JOBS: int = 20
+    FAL_MAX_QUEUE_DEPTH: int = 200
+    FAL_MAX_QUEUED_PER_USER: int = 10
+    FAL_PREMIUM_WEIGHT: float = 3.0
+    FAL_QUEUE_RETRY_AFTER_SECONDS: int = 30
+    FAL_SLOT_RECONCILE_SECONDS: float = 30.0  # how often slots of jobs finished by other workers are freed
+
+    # Reuse of identical generations
+    GENERATION_CACHE_ENABLED: bool = True
+    GENERATION_CACHE_TTL_SECONDS: float = 86400.0
+
+    # Batch submission
+    GENERATION_BATCH_MAX_ITEMS: int = 16
+    GENERATION_BATCH_CONCURRENCY: int = 8  # fal submits in flight per batch
+
+    # Usage accounting: USD charged per completed generation, by model
+    GENERATION_MODEL_COSTS: Dict[str, float] = {}
+
+    # Local mirror of completed generation outputs
+    ASSET_MIRROR_ENABLED: bool = True
+    ASSET_STORE_DIR: str = "storage/assets"
+    ASSET_MIRROR_CONCURRENCY: int = 4
+    ASSET_MIRROR_QUEUE_SIZE: int = 1000
+    ASSET_MIRROR_BACKFILL_LIMIT: int = 500  # completed but unmirrored generations picked up at startup
+    ASSET_MIRROR_TIMEOUT_SECONDS: float = 120.0
+    ASSET_MAX_BYTES: int = 512 * 1024 * 1024
+    ASSET_ACCEL_REDIRECT_PREFIX: Optional[str] = None  # e.g. "/_assets/": let nginx sendfile the blob
+    # Hosts result URLs may be downloaded from, subdomains included; redirects are checked too
+    ASSET_MIRROR_ALLOWED_HOSTS: List[str] = ["fal.media", "fal.run", "fal.ai"]
+
+    # Thumbnails, poster frames and previews of mirrored assets
+    DERIVATIVE_STORE_DIR: str = "storage/derivatives"
+    DERIVATIVE_WORKERS: Optional[int] = None  # render processes; defaults to the CPU count
+    DERIVATIVE_MAX_PENDING: int = 32  # renders queued or running before new ones get 503
+    DERIVATIVE_SIZES: List[int] = [128, 256, 512, 1024]  # requested sizes round up to one of these
+    DERIVATIVE_DEFAULT_SIZE: int = 256
+    DERIVATIVE_WEBP_QUALITY: int = 80
+    DERIVATIVE_TIMEOUT_SECONDS: float = 120.0
+    FFMPEG_BINARY: str = "ffmpeg"
+
+    # Outbound calls to fal and Stack Auth: circuit breakers, retries of
+    # idempotent calls, and a deadline for each request's outbound calls
+    OUTBOUND_BREAKER_FAILURE_THRESHOLD: int = 5  # consecutive failures that open the breaker
+    OUTBOUND_BREAKER_RECOVERY_SECONDS: float = 30.0
+    OUTBOUND_RETRIES: int = 2
+    OUTBOUND_RETRY_BACKOFF_BASE_SECONDS: float = 0.1
+    OUTBOUND_RETRY_BACKOFF_MAX_SECONDS: float = 2.0
+    REQUEST_DEADLINE_SECONDS: float = 30.0
+
+    # Prometheus /metrics endpoint and request timing
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: Optional[str] = None  # bearer token scrapers send; without one, only METRICS_ALLOWED_NETWORKS may scrape
+    METRICS_ALLOWED_NETWORKS: List[str] = ["127.0.0.0/8", "::1/128", "10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16"]
+    METRICS_GENERATION_COUNTS_INTERVAL_SECONDS: float = 60.0  # the by-status gauge is a full-table count
+    # Models reported by name in metric labels, with GENERATION_MODEL_COSTS'; others count as "other"
+    METRICS_MODEL_LABELS: List[str] = ["fal-ai/flux/schnell", "fal-ai/runway-gen3/turbo/image-to-video"]
+
+    # Per-request phase timings (Server-Timing header, slow-request log line)
+    SERVER_TIMING_ENABLED: bool = True
+    REQUEST_TIMING_LOG_MIN_MS: float = 1000.0
+
+    # Sampling profiler: folded stacks of the slowest sampled requests
+    PROFILER_ENABLED: bool = False
+    PROFILER_SAMPLE_RATE: float = 0.1  # share of requests sampled
+    PROFILER_INTERVAL_MS: float = 5.0
+    PROFILER_SLOWEST_PERCENT: float = 5.0  # keep a sampled request's profile if it is this slow
+    PROFILER_OUTPUT_DIR: str = "storage/profiles"
+
+    # Per-user token buckets, by route class ("N/second|minute|hour")
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMITS: Dict[str, str] = {
+        "generate": "30/minute",
+        "status": "240/minute",
+        "list": "120/minute",
+        "default": "300/minute",
+    }
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" (one worker), "redis" (shared), or "local" (in-process stand-in for redis)
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/0"
+    RATE_LIMIT_MEMORY_SHARDS: int = 16
     
     # CORS
     ALLOWED_ORIGINS: List[str] = [
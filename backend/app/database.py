@@ -1,28 +1,168 @@
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, MetaData, event, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from contextvars import ContextVar
+from typing import List, Optional
 import asyncio
+import os
+import time
 
 from app.config import settings
+from app.metrics import DB_POOL_WAIT, DB_QUERY_DURATION, statement_kind
+from app.utils.timing import record_phase
 
-# Convert SQLite URL for async if needed
-if settings.DATABASE_URL.startswith("sqlite"):
-    ASYNC_DATABASE_URL = settings.DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://")
-else:
-    ASYNC_DATABASE_URL = settings.DATABASE_URL
+def async_database_url(database_url: str) -> str:
+    """Swap a plain database URL onto its async driver"""
+    if database_url.startswith("sqlite://"):
+        return database_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    for prefix in ("postgres://", "postgresql://"):
+        if database_url.startswith(prefix):
+            return "postgresql+asyncpg://" + database_url[len(prefix):]
+    return database_url
 
-engine = create_async_engine(ASYNC_DATABASE_URL, echo=True)
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer, and busy_timeout makes
+    # a second writer wait for the lock instead of failing with "database is locked"
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.DB_SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.DB_SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.DB_SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA cache_size={-int(settings.DB_SQLITE_CACHE_SIZE_KB)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long each checkout waited"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            DB_POOL_WAIT.observe(waited)
+            record_phase("db_pool", waited)
+
+def make_engine(database_url: str) -> AsyncEngine:
+    """Async engine with the pool and connection settings for its backend"""
+    url = make_url(async_database_url(database_url))
+    echo = settings.DEBUG if settings.DB_ECHO is None else settings.DB_ECHO
+    pool_options = dict(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    )
+
+    if url.get_backend_name() == "sqlite":
+        options = {}
+        if url.database not in (None, "", ":memory:"):
+            # aiosqlite defaults to NullPool, which opens a connection (and its
+            # thread) for every session
+            options = dict(poolclass=TimedQueuePool, **pool_options)
+        sqlite_engine = create_async_engine(url, echo=echo, **options)
+        event.listen(sqlite_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        return sqlite_engine
+
+    options = dict(
+        poolclass=TimedQueuePool,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        **pool_options
+    )
+    if url.get_driver_name() == "asyncpg":
+        # Both asyncpg's own cache and SQLAlchemy's must be off behind pgbouncer
+        options["connect_args"] = {"statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+        url = url.update_query_dict({"prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)})
+    return create_async_engine(url, echo=echo, **options)
+
+engine = make_engine(settings.DATABASE_URL)
 AsyncSessionLocal = async_sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
 Base = declarative_base()
 
+# Per-request statement counter, see count_queries()
+_query_counter: ContextVar[Optional[List[int]]] = ContextVar("query_counter", default=None)
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _time_query(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        DB_QUERY_DURATION.labels(statement_kind(statement)).observe(elapsed)
+        record_phase("db", elapsed)
+
+def count_queries() -> List[int]:
+    """Start counting statements executed in the current context
+
+    Returns a one-item list holding the running count; tasks spawned from
+    this context share it.
+    """
+    counter = [0]
+    _query_counter.set(counter)
+    return counter
+
+# The schema create_all made before migrations were added
+_INITIAL_REVISION = "0001"
+
+def upgrade_schema(connection) -> None:
+    """Migrate the database to the head revision, unless it is there already
+
+    A database create_all made before migrations were added has tables but
+    no revision; it is stamped at the initial one and upgraded from there.
+    """
+    # Only paid for by deployments that actually use migrations
+    from alembic import command
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    config = Config(settings.ALEMBIC_CONFIG)
+    config.attributes["connection"] = connection
+    script = ScriptDirectory.from_config(config)
+    current = MigrationContext.configure(connection).get_current_heads()
+    if set(current) == set(script.get_heads()):
+        return
+    if not current and inspect(connection).has_table("generations"):
+        command.stamp(config, _INITIAL_REVISION)
+    command.upgrade(config, "head")
+
 async def init_db():
     async with engine.begin() as conn:
+        if os.path.exists(settings.ALEMBIC_CONFIG):
+            await conn.run_sync(upgrade_schema)
+            return
         await conn.run_sync(Base.metadata.create_all)
 
+async def warm_db_pool(connections: int) -> None:
+    """Open pooled connections up front so first requests don't pay for them"""
+    async def touch():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    # Held concurrently, so the pool keeps that many connections
+    await asyncio.gather(*(touch() for _ in range(connections)))
+
+def dialect_insert(session: AsyncSession):
+    """insert() of the session's dialect, which has INSERT ... ON CONFLICT"""
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         try:
@@ -0,0 +1,222 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+from sqlalchemy import func, select
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import hmac
+import ipaddress
+import logging
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a cached-auth API call up to a slow fal video job
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle an HTTP request, by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being handled")
+
+AUTH_VERIFY_DURATION = Histogram(
+    "auth_verify_duration_seconds",
+    "Stack Auth token verification round trips (cache misses only)",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS
+)
+
+FAL_REQUEST_DURATION = Histogram(
+    "fal_request_duration_seconds",
+    "fal queue API calls, by operation, model and outcome",
+    ["operation", "model", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+FAL_SLOT_WAIT = Histogram(
+    "fal_request_slot_wait_seconds",
+    "Time fal calls wait for a free connection slot",
+    buckets=LATENCY_BUCKETS
+)
+
+OUTBOUND_RETRIES = Counter(
+    "outbound_retries_total",
+    "Outbound calls retried after a failure",
+    ["dependency"]
+)
+OUTBOUND_REJECTED = Counter(
+    "outbound_rejected_total",
+    "Outbound calls refused without being sent",
+    ["dependency", "reason"]
+)
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Database statement execution time, by statement kind",
+    ["statement"],
+    buckets=LATENCY_BUCKETS
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time to check a connection out of the pool, including opening one",
+    buckets=LATENCY_BUCKETS
+)
+
+GENERATIONS_FINISHED = Counter(
+    "generations_finished_total",
+    "Generations that reached a final state",
+    ["type", "model", "status"]
+)
+GENERATION_PROCESSING_TIME = Histogram(
+    "generation_processing_seconds",
+    "Submit to completion time of finished generations",
+    ["type", "model", "status"],
+    buckets=LATENCY_BUCKETS
+)
+GENERATION_QUEUE_TIME = Histogram(
+    "generation_fal_queue_seconds",
+    "Processing time not spent in fal inference, where fal reports it",
+    ["model"],
+    buckets=LATENCY_BUCKETS
+)
+GENERATION_COST = Counter(
+    "generation_cost_usd_total",
+    "What fal charged for finished generations",
+    ["type", "model"]
+)
+GENERATIONS_BY_STATUS = Gauge(
+    "generations",
+    "Generations in the database, by type and status, as of the last refresh",
+    ["type", "status"]
+)
+
+_KNOWN_MODELS = frozenset(settings.METRICS_MODEL_LABELS) | frozenset(settings.GENERATION_MODEL_COSTS)
+
+def model_label(model_name: Optional[str]) -> str:
+    """Bounded label for a model name; clients choose it, so unknown names share one label"""
+    return model_name if model_name in _KNOWN_MODELS else "other"
+
+def observe_generation_outcome(generation_type: str, model_name: Optional[str], values: Dict[str, Any]) -> None:
+    labels = (generation_type, model_label(model_name), values["status"])
+    GENERATIONS_FINISHED.labels(*labels).inc()
+    if values.get("processing_time") is not None:
+        GENERATION_PROCESSING_TIME.labels(*labels).observe(values["processing_time"])
+    if values.get("cost"):
+        GENERATION_COST.labels(generation_type, model_label(model_name)).inc(values["cost"])
+
+def statement_kind(statement: str) -> str:
+    """Bounded label for a SQL statement: its leading keyword"""
+    kind = statement.lstrip()[:8].split(None, 1)
+    return kind[0].upper() if kind else "OTHER"
+
+class _StateCollector:
+    """Exports counters the services already keep, read at scrape time"""
+
+    def describe(self):
+        # Nothing to collect at registration, before the services are imported
+        return []
+
+    def collect(self):
+        from app.database import engine
+        from app.middleware.auth import get_auth_cache_stats
+        from app.services.projects import get_patch_stats
+        from app.services.asset_mirror import asset_mirror
+        from app.services.fal_scheduler import fal_scheduler
+        from app.services.outbound import CircuitBreaker, dependencies
+
+        auth = get_auth_cache_stats()
+        for name in ("hits", "misses", "evictions", "coalesced"):
+            yield CounterMetricFamily(f"auth_token_cache_{name}", f"Token verification cache {name}", value=auth[name])
+
+        scheduler = GaugeMetricFamily("fal_scheduler_jobs", "fal jobs held by the scheduler", labels=["state"])
+        scheduler.add_metric(["active"], fal_scheduler.active)
+        scheduler.add_metric(["queued"], fal_scheduler.queued)
+        yield scheduler
+
+        # 0 closed, 1 half-open, 2 open
+        breakers = GaugeMetricFamily("outbound_circuit_state", "Circuit breaker state per dependency", labels=["dependency"])
+        states = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+        for name, dependency in dependencies.items():
+            breakers.add_metric([name], states[dependency.breaker.state])
+        yield breakers
+
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):
+            connections = GaugeMetricFamily("db_pool_connections", "Database pool connections", labels=["state"])
+            connections.add_metric(["checked_out"], pool.checkedout())
+            connections.add_metric(["idle"], pool.checkedin())
+            yield connections
+
+        yield GaugeMetricFamily("asset_mirror_queue_depth", "Generations waiting to be mirrored", value=asset_mirror.queue_depth)
+
+        patches = get_patch_stats()
+        yield CounterMetricFamily("project_patch_bytes", "Bytes received as project patches", value=patches["patch_bytes"])
+        yield CounterMetricFamily("project_patch_bytes_saved", "Bytes patches saved over full-document saves", value=patches["bytes_saved"])
+
+REGISTRY.register(_StateCollector())
+
+class GenerationCounts:
+    """Keeps the generations-by-status gauge current without a count per scrape
+
+    The grouped count reads the whole generations table, so it runs at most
+    once per ``interval`` seconds however often /metrics is scraped, and
+    concurrent scrapes wait for the same refresh.
+    """
+
+    def __init__(self, interval: float, clock: Callable[[], float] = time.monotonic):
+        self.interval = interval
+        self._clock = clock
+        self._refreshed_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._refreshed_at is not None and self._clock() - self._refreshed_at < self.interval
+
+    async def refresh(self) -> None:
+        if self._fresh():
+            return
+        async with self._lock:
+            if self._fresh():
+                return
+            try:
+                await self._count()
+            except Exception:
+                # Serve the last counts rather than fail the scrape
+                logger.warning("Failed to count generations for metrics", exc_info=True)
+            self._refreshed_at = self._clock()
+
+    async def _count(self) -> None:
+        from app.database import AsyncSessionLocal
+        from app.models.generation import Generation
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Generation.generation_type, Generation.status, func.count())
+                .group_by(Generation.generation_type, Generation.status)
+            )
+            rows = result.all()
+        GENERATIONS_BY_STATUS.clear()
+        for generation_type, generation_status, count in rows:
+            GENERATIONS_BY_STATUS.labels(generation_type, generation_status).set(count)
+
+generation_counts = GenerationCounts(interval=settings.METRICS_GENERATION_COUNTS_INTERVAL_SECONDS)
+
+_allowed_networks = [ipaddress.ip_network(network) for network in settings.METRICS_ALLOWED_NETWORKS]
+
+def metrics_access_allowed(authorization: Optional[str], client_host: Optional[str]) -> bool:
+    """Whether a scrape may read /metrics: METRICS_TOKEN if set, else the client's network"""
+    if settings.METRICS_TOKEN:
+        scheme, _, token = (authorization or "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(token, settings.METRICS_TOKEN)
+    try:
+        address = ipaddress.ip_address(client_host or "")
+    except ValueError:
+        return False
+    return any(address in network for network in _allowed_networks)
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Exposition-format body and its content type"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
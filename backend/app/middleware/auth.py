@@ -0,0 +1,317 @@
+from fastapi import HTTPException, status, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import TYPE_CHECKING, Dict, NamedTuple, Optional
+import asyncio
+import hashlib
+import time
+from app.config import settings
+from app.database import get_db
+from app.metrics import AUTH_VERIFY_DURATION
+from app.models.user import User
+from app.services.outbound import DeadlineExceeded, DependencyUnavailable, stack_auth_dependency
+from app.utils.cache import TTLCache, SingleFlight
+from app.utils.timing import timed_phase
+
+# httpx and jose are imported where they are used: together they are a large
+# share of import time, and the app can start serving before either is needed
+if TYPE_CHECKING:
+    import httpx
+    from jose import jwk
+
+security = HTTPBearer()
+
+# Verified Stack Auth users keyed by token hash, so raw tokens never sit in memory
+token_cache = TTLCache(
+    maxsize=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl=settings.AUTH_CACHE_TTL_SECONDS
+)
+_inflight = SingleFlight()
+
+# Long-lived pooled client, opened and closed by the app lifespan
+_http_client: Optional["httpx.AsyncClient"] = None
+
+def _build_http_client() -> "httpx.AsyncClient":
+    import httpx
+
+    return httpx.AsyncClient(
+        base_url=settings.STACK_AUTH_API_URL,
+        headers={"X-Stack-Project-Id": settings.STACK_AUTH_PROJECT_ID},
+        limits=httpx.Limits(
+            max_connections=settings.AUTH_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.AUTH_HTTP_MAX_KEEPALIVE
+        ),
+        timeout=httpx.Timeout(
+            settings.AUTH_TIMEOUT_SECONDS,
+            connect=settings.AUTH_CONNECT_TIMEOUT_SECONDS
+        )
+    )
+
+async def start_auth_client() -> None:
+    """Open the shared Stack Auth HTTP client"""
+    global _http_client
+    if _http_client is None:
+        _http_client = _build_http_client()
+
+    if settings.STACK_AUTH_VERIFICATION_MODE == "local":
+        # Warm the key set so the first request doesn't pay for the fetch
+        try:
+            await jwks_store.refresh()
+        except Exception:
+            pass
+
+async def close_auth_client() -> None:
+    """Close the shared Stack Auth HTTP client and drop cached verifications"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    token_cache.clear()
+
+def get_auth_client() -> "httpx.AsyncClient":
+    # Fall back to a lazily created client when running outside the lifespan
+    global _http_client
+    if _http_client is None:
+        _http_client = _build_http_client()
+    return _http_client
+
+def get_auth_cache_stats() -> dict:
+    """Hit/miss counters for the token verification cache"""
+    return {**token_cache.stats(), "coalesced": _inflight.coalesced}
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def _stack_auth_get(url: str, **kwargs) -> "httpx.Response":
+    """GET from Stack Auth behind its circuit breaker, retrying 5xx and network errors"""
+    async def send(budget: float) -> "httpx.Response":
+        response = await get_auth_client().get(url, timeout=budget, **kwargs)
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
+        return response
+
+    return await stack_auth_dependency.call(send, settings.AUTH_TIMEOUT_SECONDS, idempotent=True)
+
+async def _fetch_stack_auth_user(token: str) -> dict:
+    response = await _stack_auth_get(
+        "/api/v1/users/me",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication token"
+        )
+
+    return response.json()
+
+class JWKSKeyStore:
+    """Stack Auth signing keys, fetched once and refreshed when the key id rotates"""
+
+    def __init__(self, url: str, max_age: float, min_refresh_interval: float):
+        self.url = url
+        self.max_age = max_age
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[str, "jwk.Key"] = {}
+        self._fetched_at: Optional[float] = None
+        self._refresh = SingleFlight()
+        self._background: Optional[asyncio.Task] = None
+
+    def load(self, jwks: dict) -> None:
+        """Replace the key set with the keys of a JWKS document"""
+        from jose import jwk
+        from jose.exceptions import JWKError
+
+        keys = {}
+        for key_data in jwks.get("keys", []):
+            kid = key_data.get("kid")
+            algorithm = key_data.get("alg") or ("ES256" if key_data.get("kty") == "EC" else "RS256")
+            if not kid or algorithm not in settings.STACK_AUTH_JWT_ALGORITHMS:
+                continue
+            try:
+                keys[kid] = jwk.construct(key_data, algorithm)
+            except JWKError:
+                continue
+
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    async def refresh(self) -> None:
+        """Fetch the key set, sharing one request between concurrent callers"""
+        await self._refresh.do("jwks", self._fetch)
+
+    async def _fetch(self) -> None:
+        response = await _stack_auth_get(self.url)
+        response.raise_for_status()
+        self.load(response.json())
+
+    def _age(self) -> float:
+        if self._fetched_at is None:
+            return float("inf")
+        return time.monotonic() - self._fetched_at
+
+    async def get_key(self, kid: str) -> Optional["jwk.Key"]:
+        key = self._keys.get(kid)
+
+        if key is None:
+            # Unknown key id: the keys may have rotated, but don't let bogus
+            # ids trigger a fetch per request
+            if self._age() >= self.min_refresh_interval:
+                try:
+                    await self.refresh()
+                except Exception:
+                    return None
+                key = self._keys.get(kid)
+        elif self._age() >= self.max_age and self._background is None:
+            self._background = asyncio.ensure_future(self.refresh())
+            self._background.add_done_callback(self._background_done)
+
+        return key
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background = None
+        if not task.cancelled():
+            task.exception()
+
+jwks_store = JWKSKeyStore(
+    url=settings.STACK_AUTH_JWKS_URL or (
+        f"{settings.STACK_AUTH_API_URL}/api/v1/projects/"
+        f"{settings.STACK_AUTH_PROJECT_ID}/.well-known/jwks.json"
+    ),
+    max_age=settings.STACK_AUTH_JWKS_MAX_AGE_SECONDS,
+    min_refresh_interval=settings.STACK_AUTH_JWKS_MIN_REFRESH_SECONDS
+)
+
+def _claims_to_user(claims: dict) -> dict:
+    # Shape the claims like the /users/me payload the routers read from
+    user_data = {"id": claims["sub"]}
+    for claim, field in (
+        ("email", "email"),
+        ("name", "display_name"),
+        ("email_verified", "primary_email_verified"),
+        ("selected_team_id", "selected_team_id"),
+    ):
+        if claim in claims:
+            user_data[field] = claims[claim]
+    return user_data
+
+async def verify_stack_auth_token_locally(token: str) -> dict:
+    """Verify a Stack Auth access token against the cached JWKS keys"""
+    from jose import jwt, JWTError
+
+    try:
+        header = jwt.get_unverified_header(token)
+        key = await jwks_store.get_key(header.get("kid"))
+        if key is None:
+            raise JWTError("Unknown signing key")
+
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=settings.STACK_AUTH_JWT_ALGORITHMS,
+            audience=settings.STACK_AUTH_JWT_AUDIENCE or settings.STACK_AUTH_PROJECT_ID,
+            issuer=settings.STACK_AUTH_JWT_ISSUER
+        )
+        return _claims_to_user(claims)
+    except (JWTError, KeyError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication failed"
+        )
+
+async def verify_stack_auth_token(token: str) -> dict:
+    """Verify Stack Auth token with their API"""
+    key = _token_key(token)
+    if settings.STACK_AUTH_VERIFICATION_MODE == "local":
+        user_data = await verify_stack_auth_token_locally(token)
+        # Never read back here (each request checks the signature), but the
+        # rate limiter keys verified tokens by user through it
+        token_cache.set(key, user_data)
+        return user_data
+
+    user_data = token_cache.get(key)
+    if user_data is not None:
+        return user_data
+
+    started = time.perf_counter()
+    try:
+        # Concurrent requests carrying the same token share one upstream call
+        user_data = await _inflight.do(key, lambda: _fetch_stack_auth_user(token))
+    except (DependencyUnavailable, DeadlineExceeded):
+        AUTH_VERIFY_DURATION.labels("unavailable").observe(time.perf_counter() - started)
+        raise
+    except HTTPException:
+        AUTH_VERIFY_DURATION.labels("rejected").observe(time.perf_counter() - started)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication failed"
+        )
+    except Exception as e:
+        # Stack Auth didn't answer, which says nothing about the token; a 401
+        # would sign the user out
+        AUTH_VERIFY_DURATION.labels("unavailable").observe(time.perf_counter() - started)
+        raise DependencyUnavailable("stack_auth", retry_after=1) from e
+
+    AUTH_VERIFY_DURATION.labels("ok").observe(time.perf_counter() - started)
+    token_cache.set(key, user_data)
+    return user_data
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Verify and decode the authentication token"""
+    token = credentials.credentials
+    with timed_phase("auth"):
+        user_data = await verify_stack_auth_token(token)
+    return user_data
+
+async def get_current_user(user_data: dict = Depends(verify_token)) -> dict:
+    """Get current authenticated user"""
+    return user_data
+
+class DbUser(NamedTuple):
+    """The part of a User row that request handlers need"""
+    id: int
+    stack_user_id: str
+    is_premium: bool
+
+# stack_user_id -> DbUser, so handlers skip the per-request user lookup
+user_cache = TTLCache(
+    maxsize=settings.USER_CACHE_MAX_ENTRIES,
+    ttl=settings.USER_CACHE_TTL_SECONDS
+)
+
+def invalidate_db_user(stack_user_id: str) -> None:
+    """Drop a user from the identity map after it changes"""
+    user_cache.pop(stack_user_id)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_change(mapper, connection, target):
+    invalidate_db_user(target.stack_user_id)
+
+async def get_db_user(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> DbUser:
+    """Get the database user for the authenticated Stack Auth user"""
+    stack_user_id = current_user["id"]
+    user = user_cache.get(stack_user_id)
+    if user is not None:
+        return user
+
+    with timed_phase("user"):
+        result = await db.execute(
+            select(User.id, User.is_premium).where(User.stack_user_id == stack_user_id)
+        )
+        row = result.first()
+
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    user = DbUser(id=row.id, stack_user_id=stack_user_id, is_premium=bool(row.is_premium))
+    user_cache.set(stack_user_id, user)
+    return user
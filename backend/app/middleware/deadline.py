@@ -0,0 +1,19 @@
+from app.services.outbound import request_deadline
+
+class DeadlineMiddleware:
+    """Gives each request a deadline that its outbound calls can't outlive
+
+    Calls to fal and Stack Auth made while handling the request (and in
+    tasks it spawns) are cut short when the deadline passes, and answered
+    with 504, instead of holding the worker for their own full timeouts.
+    """
+
+    def __init__(self, app, seconds: float):
+        self.app = app
+        self.seconds = seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with request_deadline(self.seconds):
+            await self.app(scope, receive, send)
@@ -0,0 +1,256 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Pattern, Tuple
+import logging
+import math
+import re
+import time
+
+import orjson
+
+from app.config import settings
+from app.middleware.auth import _token_key, token_cache
+
+logger = logging.getLogger(__name__)
+
+class RateLimitRule(NamedTuple):
+    """A token bucket: ``capacity`` requests of burst, refilled at ``rate`` per second"""
+    name: str
+    capacity: float
+    rate: float
+
+    @property
+    def window(self) -> int:
+        # Seconds an empty bucket takes to refill
+        return math.ceil(self.capacity / self.rate)
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: int  # seconds until the request would be allowed
+    reset: int  # seconds until the bucket is full again
+
+_UNITS = {"second": 1, "minute": 60, "hour": 3600}
+
+def parse_rule(name: str, spec: str) -> RateLimitRule:
+    """Parse "30/minute" into a bucket of 30 that refills 30 tokens a minute"""
+    count, _, unit = spec.partition("/")
+    return RateLimitRule(name, float(count), float(count) / _UNITS[unit.strip()])
+
+def refill_and_take(
+    tokens: float,
+    updated: float,
+    capacity: float,
+    rate: float,
+    cost: float,
+    now: float
+) -> Tuple[float, bool]:
+    """Bucket level after refilling since ``updated`` and taking ``cost`` if available"""
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    if tokens >= cost:
+        return tokens - cost, True
+    return tokens, False
+
+def _decision(rule: RateLimitRule, tokens: float, allowed: bool, cost: float) -> RateLimitDecision:
+    return RateLimitDecision(
+        allowed=allowed,
+        remaining=int(tokens),
+        retry_after=0 if allowed else math.ceil((cost - tokens) / rule.rate),
+        reset=math.ceil((rule.capacity - tokens) / rule.rate)
+    )
+
+class MemoryBucketStore:
+    """Token buckets in this process's memory, for a single worker
+
+    Keys are spread over shards, and each shard drops its idle (full)
+    buckets on its own schedule, so no sweep ever walks every key.
+    """
+
+    def __init__(self, shards: int = 16, sweep_interval: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self._shards: List[Dict[str, Tuple[float, float, float]]] = [{} for _ in range(shards)]
+        self._next_sweep = [0.0] * shards
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+
+    async def take(self, key: str, rule: RateLimitRule, cost: float = 1.0) -> RateLimitDecision:
+        now = self._clock()
+        # One bucket per route class, as in SharedBucketStore
+        key = f"{rule.name}:{key}"
+        index = hash(key) % len(self._shards)
+        shard = self._shards[index]
+
+        tokens, updated, _ = shard.get(key, (rule.capacity, now, now))
+        tokens, allowed = refill_and_take(tokens, updated, rule.capacity, rule.rate, cost, now)
+        # Third field: when the bucket will be full, i.e. safe to forget
+        shard[key] = (tokens, now, now + (rule.capacity - tokens) / rule.rate)
+
+        if now >= self._next_sweep[index]:
+            self._next_sweep[index] = now + self.sweep_interval
+            for idle in [k for k, (_, _, full_at) in shard.items() if full_at <= now]:
+                del shard[idle]
+
+        return _decision(rule, tokens, allowed, cost)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+# Runs atomically in Redis, on the server's clock so workers needn't agree on time
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+class SharedBucketStore:
+    """Token buckets shared by every worker, kept in Redis by one atomic script
+
+    ``client`` needs only ``register_script``, as on ``redis.asyncio.Redis``;
+    LocalScriptClient stands in for it without a server. If the backend
+    fails, requests are let through rather than rejected.
+    """
+
+    def __init__(self, client: Any, prefix: str = "ratelimit:"):
+        self.prefix = prefix
+        self._take = client.register_script(_TAKE_SCRIPT)
+
+    async def take(self, key: str, rule: RateLimitRule, cost: float = 1.0) -> RateLimitDecision:
+        try:
+            allowed, tokens = await self._take(
+                keys=[f"{self.prefix}{rule.name}:{key}"],
+                args=[rule.capacity, rule.rate, cost]
+            )
+        except Exception:
+            logger.warning("Rate limit store unavailable, allowing request", exc_info=True)
+            return RateLimitDecision(True, int(rule.capacity), 0, 0)
+        return _decision(rule, float(tokens), bool(int(allowed)), cost)
+
+class LocalScriptClient:
+    """In-process stand-in for the Redis client SharedBucketStore uses
+
+    Evaluates the bucket script's logic in Python against a dict, so the
+    shared-store code path runs in tests and on machines without Redis.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._data: Dict[str, Tuple[float, float]] = {}
+
+    def register_script(self, script: str):
+        async def run(keys: List[str], args: List[Any]) -> List[Any]:
+            capacity, rate, cost = (float(arg) for arg in args)
+            now = self._clock()
+            tokens, updated = self._data.get(keys[0], (capacity, now))
+            tokens, allowed = refill_and_take(tokens, updated, capacity, rate, cost, now)
+            self._data[keys[0]] = (tokens, now)
+            return [int(allowed), repr(tokens)]
+        return run
+
+def build_bucket_store():
+    """The store RATE_LIMIT_BACKEND selects"""
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        # Only needed by deployments that run several workers
+        import redis.asyncio
+
+        return SharedBucketStore(redis.asyncio.Redis.from_url(settings.RATE_LIMIT_REDIS_URL))
+    if settings.RATE_LIMIT_BACKEND == "local":
+        return SharedBucketStore(LocalScriptClient())
+    return MemoryBucketStore(shards=settings.RATE_LIMIT_MEMORY_SHARDS)
+
+# (rule, method, path); first match wins, and other /api/ paths use "default"
+ROUTE_CLASSES: List[Tuple[str, str, Pattern]] = [
+    ("generate", "POST", re.compile(r"^/api/(images|videos)/generate(/batch)?$")),
+    ("status", "GET", re.compile(r"^/api/(images|videos)/generations/\d+/status$")),
+    ("status", "GET", re.compile(r"^/api/generations/stream$")),
+    ("list", "GET", re.compile(r"^/api/((images|videos)/generations|projects/?|generations/stats)$")),
+]
+# fal callbacks and the public, CDN-cacheable asset URLs
+UNLIMITED = re.compile(r"^/api/(webhooks|assets)/")
+
+RATE_LIMIT_HEADERS = ["RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy"]
+
+class RateLimitMiddleware:
+    """Per-user token buckets for each class of API route
+
+    A plain ASGI middleware: the check is a regex match, a hash and one
+    store lookup, and nothing wraps the request body. Requests are keyed by
+    the Stack Auth user once their token has been verified, and by client
+    address otherwise: an unverified token costs nothing to mint, so keying
+    by it would hand each bogus token a fresh bucket. Every limited
+    response carries RateLimit-* headers; a rejected one is a 429 with
+    Retry-After.
+    """
+
+    def __init__(self, app, store=None, rules: Optional[Dict[str, RateLimitRule]] = None):
+        self.app = app
+        self.store = store or build_bucket_store()
+        self.rules = rules or {
+            name: parse_rule(name, spec) for name, spec in settings.RATE_LIMITS.items()
+        }
+
+    def classify(self, method: str, path: str) -> Optional[RateLimitRule]:
+        if not path.startswith("/api/") or UNLIMITED.match(path):
+            return None
+        for name, rule_method, pattern in ROUTE_CLASSES:
+            if method == rule_method and pattern.match(path):
+                return self.rules.get(name)
+        return self.rules.get("default")
+
+    @staticmethod
+    def client_key(scope) -> str:
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                token = value.decode("latin-1").partition(" ")[2]
+                user = token_cache.peek(_token_key(token)) if token else None
+                if user:
+                    return f"user:{user['id']}"
+                break
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        rule = self.classify(scope["method"], scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        decision = await self.store.take(self.client_key(scope), rule)
+        headers = [
+            (b"ratelimit-limit", b"%d" % rule.capacity),
+            (b"ratelimit-remaining", b"%d" % decision.remaining),
+            (b"ratelimit-reset", b"%d" % decision.reset),
+            (b"ratelimit-policy", b"%d;w=%d" % (rule.capacity, rule.window)),
+        ]
+
+        if not decision.allowed:
+            body = orjson.dumps({"detail": "Rate limit exceeded, try again later"})
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": headers + [
+                    (b"retry-after", b"%d" % decision.retry_after),
+                    (b"content-type", b"application/json"),
+                    (b"content-length", b"%d" % len(body)),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
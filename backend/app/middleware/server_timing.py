@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+
+import orjson
+
+from app.config import settings
+from app.utils.profiler import SamplingProfiler
+from app.utils.timing import start_request_timings
+
+logger = logging.getLogger(__name__)
+
+request_profiler = SamplingProfiler(
+    enabled=settings.PROFILER_ENABLED,
+    sample_rate=settings.PROFILER_SAMPLE_RATE,
+    interval=settings.PROFILER_INTERVAL_MS / 1000,
+    slowest_percent=settings.PROFILER_SLOWEST_PERCENT,
+    output_dir=settings.PROFILER_OUTPUT_DIR
+)
+
+class ServerTimingMiddleware:
+    """Breaks each request's time down by phase
+
+    Phases are recorded by the code that spends the time (auth, the user
+    lookup, database statements, fal calls, response encoding) through
+    app.utils.timing. The breakdown goes out as a Server-Timing header, and
+    requests slower than REQUEST_TIMING_LOG_MIN_MS also get a JSON log line.
+    When the sampling profiler is on, the log line names the profile
+    written for a slow request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = start_request_timings()
+        profile = request_profiler.start() if request_profiler.enabled else None
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                header = timings.server_timing(time.perf_counter() - started)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            duration = time.perf_counter() - started
+            profile_path = None
+            if request_profiler.enabled:
+                request_profiler.observe(duration)
+            if profile is not None:
+                request_profiler.stop(profile)
+                if request_profiler.is_slow(duration):
+                    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{scope['method']}-{scope['path']}-{duration * 1000:.0f}ms"
+                    profile_path = await asyncio.to_thread(request_profiler.save, profile, name)
+
+            if duration * 1000 >= settings.REQUEST_TIMING_LOG_MIN_MS:
+                logger.info(orjson.dumps({
+                    "event": "request_timing",
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_code,
+                    "ms": round(duration * 1000, 2),
+                    "phases": timings.as_dict(),
+                    "profile": profile_path,
+                }).decode())
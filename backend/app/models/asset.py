@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+class Asset(Base):
+    """A generation output stored locally under its SHA-256 (see app.services.asset_mirror)"""
+    __tablename__ = "assets"
+
+    sha256 = Column(String, primary_key=True)
+    content_type = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
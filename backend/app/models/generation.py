@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
 from app.database import Base
 
 class Generation(Base):
@@ -14,14 +15,39 @@ class Generation(Base):
     prompt = Column(Text, nullable=False)
     negative_prompt = Column(Text)
     parameters = Column(Text)  # JSON string of generation parameters
+    cache_key = Column(String, index=True)  # hash of model, prompt and parameters
     result_url = Column(String)
-    fal_request_id = Column(String)
+    asset_sha256 = Column(String)  # local mirror of result_url, see app.models.asset
+    fal_request_id = Column(String, index=True)
     status = Column(String, default="pending")  # pending, processing, completed, failed
     error_message = Column(Text)
     processing_time = Column(Float)
     cost = Column(Float)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True))
+    # Set from Python so it has sub-second resolution; list ETags are built from its maximum
+    updated_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc)
+    )
     
     user = relationship("User")
-    project = relationship("Project")
\ No newline at end of file
+    project = relationship("Project")
+
+    @property
+    def asset_url(self):
+        """Path of the locally mirrored output, once it has been copied"""
+        return f"/api/assets/{self.asset_sha256}" if self.asset_sha256 else None
+
+    @property
+    def thumbnail_url(self):
+        """Thumbnail (poster frame for videos) of the mirrored output, rendered on first request"""
+        return f"/api/assets/{self.asset_sha256}/thumbnail" if self.asset_sha256 else None
+
+    __table_args__ = (
+        # Serves the per-user, per-type history listings newest first
+        Index("ix_generations_user_type_created", "user_id", "generation_type", "created_at"),
+        # Makes the list watermark, max(updated_at), a single index lookup
+        Index("ix_generations_user_type_updated", "user_id", "generation_type", "updated_at"),
+    )
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -14,11 +14,17 @@ class Project(Base):
     data = Column(JSON)  # Store project layers, settings, etc.
     thumbnail_url = Column(String)
     is_public = Column(Boolean, default=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # bumped on every save
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     user = relationship("User", back_populates="projects")
 
+    __table_args__ = (
+        # Serves the per-user project listing, most recently updated first
+        Index("ix_projects_user_updated", "user_id", "updated_at"),
+    )
+
 # Add to User model
 from app.models.user import User
 User.projects = relationship("Project", back_populates="user")
\ No newline at end of file
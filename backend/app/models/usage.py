@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
+from app.database import Base
+
+class UserGenerationStats(Base):
+    """Running totals of a user's finished generations per type and model
+
+    Maintained in the same transaction that finalizes each generation (see
+    app.services.usage_stats); rebuild from history with
+    ``python -m app.services.usage_stats``.
+    """
+    __tablename__ = "user_generation_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    generation_type = Column(String, primary_key=True)
+    model_name = Column(String, primary_key=True)
+    completed_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+    total_cost = Column(Float, nullable=False, default=0.0)
+    processing_time_count = Column(Integer, nullable=False, default=0)
+    processing_time_total = Column(Float, nullable=False, default=0.0)
+    last_finished_at = Column(DateTime(timezone=True))
+
+class ProcessingTimeBucket(Base):
+    """One bucket of the processing-time sketch behind UserGenerationStats
+
+    Buckets are logarithmic, so a key has a few dozen rows at most however
+    many generations it covers, and every update is a single-row upsert.
+    """
+    __tablename__ = "user_generation_processing_time_buckets"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    generation_type = Column(String, primary_key=True)
+    model_name = Column(String, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,140 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Optional, Tuple
+import os
+import re
+
+from app.config import settings
+from app.database import get_db
+from app.models.asset import Asset
+from app.services.asset_mirror import asset_mirror
+from app.services.derivatives import DerivativeUnsupported, derivative_renderer
+from app.utils.etag import etag_matches
+from app.utils.http_range import RangeNotSatisfiable, iter_file_range, parse_range
+
+router = APIRouter()
+
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+# Content-addressed: the bytes behind a URL never change
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+async def _load_asset(db: AsyncSession, sha256: str) -> Tuple[Asset, str]:
+    asset = await db.get(Asset, sha256) if _SHA256.fullmatch(sha256) else None
+    path = asset_mirror.blob_path(sha256) if asset else None
+    if asset is None or not os.path.exists(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Asset not found"
+        )
+    return asset, path
+
+def _immutable_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+
+@router.api_route("/{sha256}", methods=["GET", "HEAD"])
+async def get_asset(
+    sha256: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Serve a mirrored generation output, honouring Range and If-None-Match
+
+    No auth: like the fal CDN URLs they replace, the unguessable hash is the
+    capability, which lets <img> and <video> tags load them directly.
+    """
+    asset, path = await _load_asset(db, sha256)
+    etag = f'"{sha256}"'
+    headers = {**_immutable_headers(etag), "Accept-Ranges": "bytes"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if settings.ASSET_ACCEL_REDIRECT_PREFIX:
+        # nginx serves the file itself, with sendfile and its own Range support
+        headers["X-Accel-Redirect"] = settings.ASSET_ACCEL_REDIRECT_PREFIX + os.path.relpath(path, asset_mirror.store_dir)
+        return Response(headers=headers, media_type=asset.content_type)
+
+    # A stale If-Range means the client's partial copy is of other bytes
+    if_range = request.headers.get("if-range")
+    byte_range = None
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), asset.size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{asset.size}"}
+            )
+
+    if byte_range is None:
+        return FileResponse(path, media_type=asset.content_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{asset.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if request.method == "HEAD":
+        return Response(status_code=status.HTTP_206_PARTIAL_CONTENT, headers=headers, media_type=asset.content_type)
+    return StreamingResponse(
+        iter_file_range(path, start, end - start + 1),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        headers=headers,
+        media_type=asset.content_type
+    )
+
+async def _serve_derivative(
+    request: Request,
+    db: AsyncSession,
+    sha256: str,
+    kind: str,
+    size: Optional[int]
+) -> Response:
+    size = derivative_renderer.snap_size(size)
+    etag = f'"{sha256}-{kind}-{size}"'
+    headers = _immutable_headers(etag)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    asset, path = await _load_asset(db, sha256)
+    # Don't hold a pooled connection for the length of a render
+    await db.close()
+    try:
+        derivative = await derivative_renderer.get(sha256, path, asset.content_type, kind, size)
+    except DerivativeUnsupported:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No {kind} for this asset"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to render {kind}: {str(e)}"
+        )
+
+    media_type = "image/webp" if kind == "thumbnail" else "video/mp4"
+    return FileResponse(derivative, media_type=media_type, headers=headers)
+
+@router.get("/{sha256}/thumbnail")
+async def get_asset_thumbnail(
+    sha256: str,
+    request: Request,
+    size: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_db)
+):
+    """WebP thumbnail of an image, or poster frame of a video, rendered on first request
+
+    ``size`` bounds both dimensions and is rounded up to a configured size.
+    """
+    return await _serve_derivative(request, db, sha256, "thumbnail", size)
+
+@router.get("/{sha256}/preview")
+async def get_asset_preview(
+    sha256: str,
+    request: Request,
+    size: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_db)
+):
+    """Low-resolution MP4 of a video, rendered on first request"""
+    return await _serve_derivative(request, db, sha256, "preview", size)
@@ -4,7 +4,7 @@ from sqlalchemy import select
 from pydantic import BaseModel
 
 from app.database import get_db
-from app.middleware.auth import get_current_user
+from app.middleware.auth import get_current_user, invalidate_db_user
 from app.models.user import User
 
 router = APIRouter()
@@ -79,4 +79,5 @@ async def sync_user(
         db.add(user)
     
     await db.commit()
+    invalidate_db_user(current_user["id"])
     return {"message": "User synced successfully"}
\ No newline at end of file
@@ -0,0 +1,94 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import AsyncIterator, Dict, List
+import asyncio
+
+from app.config import settings
+from app.database import get_db
+from app.middleware.auth import DbUser, get_db_user
+from app.models.generation import Generation
+from app.schemas.generation import GenerationStatsResponse, GenerationStatusResponse
+from app.services.generation_events import FINAL_STATUSES, generation_events
+from app.services.usage_stats import load_user_stats
+
+router = APIRouter()
+
+def _sse(event: GenerationStatusResponse) -> str:
+    return f"event: status\ndata: {event.model_dump_json()}\n\n"
+
+async def _event_stream(
+    user_id: int,
+    queue: asyncio.Queue,
+    snapshot: List[GenerationStatusResponse]
+) -> AsyncIterator[str]:
+    # The queue was subscribed before the snapshot was read, so it may repeat
+    # what the snapshot says; drop anything a client has already been sent
+    sent: Dict[int, GenerationStatusResponse] = {}
+    try:
+        for event in snapshot:
+            sent[event.id] = event
+            yield _sse(event)
+
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(),
+                    timeout=settings.GENERATION_STREAM_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                continue
+            previous = sent.get(event.id)
+            if previous is not None and (previous == event or previous.status in FINAL_STATUSES):
+                continue
+            sent[event.id] = event
+            yield _sse(event)
+    finally:
+        generation_events.unsubscribe(user_id, queue)
+
+@router.get("/stream")
+async def stream_generation_status(
+    user: DbUser = Depends(get_db_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stream status changes for all of the user's in-flight generations"""
+    # Subscribe first: an event published while the snapshot is read is
+    # queued rather than lost
+    queue = generation_events.subscribe(user.id)
+    try:
+        result = await db.execute(
+            select(Generation.id, Generation.status)
+            .where(Generation.user_id == user.id)
+            .where(Generation.status.in_(("pending", "processing")))
+            .order_by(Generation.id)
+        )
+        snapshot = []
+        for row in result.all():
+            latest = generation_events.latest(row.id)
+            snapshot.append(latest or GenerationStatusResponse(id=row.id, status=row.status))
+
+        # Release the connection now rather than holding it for the life of the stream
+        await db.close()
+    except BaseException:
+        generation_events.unsubscribe(user.id, queue)
+        raise
+
+    return StreamingResponse(
+        _event_stream(user.id, queue, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also unsubscribes a stream that ended before its first chunk
+        background=BackgroundTask(generation_events.unsubscribe, user.id, queue)
+    )
+
+@router.get("/stats", response_model=List[GenerationStatsResponse])
+async def get_generation_stats(
+    user: DbUser = Depends(get_db_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Usage totals per generation type and model, from the running aggregates"""
+    return await load_user_stats(db, user.id)
@@ -1,130 +1,233 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
+from sqlalchemy import func, select
+from typing import Dict, List, Optional, Tuple
+import json
 
+from app.config import settings
 from app.database import get_db
-from app.middleware.auth import get_current_user
+from app.middleware.auth import DbUser, get_db_user
 from app.models.generation import Generation
-from app.models.user import User
-from app.schemas.generation import ImageGenerationRequest, GenerationResponse
-from app.services.fal_service import FalService
+from app.schemas.generation import (
+    BatchGenerationResponse,
+    BatchImageGenerationRequest,
+    BatchItemResult,
+    GenerationResponse,
+    ImageGenerationRequest,
+    generation_response,
+    generation_serializer,
+)
+from app.services.fal_scheduler import fal_scheduler
+from app.services.fal_service import FalServiceError
+from app.services.generation_cache import (
+    cache_enabled,
+    find_cached_generation,
+    find_cached_generations,
+    generation_cache_key,
+    submit_once,
+)
+from app.services.generation_events import FINAL_STATUSES, generation_events
+from app.services.projects import owned_project_ids, require_owned_project
+from app.utils.etag import conditional_response, make_etag
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page, set_next_cursor
+from app.utils.serialization import json_response
 
 router = APIRouter()
 
+def _image_parameters(request: ImageGenerationRequest) -> Dict:
+    parameters = {
+        "width": request.width,
+        "height": request.height,
+        "num_images": request.num_images,
+        "guidance_scale": request.guidance_scale,
+        "num_inference_steps": request.num_inference_steps,
+    }
+    if request.seed is not None:
+        parameters["seed"] = request.seed
+    return parameters
+
+def _new_generation(user_id: int, request: ImageGenerationRequest, parameters: Dict, cache_key: str) -> Generation:
+    return Generation(
+        user_id=user_id,
+        project_id=request.project_id,
+        generation_type="image",
+        model_name=request.model,
+        prompt=request.prompt,
+        negative_prompt=request.negative_prompt,
+        parameters=json.dumps(parameters),
+        cache_key=cache_key
+    )
+
 @router.post("/generate", response_model=GenerationResponse)
 async def generate_image(
     request: ImageGenerationRequest,
-    background_tasks: BackgroundTasks,
-    current_user: dict = Depends(get_current_user),
+    user: DbUser = Depends(get_db_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Generate an image using AI"""
+    await require_owned_project(db, user.id, request.project_id)
+    parameters = _image_parameters(request)
+    cache_key = generation_cache_key(
+        "image", request.model, request.prompt, request.negative_prompt, parameters
+    )
+    
+    use_cache = cache_enabled(request.use_cache, request.seed)
+    
     try:
-        # Get user from database
-        result = await db.execute(
-            select(User).where(User.stack_user_id == current_user["id"])
-        )
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
-        
-        # Submit to Fal.ai
-        fal_result = await FalService.generate_image(
-            model=request.model,
-            prompt=request.prompt,
-            negative_prompt=request.negative_prompt,
-            width=request.width,
-            height=request.height,
-            num_images=request.num_images,
-            guidance_scale=request.guidance_scale,
-            num_inference_steps=request.num_inference_steps
-        )
+        generation = None
+        if use_cache:
+            generation = await find_cached_generation(db, user.id, request.project_id, cache_key)
         
-        # Create generation record
-        generation = Generation(
-            user_id=user.id,
-            project_id=request.project_id,
-            generation_type="image",
-            model_name=request.model,
-            prompt=request.prompt,
-            negative_prompt=request.negative_prompt,
-            fal_request_id=fal_result["request_id"],
-            status="processing"
-        )
-        
-        db.add(generation)
-        await db.commit()
-        await db.refresh(generation)
+        if generation is None:
+            new_generation = _new_generation(user.id, request, parameters, cache_key)
+            if use_cache:
+                # Identical submissions still on their way to fal share one job
+                generation_id = await submit_once(
+                    (user.id, request.project_id, cache_key),
+                    lambda: fal_scheduler.submit(user.id, user.is_premium, new_generation)
+                )
+            else:
+                generation_id = await fal_scheduler.submit(user.id, user.is_premium, new_generation)
+            generation = await db.get(Generation, generation_id)
         
-        # Add background task to check status
-        background_tasks.add_task(check_generation_status, generation.id, db)
+        return generation_response(generation, fal_scheduler.position(generation.id))
         
-        return GenerationResponse(
-            id=generation.id,
-            request_id=generation.fal_request_id,
-            status=generation.status,
-            generation_type=generation.generation_type,
-            model_name=generation.model_name,
-            prompt=generation.prompt,
-            created_at=generation.created_at
+    except HTTPException:
+        raise
+    except FalServiceError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=str(e)
         )
-        
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to generate image: {str(e)}"
         )
 
+@router.post("/generate/batch", response_model=BatchGenerationResponse)
+async def generate_image_batch(
+    request: BatchImageGenerationRequest,
+    user: DbUser = Depends(get_db_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Generate several images in one call, e.g. a prompt grid
+
+    Items are submitted to fal concurrently and stored with one insert. Each
+    succeeds or fails on its own: a failed item gets the status code and
+    error the single-item endpoint would have returned.
+    """
+    # Items are reused within their own project only, see find_cached_generation()
+    cache_keys = []
+    parameter_sets = []
+    for item in request.items:
+        parameters = _image_parameters(item)
+        parameter_sets.append(parameters)
+        cache_keys.append((item.project_id, generation_cache_key(
+            "image", item.model, item.prompt, item.negative_prompt, parameters
+        )))
+
+    cacheable = [key for item, key in zip(request.items, cache_keys) if cache_enabled(item.use_cache, item.seed)]
+    cached = await find_cached_generations(db, user.id, cacheable) if cacheable else {}
+    owned = await owned_project_ids(
+        db, user.id, (item.project_id for item in request.items if item.project_id is not None)
+    )
+
+    # Repeated items that may share a result share one new generation too
+    shared: Dict[Tuple[Optional[int], str], int] = {}
+    sources: List[int] = []  # item index -> index of the item whose generation it uses
+    new_generations: Dict[int, Generation] = {}
+    failures: Dict[int, BaseException] = {}
+    for index, (item, key) in enumerate(zip(request.items, cache_keys)):
+        sources.append(index)
+        if item.project_id is not None and item.project_id not in owned:
+            failures[index] = HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+            continue
+        use_cache = cache_enabled(item.use_cache, item.seed)
+        if use_cache and key in cached:
+            continue
+        if use_cache and key in shared:
+            sources[index] = shared[key]
+            continue
+        if use_cache:
+            shared[key] = index
+        new_generations[index] = _new_generation(user.id, item, parameter_sets[index], key[1])
+
+    errors = await fal_scheduler.submit_many(
+        user.id,
+        user.is_premium,
+        list(new_generations.values()),
+        settings.GENERATION_BATCH_CONCURRENCY
+    )
+    failures.update(zip(new_generations, errors))
+
+    results = []
+    for index, source in enumerate(sources):
+        error = failures.get(source)
+        if isinstance(error, HTTPException):
+            results.append(BatchItemResult(index=index, status_code=error.status_code, error=error.detail))
+        elif isinstance(error, FalServiceError):
+            results.append(BatchItemResult(index=index, status_code=status.HTTP_502_BAD_GATEWAY, error=str(error)))
+        elif error is not None:
+            results.append(BatchItemResult(
+                index=index,
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                error=f"Failed to generate image: {str(error)}"
+            ))
+        else:
+            generation = new_generations.get(source) or cached[cache_keys[source]]
+            results.append(BatchItemResult(
+                index=index,
+                status_code=status.HTTP_200_OK,
+                generation=generation_response(generation, fal_scheduler.position(generation.id))
+            ))
+
+    return BatchGenerationResponse(items=results)
+
 @router.get("/generations", response_model=List[GenerationResponse])
 async def get_user_generations(
-    current_user: dict = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    user: DbUser = Depends(get_db_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get user's image generations"""
-    result = await db.execute(
-        select(User).where(User.stack_user_id == current_user["id"])
-    )
-    user = result.scalar_one_or_none()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
+    """Get user's image generations, newest first
+
+    Pass the X-Next-Cursor response header back as ``before`` for the next page.
+    """
+    # Every insert and status change bumps updated_at, so its maximum is the
+    # list's version; a 304 costs one index lookup
     result = await db.execute(
-        select(Generation)
+        select(func.max(Generation.updated_at))
         .where(Generation.user_id == user.id)
         .where(Generation.generation_type == "image")
-        .order_by(Generation.created_at.desc())
     )
-    generations = result.scalars().all()
-    
-    return [
-        GenerationResponse(
-            id=gen.id,
-            request_id=gen.fal_request_id,
-            status=gen.status,
-            generation_type=gen.generation_type,
-            model_name=gen.model_name,
-            prompt=gen.prompt,
-            result_url=gen.result_url,
-            error_message=gen.error_message,
-            created_at=gen.created_at,
-            completed_at=gen.completed_at
+    etag = make_etag("image-generations", user.id, result.scalar())
+    not_modified = conditional_response(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    result = await db.execute(
+        keyset_page(
+            select(Generation)
+            .where(Generation.user_id == user.id)
+            .where(Generation.generation_type == "image"),
+            Generation.created_at,
+            Generation.id,
+            limit,
+            before
         )
-        for gen in generations
-    ]
+    )
+    generations = set_next_cursor(response, result.scalars().all(), limit, "created_at")
+    
+    return json_response(generation_serializer.dumps(generations), response)
 
 @router.get("/generations/{generation_id}/status")
 async def get_generation_status(
     generation_id: int,
-    current_user: dict = Depends(get_current_user),
+    user: DbUser = Depends(get_db_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Get status of a specific generation"""
@@ -140,37 +243,24 @@ async def get_generation_status(
         )
     
     # Check if user owns this generation
-    user_result = await db.execute(
-        select(User).where(User.stack_user_id == current_user["id"])
-    )
-    user = user_result.scalar_one_or_none()
-    
-    if not user or generation.user_id != user.id:
+    if generation.user_id != user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
     
-    # If still processing, check Fal.ai status
-    if generation.status == "processing":
-        try:
-            fal_status = await FalService.get_status(generation.fal_request_id)
-            if fal_status.get("status") == "completed":
-                fal_result = await FalService.get_result(generation.fal_request_id)
-                generation.result_url = fal_result.get("images", [{}])[0].get("url")
-                generation.status = "completed"
-                await db.commit()
-        except Exception:
-            pass
+    # The background poller keeps processing generations up to date
+    if generation.status in FINAL_STATUSES:
+        progress = 1.0
+    else:
+        latest = generation_events.latest(generation.id)
+        progress = latest.progress if latest else None
     
     return {
         "id": generation.id,
         "status": generation.status,
         "result_url": generation.result_url,
-        "error_message": generation.error_message
-    }
-
-async def check_generation_status(generation_id: int, db: AsyncSession):
-    """Background task to check generation status"""
-    # This would be implemented to periodically check status
-    pass
\ No newline at end of file
+        "asset_url": generation.asset_url,
+        "error_message": generation.error_message,
+        "progress": progress
+    }
\ No newline at end of file
@@ -1,13 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List, Optional
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import load_only
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel
+from datetime import datetime
+import json
+import logging
 
 from app.database import get_db
-from app.middleware.auth import get_current_user
+from app.middleware.auth import DbUser, get_db_user
 from app.models.project import Project
-from app.models.user import User
+from app.services.projects import record_patch_save
+from app.utils.etag import PRIVATE_CACHE_CONTROL, PUBLIC_CACHE_CONTROL, conditional_response, make_etag
+from app.utils.json_patch import JsonPatchConflict, JsonPatchError, apply_patch
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page, set_next_cursor
+from app.utils.serialization import RowSerializer, json_response
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -31,25 +41,88 @@ class ProjectResponse(BaseModel):
     data: Optional[dict]
     thumbnail_url: Optional[str]
     is_public: bool
+    version: int
+
+class ProjectPatchResponse(BaseModel):
+    id: int
+    version: int
+    updated_at: Optional[datetime]
+    bytes_saved: int  # full document size minus patch size
+
+class ProjectSummaryResponse(BaseModel):
+    id: int
+    name: str
+    project_type: str
+    thumbnail_url: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+    # Only present when asked for with ?fields=
+    description: Optional[str] = None
+    data: Optional[dict] = None
+    is_public: Optional[bool] = None
+
+project_serializer = RowSerializer(ProjectResponse)
+project_summary_serializer = RowSerializer(ProjectSummaryResponse)
+
+# Always sent by the listing; everything else is opt-in through ?fields=
+SUMMARY_COLUMNS = ("id", "name", "project_type", "thumbnail_url", "created_at", "updated_at")
+OPTIONAL_COLUMNS = ("description", "data", "is_public")
+
+def _parse_fields(fields: Optional[str]) -> List[str]:
+    requested = [name.strip() for name in (fields or "").split(",") if name.strip()]
+    unknown = [name for name in requested if name not in OPTIONAL_COLUMNS + SUMMARY_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return [name for name in OPTIONAL_COLUMNS if name in requested]
+
+def _expected_version(if_match: Optional[str]) -> Optional[int]:
+    """Project version carried by If-Match, e.g. "3" or W/"3" (weak)"""
+    if if_match is None:
+        return None
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    if not tag.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="If-Match must carry the project version"
+        )
+    return int(tag)
+
+def _check_read_access(project, user: DbUser) -> None:
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found"
+        )
+    
+    # Check if user owns the project or if it's public
+    if project.user_id != user.id and not project.is_public:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+def _cache_control(is_public: bool) -> str:
+    return PUBLIC_CACHE_CONTROL if is_public else PRIVATE_CACHE_CONTROL
+
+def _version_conflict(current: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f"Project was modified, current version is {current}"
+    )
 
 @router.post("/", response_model=ProjectResponse)
 async def create_project(
     project: ProjectCreate,
-    current_user: dict = Depends(get_current_user),
+    user: DbUser = Depends(get_db_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Create a new project"""
-    result = await db.execute(
-        select(User).where(User.stack_user_id == current_user["id"])
-    )
-    user = result.scalar_one_or_none()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
     db_project = Project(
         user_id=user.id,
         name=project.name,
@@ -69,57 +142,111 @@ async def create_project(
         project_type=db_project.project_type,
         data=db_project.data,
         thumbnail_url=db_project.thumbnail_url,
-        is_public=db_project.is_public
+        is_public=db_project.is_public,
+        version=db_project.version
     )
 
-@router.get("/", response_model=List[ProjectResponse])
+@router.get("/", response_model=List[ProjectSummaryResponse], response_model_exclude_unset=True)
 async def get_user_projects(
-    current_user: dict = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated extras: description, data, is_public"),
+    user: DbUser = Depends(get_db_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get user's projects"""
+    """Get summaries of user's projects, most recently updated first
+
+    The full project document is only read when ``fields`` asks for it. Pass
+    the X-Next-Cursor response header back as ``before`` for the next page.
+    """
+    extra = _parse_fields(fields)
+
+    # Saves bump a version, creates and deletes change the count
     result = await db.execute(
-        select(User).where(User.stack_user_id == current_user["id"])
+        select(func.count(), func.sum(Project.version), func.max(Project.updated_at))
+        .where(Project.user_id == user.id)
     )
-    user = result.scalar_one_or_none()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
+    etag = make_etag("projects", user.id, *result.one())
+    not_modified = conditional_response(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    columns = [getattr(Project, name) for name in SUMMARY_COLUMNS + tuple(extra)]
+    result = await db.execute(
+        keyset_page(
+            select(Project)
+            .where(Project.user_id == user.id)
+            # raiseload turns an accidental read of an unselected column into an error
+            .options(load_only(*columns, raiseload=True)),
+            Project.updated_at,
+            Project.id,
+            limit,
+            before,
+            # Projects created before updated_at had a default have none
+            nullable=True
         )
+    )
+    projects = set_next_cursor(response, result.scalars().all(), limit, "updated_at")
     
-    result = await db.execute(
-        select(Project)
-        .where(Project.user_id == user.id)
-        .order_by(Project.updated_at.desc())
+    return json_response(
+        project_summary_serializer.dumps(projects, only=SUMMARY_COLUMNS + tuple(extra)),
+        response
     )
-    projects = result.scalars().all()
-    
-    return [
-        ProjectResponse(
-            id=project.id,
-            name=project.name,
-            description=project.description,
-            project_type=project.project_type,
-            data=project.data,
-            thumbnail_url=project.thumbnail_url,
-            is_public=project.is_public
-        )
-        for project in projects
-    ]
 
 @router.get("/{project_id}", response_model=ProjectResponse)
 async def get_project(
     project_id: int,
-    current_user: dict = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    user: DbUser = Depends(get_db_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get a specific project"""
+    """Get a specific project
+
+    The ETag is the project version, so it can be sent back as If-Match on
+    PUT and PATCH. Public projects may be kept by shared caches.
+    """
+    if request.headers.get("if-none-match"):
+        # Revalidation only needs the version, not the document
+        result = await db.execute(
+            select(Project.user_id, Project.is_public, Project.version).where(Project.id == project_id)
+        )
+        project = result.first()
+        _check_read_access(project, user)
+        not_modified = conditional_response(
+            request, response, f'"{project.version}"', _cache_control(project.is_public)
+        )
+        if not_modified:
+            return not_modified
+
     result = await db.execute(
         select(Project).where(Project.id == project_id)
     )
     project = result.scalar_one_or_none()
+    _check_read_access(project, user)
+    response.headers["ETag"] = f'"{project.version}"'
+    response.headers["Cache-Control"] = _cache_control(project.is_public)
+    
+    return json_response(project_serializer.dumps_one(project), response)
+
+@router.put("/{project_id}", response_model=ProjectResponse)
+async def update_project(
+    project_id: int,
+    project_update: ProjectUpdate,
+    if_match: Optional[str] = Header(None),
+    user: DbUser = Depends(get_db_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Update a project
+
+    With If-Match, the save only applies to that version, as with PATCH.
+    """
+    result = await db.execute(
+        select(Project.user_id).where(Project.id == project_id)
+    )
+    project = result.first()
     
     if not project:
         raise HTTPException(
@@ -127,40 +254,70 @@ async def get_project(
             detail="Project not found"
         )
     
-    # Check if user owns the project or if it's public
-    user_result = await db.execute(
-        select(User).where(User.stack_user_id == current_user["id"])
-    )
-    user = user_result.scalar_one_or_none()
-    
-    if not user or (project.user_id != user.id and not project.is_public):
+    # Check if user owns the project
+    if project.user_id != user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
     
+    expected_version = _expected_version(if_match)
+    
+    # Update fields
+    stmt = update(Project).where(Project.id == project_id)
+    if expected_version is not None:
+        # Checked in the UPDATE itself, so a save that lands after the read
+        # above can't be overwritten
+        stmt = stmt.where(Project.version == expected_version)
+    result = await db.execute(
+        stmt.values(
+            **project_update.model_dump(exclude_none=True),
+            version=Project.version + 1
+        )
+        .returning(Project)
+    )
+    saved = result.scalar_one_or_none()
+    if saved is None:
+        await db.rollback()
+        result = await db.execute(select(Project.version).where(Project.id == project_id))
+        current = result.scalar_one_or_none()
+        if current is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Project not found"
+            )
+        raise _version_conflict(current)
+    await db.commit()
+    
     return ProjectResponse(
-        id=project.id,
-        name=project.name,
-        description=project.description,
-        project_type=project.project_type,
-        data=project.data,
-        thumbnail_url=project.thumbnail_url,
-        is_public=project.is_public
+        id=saved.id,
+        name=saved.name,
+        description=saved.description,
+        project_type=saved.project_type,
+        data=saved.data,
+        thumbnail_url=saved.thumbnail_url,
+        is_public=saved.is_public,
+        version=saved.version
     )
 
-@router.put("/{project_id}", response_model=ProjectResponse)
-async def update_project(
+@router.patch("/{project_id}", response_model=ProjectPatchResponse)
+async def patch_project(
     project_id: int,
-    project_update: ProjectUpdate,
-    current_user: dict = Depends(get_current_user),
+    request: Request,
+    operations: List[Dict[str, Any]] = Body(..., media_type="application/json-patch+json"),
+    if_match: Optional[str] = Header(None),
+    user: DbUser = Depends(get_db_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Update a project"""
+    """Apply an RFC 6902 JSON Patch to a project's data
+
+    Send If-Match with the version the patch was made against; a stale
+    version or a failed ``test`` operation is answered with 409.
+    """
     result = await db.execute(
-        select(Project).where(Project.id == project_id)
+        select(Project.user_id, Project.data, Project.version).where(Project.id == project_id)
     )
-    project = result.scalar_one_or_none()
+    project = result.first()
     
     if not project:
         raise HTTPException(
@@ -168,45 +325,54 @@ async def update_project(
             detail="Project not found"
         )
     
-    # Check if user owns the project
-    user_result = await db.execute(
-        select(User).where(User.stack_user_id == current_user["id"])
-    )
-    user = user_result.scalar_one_or_none()
-    
-    if not user or project.user_id != user.id:
+    if project.user_id != user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
     
-    # Update fields
-    if project_update.name is not None:
-        project.name = project_update.name
-    if project_update.description is not None:
-        project.description = project_update.description
-    if project_update.data is not None:
-        project.data = project_update.data
-    if project_update.is_public is not None:
-        project.is_public = project_update.is_public
+    expected_version = _expected_version(if_match)
+    if expected_version is not None and expected_version != project.version:
+        raise _version_conflict(project.version)
+    
+    try:
+        data = apply_patch(project.data or {}, operations)
+    except JsonPatchConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except JsonPatchError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
     
+    # The version guard catches a save that landed since the read above
+    result = await db.execute(
+        update(Project)
+        .where(Project.id == project_id)
+        .where(Project.version == project.version)
+        .values(data=data, version=Project.version + 1)
+        .returning(Project.version, Project.updated_at)
+    )
+    saved = result.first()
+    if saved is None:
+        await db.rollback()
+        result = await db.execute(select(Project.version).where(Project.id == project_id))
+        raise _version_conflict(result.scalar_one())
     await db.commit()
-    await db.refresh(project)
     
-    return ProjectResponse(
-        id=project.id,
-        name=project.name,
-        description=project.description,
-        project_type=project.project_type,
-        data=project.data,
-        thumbnail_url=project.thumbnail_url,
-        is_public=project.is_public
+    patch_bytes = len(await request.body())
+    document_bytes = len(json.dumps(data, separators=(",", ":")).encode())
+    record_patch_save(patch_bytes, document_bytes)
+    logger.debug("Patched project %s: %d byte patch instead of %d byte document", project_id, patch_bytes, document_bytes)
+    
+    return ProjectPatchResponse(
+        id=project_id,
+        version=saved.version,
+        updated_at=saved.updated_at,
+        bytes_saved=document_bytes - patch_bytes
     )
 
 @router.delete("/{project_id}")
 async def delete_project(
     project_id: int,
-    current_user: dict = Depends(get_current_user),
+    user: DbUser = Depends(get_db_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Delete a project"""
@@ -222,12 +388,7 @@ async def delete_project(
         )
     
     # Check if user owns the project
-    user_result = await db.execute(
-        select(User).where(User.stack_user_id == current_user["id"])
-    )
-    user = user_result.scalar_one_or_none()
-    
-    if not user or project.user_id != user.id:
+    if project.user_id != user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
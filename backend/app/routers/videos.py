@@ -1,73 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
+from sqlalchemy import func, select
+from typing import List, Optional
+import json
 
 from app.database import get_db
-from app.middleware.auth import get_current_user
+from app.middleware.auth import DbUser, get_db_user
 from app.models.generation import Generation
-from app.models.user import User
-from app.schemas.generation import VideoGenerationRequest, GenerationResponse
-from app.services.fal_service import FalService
+from app.schemas.generation import VideoGenerationRequest, GenerationResponse, generation_response, generation_serializer
+from app.services.fal_scheduler import fal_scheduler
+from app.services.fal_service import FalServiceError
+from app.services.generation_cache import (
+    cache_enabled,
+    find_cached_generation,
+    generation_cache_key,
+    submit_once,
+)
+from app.services.projects import require_owned_project
+from app.utils.etag import conditional_response, make_etag
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, keyset_page, set_next_cursor
+from app.utils.serialization import json_response
 
 router = APIRouter()
 
 @router.post("/generate", response_model=GenerationResponse)
 async def generate_video(
     request: VideoGenerationRequest,
-    background_tasks: BackgroundTasks,
-    current_user: dict = Depends(get_current_user),
+    user: DbUser = Depends(get_db_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Generate a video using AI"""
+    await require_owned_project(db, user.id, request.project_id)
+    parameters = {
+        "duration": request.duration,
+        "fps": request.fps,
+        "width": request.width,
+        "height": request.height,
+    }
+    if request.seed is not None:
+        parameters["seed"] = request.seed
+    cache_key = generation_cache_key("video", request.model, request.prompt, None, parameters)
+    use_cache = cache_enabled(request.use_cache, request.seed)
+    
     try:
-        # Get user from database
-        result = await db.execute(
-            select(User).where(User.stack_user_id == current_user["id"])
-        )
-        user = result.scalar_one_or_none()
+        generation = None
+        if use_cache:
+            generation = await find_cached_generation(db, user.id, request.project_id, cache_key)
         
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
+        if generation is None:
+            new_generation = Generation(
+                user_id=user.id,
+                project_id=request.project_id,
+                generation_type="video",
+                model_name=request.model,
+                prompt=request.prompt,
+                parameters=json.dumps(parameters),
+                cache_key=cache_key
             )
+            if use_cache:
+                # Identical submissions still on their way to fal share one job
+                generation_id = await submit_once(
+                    (user.id, request.project_id, cache_key),
+                    lambda: fal_scheduler.submit(user.id, user.is_premium, new_generation)
+                )
+            else:
+                generation_id = await fal_scheduler.submit(user.id, user.is_premium, new_generation)
+            generation = await db.get(Generation, generation_id)
         
-        # Submit to Fal.ai
-        fal_result = await FalService.generate_video(
-            model=request.model,
-            prompt=request.prompt,
-            duration=request.duration,
-            fps=request.fps,
-            width=request.width,
-            height=request.height
-        )
-        
-        # Create generation record
-        generation = Generation(
-            user_id=user.id,
-            project_id=request.project_id,
-            generation_type="video",
-            model_name=request.model,
-            prompt=request.prompt,
-            fal_request_id=fal_result["request_id"],
-            status="processing"
-        )
-        
-        db.add(generation)
-        await db.commit()
-        await db.refresh(generation)
+        return generation_response(generation, fal_scheduler.position(generation.id))
         
-        return GenerationResponse(
-            id=generation.id,
-            request_id=generation.fal_request_id,
-            status=generation.status,
-            generation_type=generation.generation_type,
-            model_name=generation.model_name,
-            prompt=generation.prompt,
-            created_at=generation.created_at
+    except HTTPException:
+        raise
+    except FalServiceError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=str(e)
         )
-        
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -76,41 +84,40 @@ async def generate_video(
 
 @router.get("/generations", response_model=List[GenerationResponse])
 async def get_user_video_generations(
-    current_user: dict = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    user: DbUser = Depends(get_db_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get user's video generations"""
-    result = await db.execute(
-        select(User).where(User.stack_user_id == current_user["id"])
-    )
-    user = result.scalar_one_or_none()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
+    """Get user's video generations, newest first
+
+    Pass the X-Next-Cursor response header back as ``before`` for the next page.
+    """
+    # Every insert and status change bumps updated_at, so its maximum is the
+    # list's version; a 304 costs one index lookup
     result = await db.execute(
-        select(Generation)
+        select(func.max(Generation.updated_at))
         .where(Generation.user_id == user.id)
         .where(Generation.generation_type == "video")
-        .order_by(Generation.created_at.desc())
     )
-    generations = result.scalars().all()
-    
-    return [
-        GenerationResponse(
-            id=gen.id,
-            request_id=gen.fal_request_id,
-            status=gen.status,
-            generation_type=gen.generation_type,
-            model_name=gen.model_name,
-            prompt=gen.prompt,
-            result_url=gen.result_url,
-            error_message=gen.error_message,
-            created_at=gen.created_at,
-            completed_at=gen.completed_at
+    etag = make_etag("video-generations", user.id, result.scalar())
+    not_modified = conditional_response(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    result = await db.execute(
+        keyset_page(
+            select(Generation)
+            .where(Generation.user_id == user.id)
+            .where(Generation.generation_type == "video"),
+            Generation.created_at,
+            Generation.id,
+            limit,
+            before
         )
-        for gen in generations
-    ]
\ No newline at end of file
+    )
+    generations = set_next_cursor(response, result.scalars().all(), limit, "created_at")
+    
+    return json_response(generation_serializer.dumps(generations), response)
\ No newline at end of file
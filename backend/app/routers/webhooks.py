@@ -0,0 +1,118 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+
+from app.database import get_db
+from app.metrics import observe_generation_outcome
+from app.models.generation import Generation
+from app.services.fal_service import FalService
+from app.services.generation_events import generation_events
+from app.services.generation_poller import finalize_values, generation_poller
+from app.services.usage_stats import record_generation_outcome
+
+router = APIRouter()
+
+class FalWebhookPayload(BaseModel):
+    request_id: str
+    gateway_request_id: Optional[str] = None
+    status: str  # 'OK' or 'ERROR'
+    payload: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+@router.post("/fal")
+async def fal_webhook(
+    body: FalWebhookPayload,
+    generation_id: int,
+    signature: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """Finalize a generation from a fal completion callback
+
+    The callback URL is signed for one generation, and the payload must be
+    for that generation's fal request.
+    """
+    if not FalService.verify_webhook_signature(generation_id, signature):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid webhook signature"
+        )
+
+    result = await db.execute(
+        select(
+            Generation.id,
+            Generation.user_id,
+            Generation.generation_type,
+            Generation.model_name,
+            Generation.fal_request_id,
+            Generation.created_at
+        )
+        .where(Generation.id == generation_id)
+        .where(Generation.status == "processing")
+    )
+    generation = result.first()
+
+    # Unknown or already finalized: acknowledge so fal stops retrying
+    if not generation:
+        return {"message": "Ignored"}
+
+    if generation.fal_request_id is None:
+        # fal finished before the submit stored its request id; fal retries
+        # the callback, and the poller is there if it gives up
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Generation is still being submitted"
+        )
+
+    if generation.fal_request_id != body.request_id:
+        return {"message": "Ignored"}
+
+    if body.status == "OK":
+        result_url = FalService.extract_result_url(body.payload or {})
+        if result_url:
+            values = finalize_values(
+                generation.created_at, result_url=result_url, model_name=generation.model_name
+            )
+        else:
+            values = finalize_values(
+                generation.created_at,
+                error_message="Result contained no output",
+                model_name=generation.model_name
+            )
+    else:
+        detail = (body.payload or {}).get("detail")
+        values = finalize_values(
+            generation.created_at,
+            error_message=str(detail or body.error or "Generation failed"),
+            model_name=generation.model_name
+        )
+
+    result = await db.execute(
+        update(Generation)
+        .where(Generation.id == generation.id)
+        .where(Generation.status == "processing")
+        .values(**values)
+    )
+    if result.rowcount:
+        await record_generation_outcome(
+            db, generation.user_id, generation.generation_type, generation.model_name, values
+        )
+    await db.commit()
+    generation_poller.forget(generation.id)
+
+    # Lost a race with the poller, which has already published the result
+    if not result.rowcount:
+        return {"message": "Ignored"}
+
+    observe_generation_outcome(generation.generation_type, generation.model_name, values)
+    generation_events.publish(
+        generation.user_id,
+        generation.id,
+        values["status"],
+        result_url=values["result_url"],
+        error_message=values["error_message"],
+        progress=1.0
+    )
+
+    return {"message": "Generation updated"}
@@ -1,7 +1,10 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
+from app.config import settings
+from app.utils.serialization import RowSerializer
+
 class ImageGenerationRequest(BaseModel):
     prompt: str = Field(..., min_length=1, max_length=2000)
     negative_prompt: Optional[str] = Field(None, max_length=1000)
@@ -11,7 +14,12 @@ class ImageGenerationRequest(BaseModel):
     num_images: int = Field(default=1, ge=1, le=4)
     guidance_scale: float = Field(default=7.5, ge=1.0, le=20.0)
     num_inference_steps: int = Field(default=50, ge=10, le=100)
+    seed: Optional[int] = None
     project_id: Optional[int] = None
+    use_cache: bool = True  # with a seed, reuse an identical recent or in-flight generation
+
+class BatchImageGenerationRequest(BaseModel):
+    items: List[ImageGenerationRequest] = Field(..., min_length=1, max_length=settings.GENERATION_BATCH_MAX_ITEMS)
 
 class VideoGenerationRequest(BaseModel):
     prompt: str = Field(..., min_length=1, max_length=2000)
@@ -20,23 +28,73 @@ class VideoGenerationRequest(BaseModel):
     fps: int = Field(default=24, ge=12, le=30)
     width: int = Field(default=1024, ge=256, le=1920)
     height: int = Field(default=576, ge=256, le=1080)
+    seed: Optional[int] = None
     project_id: Optional[int] = None
+    use_cache: bool = True  # with a seed, reuse an identical recent or in-flight generation
 
 class GenerationResponse(BaseModel):
     id: int
-    request_id: str
+    request_id: Optional[str] = None  # assigned once submitted to fal
     status: str
     generation_type: str
     model_name: str
     prompt: str
     result_url: Optional[str] = None
+    asset_url: Optional[str] = None  # the same output, served from this API's mirror
+    thumbnail_url: Optional[str] = None
     error_message: Optional[str] = None
     created_at: datetime
     completed_at: Optional[datetime] = None
+    queue_position: Optional[int] = None  # set while waiting for a fal slot
+
+class BatchItemResult(BaseModel):
+    index: int  # position in the request's items
+    status_code: int  # what the single-item endpoint would have answered
+    generation: Optional[GenerationResponse] = None
+    error: Optional[str] = None
+
+class BatchGenerationResponse(BaseModel):
+    items: List[BatchItemResult]
+
+# Fast path for lists of Generation rows
+generation_serializer = RowSerializer(GenerationResponse, request_id="fal_request_id")
+
+def generation_response(generation, queue_position: Optional[int] = None) -> GenerationResponse:
+    """Response for one Generation row; the position comes from the fal scheduler"""
+    return GenerationResponse(
+        id=generation.id,
+        request_id=generation.fal_request_id,
+        status=generation.status,
+        generation_type=generation.generation_type,
+        model_name=generation.model_name,
+        prompt=generation.prompt,
+        result_url=generation.result_url,
+        asset_url=generation.asset_url,
+        thumbnail_url=generation.thumbnail_url,
+        error_message=generation.error_message,
+        created_at=generation.created_at,
+        completed_at=generation.completed_at,
+        queue_position=queue_position
+    )
 
 class GenerationStatusResponse(BaseModel):
     id: int
     status: str
     result_url: Optional[str] = None
     error_message: Optional[str] = None
-    progress: Optional[float] = None
\ No newline at end of file
+    progress: Optional[float] = None
+
+class GenerationStatsResponse(BaseModel):
+    generation_type: str
+    model_name: str
+    total_count: int
+    completed_count: int
+    failed_count: int
+    failure_rate: float
+    total_cost: float
+    processing_time_total: float  # seconds
+    processing_time_avg: Optional[float] = None
+    processing_time_p50: Optional[float] = None  # within 2%, from a log-bucket sketch
+    processing_time_p90: Optional[float] = None
+    processing_time_p99: Optional[float] = None
+    last_finished_at: Optional[datetime] = None
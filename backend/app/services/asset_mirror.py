@@ -0,0 +1,237 @@
+from sqlalchemy import select, update
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+
+from app.config import settings
+from app.database import AsyncSessionLocal, dialect_insert
+from app.models.asset import Asset
+from app.models.generation import Generation
+from app.models.project import Project
+from app.services.generation_events import generation_events
+
+# Imported on first use, see app.middleware.auth
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+_DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+class AssetTooLarge(Exception):
+    """The remote file is bigger than ASSET_MAX_BYTES"""
+
+class AssetHostNotAllowed(Exception):
+    """The URL, or one it redirected to, is not on an allowed host"""
+
+class AssetMirror:
+    """Copies completed generation outputs into a local content-addressed store
+
+    Finished generations are queued from the event bus and copied by a few
+    worker tasks, so no request ever waits on a download. Each file is
+    hashed while it streams to a temporary file and then renamed to
+    ``<store>/<sha[:2]>/<sha>``; identical outputs end up as one blob.
+
+    Result URLs come from fal's callbacks and responses, so only hosts in
+    ``allowed_hosts`` (and their subdomains) are fetched, redirects included.
+    """
+
+    def __init__(
+        self,
+        store_dir: str,
+        concurrency: int,
+        queue_size: int,
+        backfill_limit: int,
+        max_bytes: int,
+        timeout: float,
+        allowed_hosts: Iterable[str]
+    ):
+        self.store_dir = os.path.abspath(store_dir)
+        self.concurrency = concurrency
+        self.backfill_limit = backfill_limit
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.allowed_hosts = tuple(host.lower().strip(".") for host in allowed_hosts)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._workers: List[asyncio.Task] = []
+        self._client: Optional["httpx.AsyncClient"] = None
+        generation_events.on_final(self._enqueue)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.store_dir, sha256[:2], sha256)
+
+    def url_allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        if parts.scheme not in ("https", "http") or not host:
+            return False
+        return any(host == allowed or host.endswith("." + allowed) for allowed in self.allowed_hosts)
+
+    async def start(self) -> None:
+        """Start the workers and queue completed generations not yet mirrored"""
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        # Off the startup path, like the rest of the warm-up
+        self._workers.append(asyncio.create_task(self._backfill()))
+
+    async def _backfill(self) -> None:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Generation.id)
+                .where(Generation.status == "completed")
+                .where(Generation.result_url.is_not(None))
+                .where(Generation.asset_sha256.is_(None))
+                .order_by(Generation.id.desc())
+                .limit(self.backfill_limit)
+            )
+            for generation_id in result.scalars().all():
+                self._enqueue(None, generation_id)
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _enqueue(self, user_id: Optional[int], generation_id: int) -> None:
+        if not self._workers:
+            return
+        if self._queue.full():
+            # Left for the next startup's backfill
+            logger.warning("Asset mirror queue full, skipping generation %s", generation_id)
+            return
+        self._queue.put_nowait(generation_id)
+
+    async def _run(self) -> None:
+        while True:
+            generation_id = await self._queue.get()
+            try:
+                await self.mirror(generation_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Failed to mirror generation %s", generation_id, exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def mirror(self, generation_id: int) -> Optional[str]:
+        """Copy one generation's output locally and return its SHA-256"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(
+                    Generation.status,
+                    Generation.user_id,
+                    Generation.project_id,
+                    Generation.result_url,
+                    Generation.asset_sha256
+                )
+                .where(Generation.id == generation_id)
+            )
+            generation = result.first()
+        if generation is None or generation.status != "completed" or generation.asset_sha256:
+            return None
+        if not (generation.result_url or "").startswith(("https://", "http://")):
+            return None
+        if not self.url_allowed(generation.result_url):
+            logger.warning("Not mirroring generation %s from a host that isn't allowed", generation_id)
+            return None
+
+        sha256, size, content_type = await self._download(generation.result_url)
+
+        async with AsyncSessionLocal() as db:
+            stmt = dialect_insert(db)(Asset).values(sha256=sha256, content_type=content_type, size=size)
+            await db.execute(stmt.on_conflict_do_nothing(index_elements=["sha256"]))
+            result = await db.execute(
+                update(Generation)
+                .where(Generation.id == generation_id)
+                .where(Generation.asset_sha256.is_(None))
+                .values(asset_sha256=sha256)
+            )
+            if result.rowcount and generation.project_id is not None:
+                # A project's thumbnail follows its latest finished generation.
+                # The version is the project's ETag, so it changes too.
+                await db.execute(
+                    update(Project)
+                    .where(Project.id == generation.project_id)
+                    .where(Project.user_id == generation.user_id)
+                    .values(
+                        thumbnail_url=f"/api/assets/{sha256}/thumbnail",
+                        version=Project.version + 1
+                    )
+                )
+            await db.commit()
+        return sha256
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            import httpx
+
+            # Not the fal client: CDN downloads must not carry the fal key
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                # Request hooks run for every redirect hop too
+                event_hooks={"request": [self._check_host]}
+            )
+        return self._client
+
+    async def _check_host(self, request: "httpx.Request") -> None:
+        if not self.url_allowed(str(request.url)):
+            raise AssetHostNotAllowed(request.url.host)
+
+    async def _download(self, url: str) -> Tuple[str, int, str]:
+        tmp_dir = os.path.join(self.store_dir, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async with self._get_client().stream("GET", url) as response:
+                    response.raise_for_status()
+                    content_type = response.headers.get("content-type", "application/octet-stream")
+                    async for chunk in response.aiter_bytes(_DOWNLOAD_CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise AssetTooLarge(url)
+                        await asyncio.to_thread(_hash_and_write, f, digest, chunk)
+
+            sha256 = digest.hexdigest()
+            path = self.blob_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.unlink(tmp_path)
+            else:
+                # Atomic: readers never see a partial blob
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return sha256, size, content_type.split(";")[0].strip()
+
+def _hash_and_write(f, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    f.write(chunk)
+
+asset_mirror = AssetMirror(
+    store_dir=settings.ASSET_STORE_DIR,
+    concurrency=settings.ASSET_MIRROR_CONCURRENCY,
+    queue_size=settings.ASSET_MIRROR_QUEUE_SIZE,
+    backfill_limit=settings.ASSET_MIRROR_BACKFILL_LIMIT,
+    max_bytes=settings.ASSET_MAX_BYTES,
+    timeout=settings.ASSET_MIRROR_TIMEOUT_SECONDS,
+    allowed_hosts=settings.ASSET_MIRROR_ALLOWED_HOSTS
+)
@@ -0,0 +1,112 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException, status
+from functools import partial
+from typing import Optional
+import asyncio
+import bisect
+import multiprocessing
+import os
+
+from app.config import settings
+from app.utils import imaging
+from app.utils.cache import SingleFlight
+
+# kind -> file extension; which kinds a source supports depends on its media type
+DERIVATIVE_KINDS = {"thumbnail": "webp", "preview": "mp4"}
+
+class DerivativeUnsupported(Exception):
+    """The source's media type has no derivative of this kind"""
+
+class DerivativeRenderer:
+    """Lazily renders thumbnails, poster frames and previews of stored assets
+
+    Rendering is CPU-bound, so it runs in a process pool and the event loop
+    only waits on a future. Results are cached on disk under the source's
+    SHA-256, kind and size, so each is rendered once. Concurrent requests
+    for the same derivative share one render, and past ``max_pending``
+    distinct renders new ones are refused rather than queued without bound.
+    """
+
+    def __init__(self, store_dir: str, workers: Optional[int], max_pending: int):
+        self.store_dir = os.path.abspath(store_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._renders = SingleFlight()
+
+    @staticmethod
+    def snap_size(size: Optional[int]) -> int:
+        """Round a requested size up to a configured one, so the cache stays bounded"""
+        sizes = sorted(settings.DERIVATIVE_SIZES)
+        if size is None:
+            size = settings.DERIVATIVE_DEFAULT_SIZE
+        return sizes[min(bisect.bisect_left(sizes, size), len(sizes) - 1)]
+
+    def path(self, sha256: str, kind: str, size: int) -> str:
+        return os.path.join(self.store_dir, sha256[:2], sha256, f"{kind}-{size}.{DERIVATIVE_KINDS[kind]}")
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, not fork: a forked copy of a running event loop and its
+            # open connections is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def get(self, sha256: str, source: str, content_type: str, kind: str, size: int) -> str:
+        """Path of the derivative, rendering it first if needed"""
+        render = self._render_function(content_type, kind, size)
+        dst = self.path(sha256, kind, size)
+        if os.path.exists(dst):
+            return dst
+
+        key = (sha256, kind, size)
+        if len(self._renders) >= self.max_pending and key not in self._renders:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many thumbnails being rendered, try again shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        async def run() -> str:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self._get_pool(), partial(render, source, dst))
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); start a fresh pool next time
+                self.close()
+                raise
+
+        return await self._renders.do(key, run)
+
+    @staticmethod
+    def _render_function(content_type: str, kind: str, size: int):
+        quality = settings.DERIVATIVE_WEBP_QUALITY
+        timeout = settings.DERIVATIVE_TIMEOUT_SECONDS
+        if content_type.startswith("image/") and kind == "thumbnail":
+            return partial(imaging.render_image_thumbnail, size=size, quality=quality)
+        if content_type.startswith("video/") and kind == "thumbnail":
+            return partial(
+                imaging.render_video_poster,
+                size=size, quality=quality, ffmpeg=settings.FFMPEG_BINARY, timeout=timeout
+            )
+        if content_type.startswith("video/") and kind == "preview":
+            return partial(
+                imaging.render_video_preview,
+                size=size, ffmpeg=settings.FFMPEG_BINARY, timeout=timeout
+            )
+        raise DerivativeUnsupported(f"No {kind} for {content_type}")
+
+derivative_renderer = DerivativeRenderer(
+    store_dir=settings.DERIVATIVE_STORE_DIR,
+    workers=settings.DERIVATIVE_WORKERS,
+    max_pending=settings.DERIVATIVE_MAX_PENDING
+)
@@ -0,0 +1,474 @@
+from collections import deque
+from fastapi import HTTPException, status
+from sqlalchemy import delete, insert, select, update
+from typing import Deque, Dict, Iterator, List, Optional, Set
+import asyncio
+import json
+import logging
+import math
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.metrics import observe_generation_outcome
+from app.models.generation import Generation
+from app.models.user import User
+from app.services.fal_service import FalService
+from app.services.generation_events import generation_events
+from app.services.generation_poller import finalize_values, generation_poller
+from app.services.outbound import DependencyUnavailable, fal_dependency
+from app.services.usage_stats import record_generation_outcome
+
+logger = logging.getLogger(__name__)
+
+# Columns a submit fills in; the rest take their defaults
+_INSERT_COLUMNS = (
+    "user_id", "project_id", "generation_type", "model_name", "prompt",
+    "negative_prompt", "parameters", "cache_key", "status",
+)
+
+class FalScheduler:
+    """Admission control in front of fal: a global cap on running jobs and
+    weighted fair-share queues per user
+
+    Users are served in start-time fair queuing order: each user's queue has
+    a virtual clock that advances by 1/weight per dispatched job, and the
+    queue with the lowest clock goes next. Premium users have a larger
+    weight, so they get proportionally more of the freed slots. State is per
+    process, so with several workers the cap applies to each one.
+
+    A slot belongs to the generation that took it, and only this process's
+    own generations give slots back. Those finished by another worker's
+    poller or webhook are found by a periodic check of the database.
+    Queued generations are claimed with a status-guarded update before they
+    are sent, so two workers that queued the same row can't both submit it.
+    """
+
+    def __init__(
+        self,
+        max_active: int,
+        max_queue_depth: int,
+        max_queued_per_user: int,
+        premium_weight: float,
+        retry_after: int,
+        reconcile_interval: float
+    ):
+        self.max_active = max_active
+        self.max_queue_depth = max_queue_depth
+        self.max_queued_per_user = max_queued_per_user
+        self.premium_weight = premium_weight
+        self.retry_after = retry_after
+        self.reconcile_interval = reconcile_interval
+        self.active = 0
+        # Generations holding one of this process's slots
+        self._slots: Set[int] = set()
+        self._queues: Dict[int, Deque[int]] = {}
+        self._weights: Dict[int, float] = {}
+        self._clocks: Dict[int, float] = {}
+        self._virtual_time = 0.0
+        self._queued = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._dispatches: Set[asyncio.Task] = set()
+        generation_events.on_final(self._release)
+
+    async def start(self) -> None:
+        """Queue the pending generations found in the database
+
+        Running jobs don't count against this process's slots: it didn't
+        submit them, and with several workers most came from elsewhere. Every
+        worker queues every pending row; the claim in _dispatch() lets only
+        one of them submit it.
+        """
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Generation.id, Generation.user_id, User.is_premium)
+                .join(User, User.id == Generation.user_id)
+                .where(Generation.status == "pending")
+                .order_by(Generation.id)
+            )
+            for row in result.all():
+                self._push(row.user_id, bool(row.is_premium), row.id)
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, user_id: int, is_premium: bool, generation: Generation) -> int:
+        """Send a new generation to fal now, or queue it until a slot frees up
+
+        The row is stored before fal sees the job, so the job's callback can
+        name it and a failed submit leaves a failed row rather than a fal job
+        nobody tracks. Uses its own session, since identical submissions may
+        share the call.
+        """
+        if not self.try_acquire():
+            self.check_capacity(user_id)
+            generation.status = "pending"
+            await self._store([generation])
+            self.enqueue(user_id, is_premium, generation.id)
+            return generation.id
+
+        generation.status = "processing"
+        try:
+            await self._store([generation])
+        except Exception:
+            self.release_unused()
+            raise
+        self._slots.add(generation.id)
+
+        try:
+            fal_result = await self._send(generation)
+        except Exception as e:
+            await self._submit_failed(generation, e)
+            raise
+
+        generation.fal_request_id = fal_result["request_id"]
+        await self._save_request_ids([generation])
+
+        # Hand the generation to the background poller
+        generation_poller.track(generation.id)
+        return generation.id
+
+    async def submit_many(
+        self,
+        user_id: int,
+        is_premium: bool,
+        generations: List[Generation],
+        concurrency: int
+    ) -> List[Optional[Exception]]:
+        """submit() for several generations, with one flush for all their rows
+
+        Each generation is admitted, queued or rejected on its own, and the
+        admitted ones go to fal concurrently, at most ``concurrency`` at a
+        time. Returns one entry per generation: None once it is stored and
+        submitted or queued, or the exception that failed it. A generation
+        fal refused is stored as failed, one rejected before reaching fal
+        isn't stored at all.
+        """
+        errors: List[Optional[Exception]] = [None] * len(generations)
+        immediate, queued = [], []
+        for index, generation in enumerate(generations):
+            if self.try_acquire():
+                generation.status = "processing"
+                immediate.append(index)
+                continue
+            try:
+                self.check_capacity(user_id, pending=len(queued))
+            except HTTPException as e:
+                errors[index] = e
+                continue
+            generation.status = "pending"
+            queued.append(index)
+
+        stored = [generation for generation, error in zip(generations, errors) if error is None]
+        if stored:
+            try:
+                await self._store(stored)
+            except Exception:
+                for _ in immediate:
+                    self.release_unused()
+                raise
+        self._slots.update(generations[index].id for index in immediate)
+
+        slots = asyncio.Semaphore(concurrency)
+
+        async def send(generation: Generation) -> dict:
+            async with slots:
+                return await self._send(generation)
+
+        results = await asyncio.gather(
+            *(send(generations[index]) for index in immediate),
+            return_exceptions=True
+        )
+        submitted = []
+        for index, result in zip(immediate, results):
+            if isinstance(result, BaseException):
+                await self._submit_failed(generations[index], result)
+                errors[index] = result
+                continue
+            generations[index].fal_request_id = result["request_id"]
+            submitted.append(generations[index])
+
+        if submitted:
+            await self._save_request_ids(submitted)
+        for generation in submitted:
+            generation_poller.track(generation.id)
+        for index in queued:
+            self.enqueue(user_id, is_premium, generations[index].id)
+        return errors
+
+    async def _store(self, generations: List[Generation]) -> None:
+        """Insert new generations and fill in their ids and creation times"""
+        # One multi-row INSERT; the ORM would send a row at a time on SQLite.
+        # Ids are assigned in VALUES order, but RETURNING may list them in
+        # any order, so match them back by sorting.
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                insert(Generation)
+                .values([{column: getattr(generation, column) for column in _INSERT_COLUMNS} for generation in generations])
+                .returning(Generation.id, Generation.created_at)
+            )
+            for generation, row in zip(generations, sorted(result.all(), key=lambda row: row.id)):
+                generation.id = row.id
+                generation.created_at = row.created_at
+            await db.commit()
+
+    @staticmethod
+    async def _send(generation: Generation) -> dict:
+        return await FalService.submit_generation(
+            generation.generation_type,
+            generation.model_name,
+            generation.prompt,
+            generation.negative_prompt,
+            json.loads(generation.parameters or "{}"),
+            generation_id=generation.id
+        )
+
+    @staticmethod
+    async def _save_request_ids(generations: List[Generation]) -> None:
+        async with AsyncSessionLocal() as db:
+            for generation in generations:
+                await db.execute(
+                    update(Generation)
+                    .where(Generation.id == generation.id)
+                    .values(fal_request_id=generation.fal_request_id)
+                )
+            await db.commit()
+
+    async def _submit_failed(self, generation: Generation, error: BaseException) -> None:
+        """Clean up after a stored, slot-holding generation that fal didn't take"""
+        if isinstance(error, DependencyUnavailable):
+            # Refused before anything was sent: as if it had never been submitted
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(Generation).where(Generation.id == generation.id))
+                await db.commit()
+            self._release(generation.user_id, generation.id)
+            return
+
+        values = finalize_values(
+            generation.created_at, error_message=str(error), model_name=generation.model_name
+        )
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(Generation)
+                .where(Generation.id == generation.id)
+                .where(Generation.status == "processing")
+                .values(**values)
+            )
+            if result.rowcount:
+                await record_generation_outcome(
+                    db, generation.user_id, generation.generation_type, generation.model_name, values
+                )
+            await db.commit()
+        if not result.rowcount:
+            # Finalized elsewhere meanwhile, e.g. timed out by the poller
+            self._release(generation.user_id, generation.id)
+            return
+        observe_generation_outcome(generation.generation_type, generation.model_name, values)
+        # Publishing the final state releases the slot
+        generation_events.publish(
+            generation.user_id,
+            generation.id,
+            values["status"],
+            error_message=values["error_message"],
+            progress=1.0
+        )
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def try_acquire(self) -> bool:
+        """Take a slot for an immediate submit; nobody may jump a non-empty queue"""
+        if self._queued or self.active >= self.max_active:
+            return False
+        self.active += 1
+        return True
+
+    def release_unused(self) -> None:
+        """Give back a slot taken for a generation that was never stored or claimed"""
+        self.active = max(self.active - 1, 0)
+        self._wakeup.set()
+
+    def check_capacity(self, user_id: int, pending: int = 0) -> None:
+        """Reject a request that would make the queue too deep
+
+        ``pending`` counts the user's generations about to be queued but not yet enqueued.
+        """
+        queued_for_user = len(self._queues.get(user_id, ())) + pending
+        if self._queued + pending >= self.max_queue_depth or queued_for_user >= self.max_queued_per_user:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many queued generations, try again later",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+
+    def enqueue(self, user_id: int, is_premium: bool, generation_id: int) -> None:
+        self._push(user_id, is_premium, generation_id)
+        self._wakeup.set()
+
+    def position(self, generation_id: int) -> Optional[int]:
+        """Number of queued generations that will be dispatched before this one
+
+        Replays _pop(): a queued job's start tag is its user's clock plus
+        1/weight for each job ahead of it in that user's queue, lower tags go
+        first, and ties go to the user who started queuing first. Queues
+        are bounded, so walking them is cheap.
+        """
+        users = list(self._queues)
+        for rank, user_id in enumerate(users):
+            queue = self._queues[user_id]
+            if generation_id not in queue:
+                continue
+            index = queue.index(generation_id)
+            target = list(self._start_tags(user_id, index + 1))[-1]
+            ahead = index
+            for other_rank, other_id in enumerate(users):
+                if other_id == user_id:
+                    continue
+                for tag in self._start_tags(other_id, len(self._queues[other_id])):
+                    if tag > target or (tag == target and other_rank > rank):
+                        break
+                    ahead += 1
+            return ahead
+        return None
+
+    def _start_tags(self, user_id: int, count: int) -> Iterator[float]:
+        """Start tags of a user's next ``count`` jobs, summed as _pop() sums them"""
+        tag = self._clocks[user_id]
+        for _ in range(count):
+            yield tag
+            tag += 1 / self._weights[user_id]
+
+    def _push(self, user_id: int, is_premium: bool, generation_id: int) -> None:
+        queue = self._queues.get(user_id)
+        if queue is None:
+            # A user who was idle starts at the current virtual time, with no banked credit
+            queue = self._queues[user_id] = deque()
+            self._clocks[user_id] = self._virtual_time
+        self._weights[user_id] = self.premium_weight if is_premium else 1.0
+        queue.append(generation_id)
+        self._queued += 1
+
+    def _pop(self) -> int:
+        user_id = min(self._queues, key=lambda uid: self._clocks[uid])
+        queue = self._queues[user_id]
+        generation_id = queue.popleft()
+        self._queued -= 1
+
+        self._virtual_time = self._clocks[user_id]
+        self._clocks[user_id] += 1 / self._weights[user_id]
+        if not queue:
+            del self._queues[user_id]
+            del self._clocks[user_id]
+            del self._weights[user_id]
+        return generation_id
+
+    def _release(self, user_id: Optional[int], generation_id: int) -> None:
+        """Give back the slot a generation holds, if it holds one of ours"""
+        if generation_id not in self._slots:
+            return
+        self._slots.discard(generation_id)
+        self.active = max(self.active - 1, 0)
+        self._wakeup.set()
+
+    async def _reconcile(self) -> None:
+        """Release the slots of generations that finished without us hearing of it"""
+        if not self._slots:
+            return
+        held = list(self._slots)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Generation.id)
+                .where(Generation.id.in_(held))
+                .where(Generation.status == "processing")
+            )
+            running = set(result.scalars().all())
+        for generation_id in held:
+            if generation_id not in running:
+                self._release(None, generation_id)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.reconcile_interval)
+            except asyncio.TimeoutError:
+                try:
+                    await self._reconcile()
+                except Exception:
+                    logger.warning("Failed to reconcile fal slots", exc_info=True)
+            self._wakeup.clear()
+
+            while self._queued and self.active < self.max_active:
+                if not fal_dependency.breaker.ready():
+                    # fal is failing fast: keep jobs queued rather than fail
+                    # them, and look again shortly
+                    delay = min(max(fal_dependency.breaker.retry_after(), 0.1), 1.0)
+                    asyncio.get_running_loop().call_later(delay, self._wakeup.set)
+                    break
+                self.active += 1
+                task = asyncio.create_task(self._dispatch(self._pop()))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, generation_id: int) -> None:
+        # Claim the row, so no other worker that queued it submits it too
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(Generation)
+                .where(Generation.id == generation_id)
+                .where(Generation.status == "pending")
+                .values(status="processing")
+                .returning(Generation)
+            )
+            generation = result.scalar_one_or_none()
+            await db.commit()
+        if generation is None:
+            self.release_unused()
+            return
+        self._slots.add(generation_id)
+
+        try:
+            fal_result = await self._send(generation)
+        except DependencyUnavailable:
+            # The breaker opened after this job was popped: put it back
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Generation)
+                    .where(Generation.id == generation_id)
+                    .where(Generation.status == "processing")
+                    .where(Generation.fal_request_id.is_(None))
+                    .values(status="pending")
+                )
+                await db.commit()
+                is_premium = await db.scalar(select(User.is_premium).where(User.id == generation.user_id))
+            self._release(generation.user_id, generation_id)
+            self.enqueue(generation.user_id, bool(is_premium), generation_id)
+            return
+        except Exception as e:
+            logger.warning("Failed to submit queued generation %s", generation_id, exc_info=True)
+            await self._submit_failed(generation, e)
+            return
+
+        generation.fal_request_id = fal_result["request_id"]
+        await self._save_request_ids([generation])
+
+        generation_poller.track(generation_id)
+        generation_events.publish(generation.user_id, generation_id, "processing", progress=0.0)
+
+fal_scheduler = FalScheduler(
+    max_active=settings.FAL_MAX_ACTIVE_JOBS,
+    max_queue_depth=settings.FAL_MAX_QUEUE_DEPTH,
+    max_queued_per_user=settings.FAL_MAX_QUEUED_PER_USER,
+    premium_weight=settings.FAL_PREMIUM_WEIGHT,
+    retry_after=settings.FAL_QUEUE_RETRY_AFTER_SECONDS,
+    reconcile_interval=settings.FAL_SLOT_RECONCILE_SECONDS
+)
@@ -1,10 +1,111 @@
-import fal_client
-from typing import Dict, Any, Optional
+from fastapi import HTTPException
+from typing import TYPE_CHECKING, Dict, Any, Optional
 import asyncio
+import hashlib
+import hmac
+import time
 from app.config import settings
+from app.metrics import FAL_REQUEST_DURATION, FAL_SLOT_WAIT, model_label
+from app.services.outbound import fal_dependency
+from app.utils.timing import record_phase
 
-# Configure Fal client
-fal_client.api_key = settings.FAL_KEY
+# Imported on first use, see app.middleware.auth
+if TYPE_CHECKING:
+    import httpx
+
+# Long-lived pooled client for the fal queue API, opened and closed by the app lifespan
+_http_client: Optional["httpx.AsyncClient"] = None
+
+def _build_http_client() -> "httpx.AsyncClient":
+    import httpx
+
+    return httpx.AsyncClient(
+        base_url=settings.FAL_QUEUE_URL,
+        headers={"Authorization": f"Key {settings.FAL_KEY}"},
+        limits=httpx.Limits(
+            max_connections=settings.FAL_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.FAL_HTTP_MAX_KEEPALIVE
+        ),
+        timeout=httpx.Timeout(
+            settings.FAL_READ_TIMEOUT_SECONDS,
+            connect=settings.FAL_CONNECT_TIMEOUT_SECONDS
+        )
+    )
+
+async def start_fal_client() -> None:
+    """Open the shared fal HTTP client"""
+    global _http_client
+    if _http_client is None:
+        _http_client = _build_http_client()
+
+async def close_fal_client() -> None:
+    """Close the shared fal HTTP client"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def get_fal_client() -> "httpx.AsyncClient":
+    # Fall back to a lazily created client when running outside the lifespan
+    global _http_client
+    if _http_client is None:
+        _http_client = _build_http_client()
+    return _http_client
+
+# Callers beyond the connection limit wait here instead of in httpx's pool
+# queue, which gets slow when long; the wait counts against the call's budget
+_request_slots = asyncio.Semaphore(settings.FAL_HTTP_MAX_CONNECTIONS)
+
+def _outcome(error: Optional[Exception]) -> str:
+    import httpx
+
+    if error is None:
+        return "ok"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code // 100}xx"
+    return "error"
+
+async def _fal_request(
+    method: str,
+    path: str,
+    timeout: float,
+    operation: str,
+    model: str,
+    idempotent: bool = False,
+    **kwargs
+) -> "httpx.Response":
+    async def send(budget: float) -> "httpx.Response":
+        waited = time.perf_counter()
+        async with _request_slots:
+            started = time.perf_counter()
+            FAL_SLOT_WAIT.observe(started - waited)
+            record_phase("fal_wait", started - waited)
+            error = None
+            try:
+                response = await get_fal_client().request(method, path, timeout=budget, **kwargs)
+                response.raise_for_status()
+                return response
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                FAL_REQUEST_DURATION.labels(operation, model_label(model), _outcome(error)).observe(elapsed)
+                record_phase("fal", elapsed)
+
+    return await fal_dependency.call(send, timeout, idempotent=idempotent)
+
+class FalRequestFailed(Exception):
+    """Raised when fal finished a request but it produced an error"""
+
+class FalServiceError(Exception):
+    """Raised when a call to fal failed; trying again later may work
+
+    Circuit-open and deadline failures are raised as the HTTPExceptions
+    from app.services.outbound instead, so they reach the client as 503/504.
+    """
 
 class FalService:
     @staticmethod
@@ -17,6 +118,7 @@ class FalService:
         num_images: int = 1,
         guidance_scale: float = 7.5,
         num_inference_steps: int = 50,
+        generation_id: Optional[int] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """Generate image using Fal.ai"""
@@ -37,19 +139,17 @@ class FalService:
             args.update(kwargs)
             
             # Submit the request
-            result = await asyncio.to_thread(
-                fal_client.submit,
-                model,
-                arguments=args
-            )
+            request_id = await FalService._submit(model, args, generation_id)
             
             return {
-                "request_id": result.request_id,
+                "request_id": request_id,
                 "status": "submitted"
             }
             
+        except HTTPException:
+            raise
         except Exception as e:
-            raise Exception(f"Failed to generate image: {str(e)}")
+            raise FalServiceError(f"Failed to generate image: {str(e)}") from e
     
     @staticmethod
     async def generate_video(
@@ -59,6 +159,7 @@ class FalService:
         fps: int = 24,
         width: int = 1024,
         height: int = 576,
+        generation_id: Optional[int] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """Generate video using Fal.ai"""
@@ -74,40 +175,154 @@ class FalService:
             args.update(kwargs)
             
             # Submit the request
-            result = await asyncio.to_thread(
-                fal_client.submit,
-                model,
-                arguments=args
-            )
+            request_id = await FalService._submit(model, args, generation_id)
             
             return {
-                "request_id": result.request_id,
+                "request_id": request_id,
                 "status": "submitted"
             }
             
+        except HTTPException:
+            raise
         except Exception as e:
-            raise Exception(f"Failed to generate video: {str(e)}")
+            raise FalServiceError(f"Failed to generate video: {str(e)}") from e
     
     @staticmethod
-    async def get_result(request_id: str) -> Dict[str, Any]:
+    async def submit_generation(
+        generation_type: str,
+        model: str,
+        prompt: str,
+        negative_prompt: Optional[str],
+        parameters: Dict[str, Any],
+        generation_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Submit an image or video generation with its stored parameters
+
+        Pass the stored generation's id to have fal call back when it finishes.
+        """
+        if generation_type == "video":
+            return await FalService.generate_video(
+                model=model, prompt=prompt, generation_id=generation_id, **parameters
+            )
+        return await FalService.generate_image(
+            model=model,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            generation_id=generation_id,
+            **parameters
+        )
+
+    @staticmethod
+    def webhooks_enabled() -> bool:
+        return bool(settings.FAL_WEBHOOK_BASE_URL and settings.FAL_WEBHOOK_SECRET)
+
+    @staticmethod
+    def webhook_url(generation_id: int) -> Optional[str]:
+        """Callback URL for one generation, or None when webhooks aren't configured
+
+        The signature covers the generation id, so a leaked URL can only
+        ever finalize that generation, and only with its fal request id.
+        """
+        if not FalService.webhooks_enabled():
+            return None
+
+        return (
+            f"{settings.FAL_WEBHOOK_BASE_URL.rstrip('/')}/api/webhooks/fal"
+            f"?generation_id={generation_id}&signature={FalService._sign(generation_id)}"
+        )
+
+    @staticmethod
+    def verify_webhook_signature(generation_id: int, signature: str) -> bool:
+        if not settings.FAL_WEBHOOK_SECRET:
+            return False
+        return hmac.compare_digest(FalService._sign(generation_id), signature)
+
+    @staticmethod
+    def _sign(generation_id: int) -> str:
+        return hmac.new(
+            settings.FAL_WEBHOOK_SECRET.encode(),
+            f"fal-webhook:{generation_id}".encode(),
+            hashlib.sha256
+        ).hexdigest()
+
+    @staticmethod
+    async def _submit(model: str, args: Dict[str, Any], generation_id: Optional[int] = None) -> str:
+        params = {}
+        webhook_url = FalService.webhook_url(generation_id) if generation_id is not None else None
+        if webhook_url:
+            params["fal_webhook"] = webhook_url
+
+        response = await _fal_request(
+            "POST",
+            f"/{model}",
+            timeout=settings.FAL_SUBMIT_TIMEOUT_SECONDS,
+            operation="submit",
+            model=model,
+            json=args,
+            params=params
+        )
+        return response.json()["request_id"]
+
+    @staticmethod
+    def _request_path(model: str, request_id: str) -> str:
+        # Queue URLs are addressed by the app id (owner/name), without the model subpath
+        app_id = "/".join(model.split("/")[:2])
+        return f"/{app_id}/requests/{request_id}"
+
+    @staticmethod
+    async def get_result(model: str, request_id: str) -> Dict[str, Any]:
         """Get result from Fal.ai request"""
+        import httpx
+
         try:
-            result = await asyncio.to_thread(
-                fal_client.result,
-                request_id
+            response = await _fal_request(
+                "GET",
+                FalService._request_path(model, request_id),
+                timeout=settings.FAL_RESULT_TIMEOUT_SECONDS,
+                operation="result",
+                model=model,
+                idempotent=True
             )
-            return result
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            if fal_dependency.is_failure(e):
+                raise FalServiceError(f"Failed to get result: {str(e)}") from e
+            # fal answers for a failed job with a 4xx and the error
+            raise FalRequestFailed(e.response.text or str(e))
+        except HTTPException:
+            raise
         except Exception as e:
-            raise Exception(f"Failed to get result: {str(e)}")
+            raise FalServiceError(f"Failed to get result: {str(e)}") from e
     
     @staticmethod
-    async def get_status(request_id: str) -> Dict[str, Any]:
+    async def get_status(model: str, request_id: str) -> Dict[str, Any]:
         """Get status of Fal.ai request"""
         try:
-            status = await asyncio.to_thread(
-                fal_client.status,
-                request_id
+            response = await _fal_request(
+                "GET",
+                f"{FalService._request_path(model, request_id)}/status",
+                timeout=settings.FAL_STATUS_TIMEOUT_SECONDS,
+                operation="status",
+                model=model,
+                idempotent=True
             )
-            return status
+            data = response.json()
+        except HTTPException:
+            raise
         except Exception as e:
-            raise Exception(f"Failed to get status: {str(e)}")
\ No newline at end of file
+            raise FalServiceError(f"Failed to get status: {str(e)}") from e
+
+        if data.get("status") == "COMPLETED":
+            return {"status": "completed", "metrics": data.get("metrics", {})}
+        if data.get("status") == "IN_PROGRESS":
+            return {"status": "in_progress"}
+        return {"status": "queued", "queue_position": data.get("queue_position")}
+
+    @staticmethod
+    def extract_result_url(result: Dict[str, Any]) -> Optional[str]:
+        """Pull the output URL out of an image or video result payload"""
+        if result.get("images"):
+            return result["images"][0].get("url")
+        if isinstance(result.get("video"), dict):
+            return result["video"].get("url")
+        return None
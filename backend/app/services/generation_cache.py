@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+import hashlib
+import json
+
+from app.config import settings
+from app.models.generation import Generation
+from app.utils.cache import SingleFlight
+
+# Identical submissions that are still being sent to fal share one job
+_inflight = SingleFlight()
+
+def generation_cache_key(
+    generation_type: str,
+    model: str,
+    prompt: str,
+    negative_prompt: Optional[str],
+    parameters: Dict[str, Any]
+) -> str:
+    """Canonical hash of everything that determines a generation's output"""
+    canonical = json.dumps(
+        {
+            "type": generation_type,
+            "model": model,
+            "prompt": prompt,
+            "negative_prompt": negative_prompt or None,
+            "parameters": parameters,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def cache_enabled(use_cache: bool, seed: Optional[int]) -> bool:
+    """Whether a request may share an earlier or in-flight generation
+
+    Only with a fixed seed: without one fal picks a new seed for every job,
+    so sending the same prompt again asks for a different output.
+    """
+    return settings.GENERATION_CACHE_ENABLED and use_cache and seed is not None
+
+async def find_cached_generation(
+    db: AsyncSession,
+    user_id: int,
+    project_id: Optional[int],
+    cache_key: str
+) -> Optional[Generation]:
+    """Most recent completed, queued or in-flight generation with the same inputs
+
+    Only generations filed under the same project (or none) are reused, so
+    a hit never hands back a row that belongs to another project. Entries
+    older than GENERATION_CACHE_TTL_SECONDS are ignored (fal result URLs
+    don't live forever), and failed generations are never reused.
+
+    The TTL is the whole eviction policy because there is nothing to evict:
+    the entries are the generations table itself, read through the
+    cache_key index, so the cache holds no rows or memory of its own. The
+    only in-process state, the in-flight map, drops each key once its
+    submit returns.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.GENERATION_CACHE_TTL_SECONDS)
+    result = await db.execute(
+        select(Generation)
+        .where(Generation.user_id == user_id)
+        .where(_same_project(project_id))
+        .where(Generation.cache_key == cache_key)
+        .where(Generation.status.in_(("pending", "processing", "completed")))
+        .where(Generation.created_at >= cutoff)
+        .order_by(Generation.created_at.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+async def find_cached_generations(
+    db: AsyncSession,
+    user_id: int,
+    keys: Iterable[Tuple[Optional[int], str]]
+) -> Dict[Tuple[Optional[int], str], Generation]:
+    """find_cached_generation() for several (project_id, cache_key) pairs in one query"""
+    keys = set(keys)
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.GENERATION_CACHE_TTL_SECONDS)
+    result = await db.execute(
+        select(Generation)
+        .where(Generation.user_id == user_id)
+        .where(Generation.cache_key.in_({cache_key for _, cache_key in keys}))
+        .where(Generation.status.in_(("pending", "processing", "completed")))
+        .where(Generation.created_at >= cutoff)
+        .order_by(Generation.created_at)
+    )
+    # Oldest first, so the most recent generation per key wins
+    return {
+        (generation.project_id, generation.cache_key): generation
+        for generation in result.scalars().all()
+        if (generation.project_id, generation.cache_key) in keys
+    }
+
+def _same_project(project_id: Optional[int]):
+    if project_id is None:
+        return Generation.project_id.is_(None)
+    return Generation.project_id == project_id
+
+async def submit_once(key: Hashable, submit: Callable[[], Awaitable[int]]) -> int:
+    """Run submit() once for concurrent callers with the same key
+
+    submit() must use its own session: it may outlive the request that
+    started it.
+    """
+    return await _inflight.do(key, submit)
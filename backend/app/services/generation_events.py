@@ -0,0 +1,71 @@
+from typing import Any, Callable, Dict, List, Optional, Set
+import asyncio
+
+from app.schemas.generation import GenerationStatusResponse
+
+FINAL_STATUSES = ("completed", "failed")
+
+class GenerationEventBus:
+    """In-process fan-out of generation status changes to stream subscribers"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        # Last event per in-flight generation, so repeated polls don't re-send it
+        self._last: Dict[int, GenerationStatusResponse] = {}
+        self._final_listeners: List[Callable[[int, int], None]] = []
+
+    def on_final(self, listener: Callable[[int, int], None]) -> None:
+        """Call listener(user_id, generation_id) whenever a generation finishes"""
+        self._final_listeners.append(listener)
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def latest(self, generation_id: int) -> Optional[GenerationStatusResponse]:
+        """Most recent event for an in-flight generation"""
+        return self._last.get(generation_id)
+
+    def publish(
+        self,
+        user_id: int,
+        generation_id: int,
+        status: str,
+        result_url: Optional[str] = None,
+        error_message: Optional[str] = None,
+        progress: Optional[float] = None
+    ) -> None:
+        event = GenerationStatusResponse(
+            id=generation_id,
+            status=status,
+            result_url=result_url,
+            error_message=error_message,
+            progress=progress
+        )
+
+        if status in FINAL_STATUSES:
+            self._last.pop(generation_id, None)
+            for listener in self._final_listeners:
+                listener(user_id, generation_id)
+        elif self._last.get(generation_id) == event:
+            return
+        else:
+            self._last[generation_id] = event
+
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                # A slow reader loses its oldest event rather than stalling the publisher
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+generation_events = GenerationEventBus()
@@ -0,0 +1,276 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import random
+import time
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.metrics import GENERATION_QUEUE_TIME, model_label, observe_generation_outcome
+from app.models.generation import Generation
+from app.services.fal_service import FalService, FalRequestFailed
+from app.services.outbound import DependencyUnavailable
+from app.services.generation_events import generation_events
+from app.services.usage_stats import generation_cost, record_generation_outcome
+
+logger = logging.getLogger(__name__)
+
+# fal only reports queue state, so progress before completion is coarse
+PENDING_PROGRESS = {"queued": 0.0, "in_progress": 0.5}
+
+def _utc(value: datetime) -> datetime:
+    # SQLite hands back naive UTC timestamps
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+def finalize_values(
+    created_at: Optional[datetime],
+    result_url: Optional[str] = None,
+    error_message: Optional[str] = None,
+    model_name: Optional[str] = None
+) -> Dict[str, Any]:
+    """Column values that move a processing generation to its final state"""
+    completed_at = datetime.now(timezone.utc)
+    processing_time = None
+    if created_at is not None:
+        processing_time = max((completed_at - _utc(created_at)).total_seconds(), 0.0)
+
+    final_status = "failed" if error_message else "completed"
+    return {
+        "status": final_status,
+        "result_url": result_url,
+        "error_message": error_message,
+        "completed_at": completed_at,
+        "processing_time": processing_time,
+        "cost": generation_cost(model_name, final_status),
+    }
+
+class GenerationPoller:
+    """Background task that drives processing generations to completion
+
+    A generation still processing ``max_processing`` seconds after it was
+    submitted is failed without asking fal again, e.g. when fal lost the
+    request and answers its status checks with 404s.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        batch_size: int,
+        concurrency: int,
+        backoff_base: float,
+        backoff_max: float,
+        initial_delay: float,
+        max_processing: float
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.initial_delay = initial_delay
+        self.max_processing = max_processing
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # generation id -> (next check time, checks so far, when first scheduled)
+        self._schedule: Dict[int, Tuple[float, int, float]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def track(self, generation_id: int) -> None:
+        """Schedule the first check of a freshly submitted generation"""
+        now = time.monotonic()
+        self._schedule[generation_id] = (now + self.initial_delay, 0, now)
+        self._wakeup.set()
+
+    def forget(self, generation_id: int) -> None:
+        self._schedule.pop(generation_id, None)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Generation poller sweep failed")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def sweep(self) -> None:
+        """Check every due processing generation once, a batch at a time"""
+        started = time.monotonic()
+        last_id = 0
+        seen = set()
+
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(
+                        Generation.id,
+                        Generation.user_id,
+                        Generation.generation_type,
+                        Generation.model_name,
+                        Generation.fal_request_id,
+                        Generation.created_at,
+                        Generation.updated_at
+                    )
+                    .where(Generation.status == "processing")
+                    .where(Generation.id > last_id)
+                    .order_by(Generation.id)
+                    .limit(self.batch_size)
+                )
+                rows = result.all()
+
+            if not rows:
+                break
+
+            last_id = rows[-1].id
+            seen.update(row.id for row in rows)
+
+            now = time.monotonic()
+            stale_before = datetime.now(timezone.utc) - timedelta(seconds=self.max_processing)
+            updates, due = [], []
+            for row in rows:
+                # Submitted when it became processing; nothing else updates it until it finishes
+                submitted_at = row.updated_at or row.created_at
+                if submitted_at is not None and _utc(submitted_at) < stale_before:
+                    updates.append((row, finalize_values(
+                        row.created_at,
+                        error_message="Timed out waiting for the generation to finish",
+                        model_name=row.model_name
+                    )))
+                # Rows still being submitted have nothing to poll yet
+                elif row.fal_request_id is not None and self._is_due(row.id, now):
+                    due.append(row)
+            outcomes = await asyncio.gather(*(self._check(row) for row in due))
+            updates += [outcome for outcome in outcomes if outcome is not None]
+            if updates:
+                await self._apply(updates)
+
+            if len(rows) < self.batch_size:
+                break
+
+        # Drop schedule entries for generations that finished some other way.
+        # Entries made since the sweep began may be for rows its queries missed.
+        for generation_id, (_, _, scheduled_at) in list(self._schedule.items()):
+            if generation_id not in seen and scheduled_at < started:
+                del self._schedule[generation_id]
+
+    def _is_due(self, generation_id: int, now: float) -> bool:
+        entry = self._schedule.get(generation_id)
+        if entry is None:
+            # Submitted by another worker or before a restart: give it the
+            # grace period a fresh submission gets, rather than have every
+            # worker poll it at once
+            self._schedule[generation_id] = (now + self.initial_delay, 0, now)
+            return False
+        return entry[0] <= now
+
+    def _back_off(self, generation_id: int) -> None:
+        now = time.monotonic()
+        _, attempts, scheduled_at = self._schedule.get(generation_id, (0.0, 0, now))
+        delay = min(self.backoff_base * (2 ** attempts), self.backoff_max)
+        delay *= random.uniform(0.8, 1.2)
+        self._schedule[generation_id] = (now + delay, attempts + 1, scheduled_at)
+
+    async def _check(self, row) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        async with self._semaphore:
+            try:
+                fal_status = await FalService.get_status(row.model_name, row.fal_request_id)
+                if fal_status.get("status") != "completed":
+                    generation_events.publish(
+                        row.user_id,
+                        row.id,
+                        "processing",
+                        progress=PENDING_PROGRESS.get(fal_status.get("status"))
+                    )
+                    self._back_off(row.id)
+                    return None
+
+                fal_result = await FalService.get_result(row.model_name, row.fal_request_id)
+            except FalRequestFailed as e:
+                return row, finalize_values(row.created_at, error_message=str(e), model_name=row.model_name)
+            except DependencyUnavailable:
+                # fal's breaker is open: already logged by the calls that opened it
+                self._back_off(row.id)
+                return None
+            except Exception:
+                logger.warning("Failed to poll generation %s", row.id, exc_info=True)
+                self._back_off(row.id)
+                return None
+
+        result_url = FalService.extract_result_url(fal_result)
+        if result_url is None:
+            return row, finalize_values(
+                row.created_at, error_message="Result contained no output", model_name=row.model_name
+            )
+        values = finalize_values(row.created_at, result_url=result_url, model_name=row.model_name)
+        inference_time = (fal_status.get("metrics") or {}).get("inference_time")
+        if inference_time is not None and values["processing_time"] is not None:
+            GENERATION_QUEUE_TIME.labels(model_label(row.model_name)).observe(max(values["processing_time"] - inference_time, 0.0))
+        return row, values
+
+    async def _apply(self, updates: List[Tuple[Any, Dict[str, Any]]]) -> None:
+        # One transaction per batch; the status guard keeps a late poll from
+        # overwriting a generation that was finalized elsewhere
+        applied = []
+        async with AsyncSessionLocal() as db:
+            for row, values in updates:
+                result = await db.execute(
+                    update(Generation)
+                    .where(Generation.id == row.id)
+                    .where(Generation.status == "processing")
+                    .values(**values)
+                )
+                if result.rowcount:
+                    applied.append((row, values))
+                    await record_generation_outcome(
+                        db, row.user_id, row.generation_type, row.model_name, values
+                    )
+            await db.commit()
+
+        for row, values in updates:
+            self.forget(row.id)
+
+        for row, values in applied:
+            observe_generation_outcome(row.generation_type, row.model_name, values)
+            generation_events.publish(
+                row.user_id,
+                row.id,
+                values["status"],
+                result_url=values["result_url"],
+                error_message=values["error_message"],
+                progress=1.0
+            )
+
+generation_poller = GenerationPoller(
+    interval=settings.GENERATION_POLL_INTERVAL_SECONDS,
+    batch_size=settings.GENERATION_POLL_BATCH_SIZE,
+    concurrency=settings.GENERATION_POLL_CONCURRENCY,
+    backoff_base=settings.GENERATION_POLL_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.GENERATION_POLL_BACKOFF_MAX_SECONDS,
+    # With webhooks on, polling only catches callbacks that never arrive
+    initial_delay=(
+        settings.GENERATION_POLL_WEBHOOK_GRACE_SECONDS
+        if FalService.webhooks_enabled()
+        else settings.GENERATION_POLL_BACKOFF_BASE_SECONDS
+    ),
+    max_processing=settings.GENERATION_MAX_PROCESSING_SECONDS
+)
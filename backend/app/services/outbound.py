@@ -0,0 +1,209 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi import HTTPException, status
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import asyncio
+import math
+import random
+import time
+
+from app.config import settings
+from app.metrics import OUTBOUND_REJECTED, OUTBOUND_RETRIES
+
+T = TypeVar("T")
+
+class DependencyUnavailable(HTTPException):
+    """An outbound dependency is failing, so the call was refused or gave up"""
+
+    def __init__(self, dependency: str, retry_after: float):
+        self.dependency = dependency
+        self.retry_after = retry_after
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"{dependency} is unavailable, try again later",
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))}
+        )
+
+class DeadlineExceeded(HTTPException):
+    """The request's deadline passed before an outbound call could finish"""
+
+    def __init__(self, dependency: str):
+        self.dependency = dependency
+        super().__init__(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Timed out waiting for {dependency}"
+        )
+
+# Monotonic time by which the current request must be answered, see request_deadline()
+_deadline: ContextVar[Optional[float]] = ContextVar("outbound_deadline", default=None)
+
+@contextmanager
+def request_deadline(seconds: float):
+    """Bound every outbound call made in this context to ``seconds`` from now
+
+    Nested deadlines can only shorten the one already in effect.
+    """
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def time_left() -> Optional[float]:
+    """Seconds until the current deadline, or None without one"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+class CircuitBreaker:
+    """Stops calling a dependency after consecutive failures
+
+    After ``failure_threshold`` failures in a row the breaker opens and
+    calls fail at once. Once ``recovery_seconds`` have passed, one probe
+    call is let through (half-open): its success closes the breaker and its
+    failure opens it again for another ``recovery_seconds``.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failure_threshold: int, recovery_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._clock = clock
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._probing or self.retry_after() == 0:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def retry_after(self) -> float:
+        """Seconds until a call would be let through"""
+        if self._opened_at is None:
+            return 0.0
+        if self._probing:
+            return self.recovery_seconds
+        return max(self._opened_at + self.recovery_seconds - self._clock(), 0.0)
+
+    def ready(self) -> bool:
+        return self._opened_at is None or (not self._probing and self.retry_after() == 0)
+
+    def acquire(self) -> bool:
+        """Whether a call may go ahead; the first after recovery becomes the probe"""
+        if self._opened_at is None:
+            return True
+        if not self.ready():
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def release(self) -> None:
+        """End a call whose outcome says nothing about the service's health"""
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+        self._probing = False
+
+class Dependency:
+    """Calls to one outbound service, behind a circuit breaker
+
+    Every call is bounded by its own timeout and by the request deadline,
+    whichever is sooner. Idempotent calls are retried with full-jitter
+    exponential backoff on transport errors, timeouts, 429s and 5xx
+    responses, as long as the deadline allows. Other errors (e.g. a 4xx)
+    mean the service is up and are raised as they are.
+    """
+
+    def __init__(self, name: str, breaker: CircuitBreaker, retries: int, backoff_base: float, backoff_max: float):
+        self.name = name
+        self.breaker = breaker
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    @staticmethod
+    def is_failure(error: BaseException) -> bool:
+        """Whether an error says the service is unhealthy, rather than that the call was wrong"""
+        import httpx
+
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code == 429 or error.response.status_code >= 500
+        return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+    async def call(self, send: Callable[[float], Awaitable[T]], timeout: float, idempotent: bool = False) -> T:
+        """Await ``send(budget)``, which must finish within ``budget`` seconds"""
+        import httpx
+
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            left = time_left()
+            if left is not None and left <= 0:
+                OUTBOUND_REJECTED.labels(self.name, "deadline").inc()
+                raise DeadlineExceeded(self.name)
+            if not self.breaker.acquire():
+                OUTBOUND_REJECTED.labels(self.name, "circuit_open").inc()
+                raise DependencyUnavailable(self.name, self.breaker.retry_after())
+            budget = timeout if left is None else min(timeout, left)
+
+            try:
+                async with asyncio.timeout(budget):
+                    result = await send(budget)
+            except Exception as e:
+                if left is not None and left < timeout and isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)):
+                    # Our deadline ran out, which says nothing about the service
+                    self.breaker.release()
+                    raise DeadlineExceeded(self.name) from e
+                if not self.is_failure(e):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                left = time_left()
+                if attempt + 1 == attempts or (left is not None and left <= delay):
+                    raise
+                OUTBOUND_RETRIES.labels(self.name).inc()
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled, e.g. the client went away
+                self.breaker.release()
+                raise
+
+            self.breaker.record_success()
+            return result
+
+def _dependency(name: str) -> Dependency:
+    return Dependency(
+        name,
+        CircuitBreaker(
+            failure_threshold=settings.OUTBOUND_BREAKER_FAILURE_THRESHOLD,
+            recovery_seconds=settings.OUTBOUND_BREAKER_RECOVERY_SECONDS
+        ),
+        retries=settings.OUTBOUND_RETRIES,
+        backoff_base=settings.OUTBOUND_RETRY_BACKOFF_BASE_SECONDS,
+        backoff_max=settings.OUTBOUND_RETRY_BACKOFF_MAX_SECONDS
+    )
+
+fal_dependency = _dependency("fal")
+stack_auth_dependency = _dependency("stack_auth")
+
+dependencies: Dict[str, Dependency] = {
+    dependency.name: dependency for dependency in (fal_dependency, stack_auth_dependency)
+}
+
+def breaker_states() -> Dict[str, str]:
+    return {name: dependency.breaker.state for name, dependency in dependencies.items()}
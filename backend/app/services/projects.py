@@ -0,0 +1,40 @@
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Iterable, Optional, Set
+
+from app.models.project import Project
+
+# Running totals for PATCH saves, see get_patch_stats()
+_patch_stats = {"saves": 0, "patch_bytes": 0, "document_bytes": 0}
+
+def record_patch_save(patch_bytes: int, document_bytes: int) -> None:
+    _patch_stats["saves"] += 1
+    _patch_stats["patch_bytes"] += patch_bytes
+    _patch_stats["document_bytes"] += document_bytes
+
+def get_patch_stats() -> dict:
+    """Bytes sent as patches vs. what full-document saves would have sent"""
+    return {**_patch_stats, "bytes_saved": _patch_stats["document_bytes"] - _patch_stats["patch_bytes"]}
+
+async def owned_project_ids(db: AsyncSession, user_id: int, project_ids: Iterable[int]) -> Set[int]:
+    """The subset of ``project_ids`` that belong to the user"""
+    project_ids = set(project_ids)
+    if not project_ids:
+        return set()
+    result = await db.execute(
+        select(Project.id)
+        .where(Project.id.in_(project_ids))
+        .where(Project.user_id == user_id)
+    )
+    return set(result.scalars().all())
+
+async def require_owned_project(db: AsyncSession, user_id: int, project_id: Optional[int]) -> None:
+    """Reject a generation request that files its output under someone else's project"""
+    if project_id is None:
+        return
+    if project_id not in await owned_project_ids(db, user_id, [project_id]):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found"
+        )
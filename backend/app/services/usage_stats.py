@@ -0,0 +1,221 @@
+from collections import Counter
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import math
+
+from app.config import settings
+from app.database import AsyncSessionLocal, dialect_insert
+from app.models.generation import Generation
+from app.models.usage import ProcessingTimeBucket, UserGenerationStats
+from app.services.generation_events import FINAL_STATUSES
+
+# Relative error of processing-time percentiles: each bucket spans a factor of
+# (1 + a) / (1 - a), so its midpoint is within a of every value in it
+SKETCH_RELATIVE_ACCURACY = 0.02
+_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_MIN_SECONDS = 1e-3
+
+_REBUILD_CHUNK = 1000
+
+def generation_cost(model_name: Optional[str], status: str) -> Optional[float]:
+    """What fal charges for a generation; failures are not billed"""
+    if status != "completed":
+        return 0.0
+    return settings.GENERATION_MODEL_COSTS.get(model_name)
+
+def sketch_bucket(seconds: float) -> int:
+    return math.ceil(math.log(max(seconds, _MIN_SECONDS)) / _LOG_GAMMA)
+
+def sketch_quantile(buckets: List[Tuple[int, int]], quantile: float) -> Optional[float]:
+    """Estimate a quantile from (bucket, count) pairs sorted by bucket"""
+    total = sum(count for _, count in buckets)
+    if not total:
+        return None
+    rank = quantile * (total - 1)
+    seen = 0
+    for bucket, count in buckets:
+        seen += count
+        if seen > rank:
+            return 2 * _GAMMA ** bucket / (_GAMMA + 1)
+    return 2 * _GAMMA ** buckets[-1][0] / (_GAMMA + 1)
+
+async def record_generation_outcome(
+    db: AsyncSession,
+    user_id: int,
+    generation_type: str,
+    model_name: str,
+    values: Dict[str, Any]
+) -> None:
+    """Fold one finalized generation into the user's stats
+
+    Call in the transaction that finalized it, after the status-guarded
+    update succeeded, so each generation is counted exactly once. Both
+    statements are single-row upserts of relative increments and never read
+    the row first. The Prometheus counters are not touched here: callers
+    update them with observe_generation_outcome once the transaction has
+    committed, so a rolled-back one is never counted.
+    """
+    completed = values["status"] == "completed"
+    processing_time = values.get("processing_time")
+    key = dict(user_id=user_id, generation_type=generation_type, model_name=model_name)
+    upsert = dialect_insert(db)
+
+    stmt = upsert(UserGenerationStats).values(
+        **key,
+        completed_count=int(completed),
+        failed_count=int(not completed),
+        total_cost=values.get("cost") or 0.0,
+        processing_time_count=int(processing_time is not None),
+        processing_time_total=processing_time or 0.0,
+        last_finished_at=values.get("completed_at")
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={
+            "completed_count": UserGenerationStats.completed_count + stmt.excluded.completed_count,
+            "failed_count": UserGenerationStats.failed_count + stmt.excluded.failed_count,
+            "total_cost": UserGenerationStats.total_cost + stmt.excluded.total_cost,
+            "processing_time_count": UserGenerationStats.processing_time_count + stmt.excluded.processing_time_count,
+            "processing_time_total": UserGenerationStats.processing_time_total + stmt.excluded.processing_time_total,
+            "last_finished_at": stmt.excluded.last_finished_at,
+        }
+    ))
+
+    if processing_time is None:
+        return
+    stmt = upsert(ProcessingTimeBucket).values(
+        **key, bucket=sketch_bucket(processing_time), count=1
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=list(key) + ["bucket"],
+        set_={"count": ProcessingTimeBucket.count + 1}
+    ))
+
+async def load_user_stats(db: AsyncSession, user_id: int) -> List[Dict[str, Any]]:
+    """A user's stats rows with derived rates and percentiles
+
+    Reads only the aggregate tables, which hold one row per model used (plus
+    its sketch buckets), never the user's generations.
+    """
+    result = await db.execute(
+        select(UserGenerationStats)
+        .where(UserGenerationStats.user_id == user_id)
+        .order_by(UserGenerationStats.generation_type, UserGenerationStats.model_name)
+    )
+    rows = result.scalars().all()
+
+    result = await db.execute(
+        select(
+            ProcessingTimeBucket.generation_type,
+            ProcessingTimeBucket.model_name,
+            ProcessingTimeBucket.bucket,
+            ProcessingTimeBucket.count
+        )
+        .where(ProcessingTimeBucket.user_id == user_id)
+        .order_by(ProcessingTimeBucket.bucket)
+    )
+    sketches: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+    for bucket in result.all():
+        sketches.setdefault((bucket.generation_type, bucket.model_name), []).append(
+            (bucket.bucket, bucket.count)
+        )
+
+    stats = []
+    for row in rows:
+        finished = row.completed_count + row.failed_count
+        sketch = sketches.get((row.generation_type, row.model_name), [])
+        stats.append({
+            "generation_type": row.generation_type,
+            "model_name": row.model_name,
+            "total_count": finished,
+            "completed_count": row.completed_count,
+            "failed_count": row.failed_count,
+            "failure_rate": row.failed_count / finished if finished else 0.0,
+            "total_cost": row.total_cost,
+            "processing_time_total": row.processing_time_total,
+            "processing_time_avg": (
+                row.processing_time_total / row.processing_time_count
+                if row.processing_time_count else None
+            ),
+            "processing_time_p50": sketch_quantile(sketch, 0.5),
+            "processing_time_p90": sketch_quantile(sketch, 0.9),
+            "processing_time_p99": sketch_quantile(sketch, 0.99),
+            "last_finished_at": row.last_finished_at,
+        })
+    return stats
+
+async def rebuild_usage_stats(user_id: Optional[int] = None) -> int:
+    """Recompute the stats tables from generation history in one transaction
+
+    Returns the number of stats rows written. Generations finalized while a
+    rebuild runs may be missed on PostgreSQL; SQLite serializes the writes.
+    """
+    def scoped(query, column):
+        return query if user_id is None else query.where(column == user_id)
+
+    key_columns = (Generation.user_id, Generation.generation_type, Generation.model_name)
+    async with AsyncSessionLocal() as db:
+        await db.execute(scoped(delete(ProcessingTimeBucket), ProcessingTimeBucket.user_id))
+        await db.execute(scoped(delete(UserGenerationStats), UserGenerationStats.user_id))
+
+        result = await db.execute(
+            scoped(
+                select(
+                    *key_columns,
+                    func.sum(case((Generation.status == "completed", 1), else_=0)).label("completed_count"),
+                    func.sum(case((Generation.status == "failed", 1), else_=0)).label("failed_count"),
+                    func.coalesce(func.sum(Generation.cost), 0.0).label("total_cost"),
+                    func.count(Generation.processing_time).label("processing_time_count"),
+                    func.coalesce(func.sum(Generation.processing_time), 0.0).label("processing_time_total"),
+                    func.max(Generation.completed_at).label("last_finished_at")
+                )
+                .where(Generation.status.in_(FINAL_STATUSES))
+                .group_by(*key_columns),
+                Generation.user_id
+            )
+        )
+        stats = [dict(row._mapping) for row in result.all()]
+        for start in range(0, len(stats), _REBUILD_CHUNK):
+            await db.execute(insert(UserGenerationStats), stats[start:start + _REBUILD_CHUNK])
+
+        # SQL has no portable log(), so bucket the durations here, streaming
+        buckets: Counter = Counter()
+        result = await db.stream(
+            scoped(
+                select(*key_columns, Generation.processing_time)
+                .where(Generation.status.in_(FINAL_STATUSES))
+                .where(Generation.processing_time.is_not(None)),
+                Generation.user_id
+            ).execution_options(yield_per=_REBUILD_CHUNK)
+        )
+        async for row in result:
+            buckets[(row.user_id, row.generation_type, row.model_name, sketch_bucket(row.processing_time))] += 1
+
+        bucket_rows = [
+            dict(user_id=uid, generation_type=gtype, model_name=model, bucket=bucket, count=count)
+            for (uid, gtype, model, bucket), count in buckets.items()
+        ]
+        for start in range(0, len(bucket_rows), _REBUILD_CHUNK):
+            await db.execute(insert(ProcessingTimeBucket), bucket_rows[start:start + _REBUILD_CHUNK])
+
+        await db.commit()
+    return len(stats)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild user_generation_stats from generation history")
+    parser.add_argument("--user-id", type=int, default=None, help="only rebuild this user's stats")
+    args = parser.parse_args()
+
+    async def main():
+        from app.database import init_db
+        from app.models import project, user  # noqa: F401 - register tables
+
+        await init_db()
+        rows = await rebuild_usage_stats(args.user_id)
+        print(f"Rebuilt {rows} usage stats rows")
+
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+from contextlib import asynccontextmanager
+from typing import Awaitable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class StartupState:
+    """Lifespan step timings and whether the background warm-up has finished"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.ready = False
+        self.error: Optional[str] = None
+        self._warm_up: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def step(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - started
+
+    def begin_warm_up(self, warm_up: Awaitable[None]) -> None:
+        self.ready = False
+        self.error = None
+        self._warm_up = asyncio.ensure_future(self._run_warm_up(warm_up))
+
+    async def wait_ready(self) -> None:
+        if self._warm_up is not None:
+            await asyncio.shield(self._warm_up)
+
+    async def cancel_warm_up(self) -> None:
+        if self._warm_up is not None and not self._warm_up.done():
+            self._warm_up.cancel()
+            try:
+                await self._warm_up
+            except asyncio.CancelledError:
+                pass
+        self._warm_up = None
+        self.ready = False
+
+    async def _run_warm_up(self, warm_up: Awaitable[None]) -> None:
+        try:
+            async with self.step("warm_up"):
+                await warm_up
+        except Exception as e:
+            # Stay unready so the health check keeps failing and the worker gets replaced
+            logger.exception("Startup warm-up failed")
+            self.error = str(e)
+            return
+        self.ready = True
+
+startup = StartupState()
+
+async def warm_pools() -> None:
+    """Open the outbound HTTP clients and database pool before taking traffic"""
+    from app.database import warm_db_pool
+    from app.middleware.auth import start_auth_client
+    from app.services.fal_service import start_fal_client
+
+    async def timed(name: str, warm: Awaitable[None]) -> None:
+        async with startup.step(name):
+            await warm
+
+    await asyncio.gather(
+        timed("auth_client", start_auth_client()),
+        timed("fal_client", start_fal_client()),
+        timed("db_pool", warm_db_pool(settings.DB_POOL_WARM_CONNECTIONS)),
+    )
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def _import_timings(module: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """Cumulative import time of ``module`` and of each of its direct imports"""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=backend_dir,
+        capture_output=True,
+        text=True
+    )
+    total = 0.0
+    children = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if not match:
+            continue
+        cumulative = int(match.group(2)) / 1e6
+        depth = (len(match.group(3)) - 1) // 2
+        if depth == 0 and match.group(4) == module:
+            total = cumulative
+        elif depth == 1:
+            children.append((match.group(4), cumulative))
+    return total, sorted(children, key=lambda child: child[1], reverse=True)
+
+def profile_startup(app, top: int = 15) -> None:
+    """Print import and lifespan timings for ``python main.py --profile-startup``"""
+    total, children = _import_timings("main")
+    print(f"import main: {total * 1000:8.1f} ms")
+    for name, seconds in children[:top]:
+        print(f"  {name:<40} {seconds * 1000:8.1f} ms")
+
+    async def run_lifespan():
+        started = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            serving = time.perf_counter() - started
+            await startup.wait_ready()
+            ready = time.perf_counter() - started
+            timings = dict(startup.timings)
+        print(f"lifespan: serving after {serving * 1000:8.1f} ms, ready after {ready * 1000:8.1f} ms")
+        for name, seconds in timings.items():
+            print(f"  {name:<40} {seconds * 1000:8.1f} ms")
+        if startup.error:
+            print(f"  warm-up failed: {startup.error}")
+
+    asyncio.run(run_lifespan())
@@ -0,0 +1,55 @@
+from typing import AsyncIterator, Optional, Tuple
+import asyncio
+
+FILE_CHUNK_SIZE = 256 * 1024
+
+class RangeNotSatisfiable(ValueError):
+    """No part of the requested range lies inside the file"""
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single-range ``Range: bytes=...`` header
+
+    Returns None when the whole file should be sent instead: no header, a
+    unit other than bytes, a malformed value or several ranges, all of which
+    RFC 9110 lets a server ignore.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    if not (first or last).isdigit() or (first and last and not last.isdigit()):
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    end = int(last) if last else size - 1
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+async def iter_file_range(path: str, start: int, length: int) -> AsyncIterator[bytes]:
+    """Read ``length`` bytes from ``start`` in chunks, off the event loop"""
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(FILE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
@@ -0,0 +1,75 @@
+from typing import List
+import os
+import subprocess
+import tempfile
+
+# Render functions for the derivative process pool (app.services.derivatives).
+# No app imports, so spawned workers start quickly. Each writes to a temporary
+# file beside ``dst`` and renames it into place: a derivative is complete or absent.
+
+def _atomic_target(dst: str) -> str:
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst), suffix=os.path.splitext(dst)[1])
+    os.close(fd)
+    return tmp_path
+
+def _finish(tmp_path: str, dst: str) -> str:
+    os.replace(tmp_path, dst)
+    return dst
+
+def _ffmpeg(binary: str, args: List[str], tmp_path: str, timeout: float) -> None:
+    try:
+        subprocess.run(
+            [binary, "-nostdin", "-v", "error", "-y", *args, tmp_path],
+            check=True,
+            capture_output=True,
+            timeout=timeout
+        )
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def render_image_thumbnail(src: str, dst: str, size: int, quality: int) -> str:
+    """WebP no larger than size x size, keeping the aspect ratio"""
+    from PIL import Image, ImageOps
+
+    tmp_path = _atomic_target(dst)
+    try:
+        with Image.open(src) as image:
+            # JPEG can decode straight to a smaller scale, far cheaper than resizing
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+            image.save(tmp_path, "WEBP", quality=quality, method=4)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return _finish(tmp_path, dst)
+
+def render_video_poster(src: str, dst: str, size: int, quality: int, ffmpeg: str, timeout: float) -> str:
+    """WebP of the first frame, no larger than size x size"""
+    tmp_path = _atomic_target(dst)
+    _ffmpeg(ffmpeg, [
+        "-i", src,
+        "-frames:v", "1",
+        "-vf", f"scale={size}:{size}:force_original_aspect_ratio=decrease",
+        "-c:v", "libwebp", "-quality", str(quality),
+        "-f", "webp",
+    ], tmp_path, timeout)
+    return _finish(tmp_path, dst)
+
+def render_video_preview(src: str, dst: str, size: int, ffmpeg: str, timeout: float) -> str:
+    """Silent low-resolution H.264 copy that starts playing before it has downloaded"""
+    tmp_path = _atomic_target(dst)
+    _ffmpeg(ffmpeg, [
+        "-i", src,
+        "-an",
+        # libx264 needs even dimensions
+        "-vf", f"scale={size}:{size}:force_original_aspect_ratio=decrease,scale=trunc(iw/2)*2:trunc(ih/2)*2",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "30",
+        "-movflags", "+faststart",
+        "-f", "mp4",
+    ], tmp_path, timeout)
+    return _finish(tmp_path, dst)
@@ -0,0 +1,133 @@
+from typing import Any, Dict, List, Tuple
+import copy
+
+class JsonPatchError(ValueError):
+    """The patch is malformed or points at something that doesn't exist"""
+
+class JsonPatchConflict(JsonPatchError):
+    """A ``test`` operation did not match the current document"""
+
+_MISSING = object()
+
+def _json_equal(a: Any, b: Any) -> bool:
+    # Python treats True == 1; JSON doesn't
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_json_equal(a[key], b[key]) for key in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_json_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+def _parse_pointer(pointer: str) -> List[str]:
+    # RFC 6901: "" is the whole document, "/a/b" walks keys; ~1 is "/", ~0 is "~"
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+def _array_index(container: list, token: str, allow_end: bool) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise JsonPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index out of range: {index}")
+    return index
+
+def _resolve_parent(document: Any, tokens: List[str]) -> Tuple[Any, str]:
+    target = document
+    for token in tokens[:-1]:
+        if isinstance(target, dict):
+            if token not in target:
+                raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+            target = target[token]
+        elif isinstance(target, list):
+            target = target[_array_index(target, token, allow_end=False)]
+        else:
+            raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return target, tokens[-1]
+
+def _get(document: Any, tokens: List[str]) -> Any:
+    if not tokens:
+        return document
+    parent, key = _resolve_parent(document, tokens)
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+        return parent[key]
+    if isinstance(parent, list):
+        return parent[_array_index(parent, key, allow_end=False)]
+    raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+
+def _add(document: Any, tokens: List[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    parent, key = _resolve_parent(document, tokens)
+    if isinstance(parent, dict):
+        parent[key] = value
+    elif isinstance(parent, list):
+        parent.insert(_array_index(parent, key, allow_end=True), value)
+    else:
+        raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return document
+
+def _remove(document: Any, tokens: List[str]) -> Tuple[Any, Any]:
+    if not tokens:
+        raise JsonPatchError("Cannot remove the whole document")
+    parent, key = _resolve_parent(document, tokens)
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+        return document, parent.pop(key)
+    if isinstance(parent, list):
+        return document, parent.pop(_array_index(parent, key, allow_end=False))
+    raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+
+def apply_patch(document: Any, operations: List[Dict[str, Any]]) -> Any:
+    """Apply RFC 6902 operations to a copy of ``document`` and return it
+
+    Operations are applied in order and the patch is all-or-nothing: any
+    failing operation raises and no partial result is returned.
+    """
+    document = copy.deepcopy(document)
+
+    for operation in operations:
+        op = operation.get("op")
+        path = operation.get("path")
+        if not isinstance(path, str):
+            raise JsonPatchError("Operation is missing a path")
+        tokens = _parse_pointer(path)
+        value = operation.get("value", _MISSING)
+
+        if op in ("add", "replace", "test") and value is _MISSING:
+            raise JsonPatchError(f"'{op}' operation needs a value")
+
+        if op == "add":
+            document = _add(document, tokens, copy.deepcopy(value))
+        elif op == "remove":
+            document, _ = _remove(document, tokens)
+        elif op == "replace":
+            document, _ = _remove(document, tokens) if tokens else (document, None)
+            document = _add(document, tokens, copy.deepcopy(value))
+        elif op in ("move", "copy"):
+            source = operation.get("from")
+            if not isinstance(source, str):
+                raise JsonPatchError(f"'{op}' operation needs a from path")
+            source_tokens = _parse_pointer(source)
+            if op == "move":
+                if tokens[:len(source_tokens)] == source_tokens and tokens != source_tokens:
+                    raise JsonPatchError("Cannot move a value into one of its children")
+                document, moved = _remove(document, source_tokens)
+            else:
+                moved = copy.deepcopy(_get(document, source_tokens))
+            document = _add(document, tokens, moved)
+        elif op == "test":
+            if not _json_equal(_get(document, tokens), value):
+                raise JsonPatchConflict(f"Test failed at {path}")
+        else:
+            raise JsonPatchError(f"Unsupported operation: {op!r}")
+
+    return document
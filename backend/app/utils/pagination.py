@@ -0,0 +1,86 @@
+from datetime import datetime
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+from sqlalchemy.sql import Select
+from typing import Any, List, Optional, Sequence, Tuple
+import base64
+import json
+
+from app.config import settings
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+_SQLITE = settings.DATABASE_URL.startswith("sqlite")
+
+def encode_cursor(sort_value: Optional[datetime], row_id: int) -> str:
+    """Opaque cursor pointing just past a row"""
+    raw = json.dumps([sort_value.isoformat() if sort_value else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        return (datetime.fromisoformat(sort_value) if sort_value else None), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def _bind(value: datetime) -> Any:
+    # SQLite keeps server-default timestamps as 'YYYY-MM-DD HH:MM:SS' text and
+    # compares them as strings, so the bound value has to use the same layout
+    if not _SQLITE:
+        return value
+    text = value.strftime("%Y-%m-%d %H:%M:%S")
+    if value.microsecond:
+        text += f".{value.microsecond:06d}"
+    return text
+
+def keyset_page(
+    query: Select,
+    sort_column,
+    id_column,
+    limit: int,
+    before: Optional[str],
+    nullable: bool = False
+) -> Select:
+    """Newest-first page of ``query`` ordered by (sort_column, id_column)
+
+    With ``nullable`` set, rows with a NULL sort value come last. One extra
+    row is fetched so the caller can tell whether another page exists, see
+    set_next_cursor().
+    """
+    if before:
+        sort_value, row_id = decode_cursor(before)
+        if sort_value is None:
+            query = query.where(sort_column.is_(None), id_column < row_id)
+        else:
+            bound = _bind(sort_value)
+            condition = or_(
+                sort_column < bound,
+                and_(sort_column == bound, id_column < row_id)
+            )
+            if nullable:
+                condition = or_(condition, sort_column.is_(None))
+            query = query.where(condition)
+
+    order = sort_column.desc().nulls_last() if nullable else sort_column.desc()
+    return query.order_by(order, id_column.desc()).limit(limit + 1)
+
+def set_next_cursor(
+    response: Response,
+    rows: Sequence[Any],
+    limit: int,
+    sort_attr: str
+) -> List[Any]:
+    """Trim the look-ahead row and advertise the next cursor, if any"""
+    rows = list(rows)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, sort_attr), last.id)
+    return rows
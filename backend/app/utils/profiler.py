@@ -0,0 +1,114 @@
+from collections import Counter, deque
+from typing import Dict, Optional
+import asyncio
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+class RequestProfile:
+    """Stack samples taken while one request's task was running"""
+    __slots__ = ("task", "samples")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.samples: Counter = Counter()
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack for a share of requests
+
+    A daemon thread wakes every ``interval`` seconds, looks up which task
+    the loop is running and, if that task is a profiled request, records
+    the current stack. Nothing is traced, so a profiled request runs at
+    full speed, and with ``enabled`` off the only cost is one attribute
+    check per request. Of the sampled requests, only those as slow as the
+    slowest ``slowest_percent`` of recent requests are written out, as
+    folded stacks (``frame;frame;frame count``) that flamegraph.pl and
+    speedscope read.
+
+    Work the request hands to other tasks or threads isn't attributed to it.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        sample_rate: float,
+        interval: float,
+        slowest_percent: float,
+        output_dir: str,
+        window: int = 1000
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.slowest_percent = slowest_percent
+        self.output_dir = output_dir
+        self._durations: deque = deque(maxlen=window)
+        self._active: Dict[asyncio.Task, RequestProfile] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+
+    def start(self) -> Optional[RequestProfile]:
+        """Begin profiling the current request, if it is sampled"""
+        if random.random() >= self.sample_rate:
+            return None
+        task = asyncio.current_task()
+        if task is None:
+            return None
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._thread = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+            self._thread.start()
+        profile = RequestProfile(task)
+        self._active[task] = profile
+        self._wakeup.set()
+        return profile
+
+    def stop(self, profile: RequestProfile) -> None:
+        self._active.pop(profile.task, None)
+
+    def observe(self, duration: float) -> None:
+        """Record a request's duration, profiled or not, for the slowness threshold"""
+        self._durations.append(duration)
+
+    def is_slow(self, duration: float) -> bool:
+        durations = sorted(self._durations)
+        if not durations:
+            return True
+        index = int(len(durations) * (1 - self.slowest_percent / 100))
+        return duration >= durations[min(index, len(durations) - 1)]
+
+    def save(self, profile: RequestProfile, name: str) -> Optional[str]:
+        """Write the profile's folded stacks and return the path"""
+        if not profile.samples:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, re.sub(r"[^\w.-]+", "_", name) + ".folded")
+        with open(path, "w") as f:
+            for stack, count in profile.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _sample(self) -> None:
+        from asyncio.tasks import _current_tasks
+
+        while True:
+            if not self._active:
+                self._wakeup.clear()
+                self._wakeup.wait()
+            time.sleep(self.interval)
+            profile = self._active.get(_current_tasks.get(self._loop))
+            frame = sys._current_frames().get(self._loop_thread)
+            if profile is None or frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            profile.samples[";".join(reversed(stack))] += 1
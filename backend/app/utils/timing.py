@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+import time
+
+class RequestTimings:
+    """Time spent per phase (auth, db, fal, ...) while handling one request
+
+    Phases may overlap, e.g. the user lookup's query counts towards both
+    "user" and "db", so they needn't add up to the total.
+    """
+    __slots__ = ("phases",)
+
+    def __init__(self):
+        # phase -> [seconds, count]
+        self.phases: Dict[str, List[float]] = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        entry = self.phases.get(phase)
+        if entry is None:
+            self.phases[phase] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def server_timing(self, total: float) -> str:
+        """Server-Timing header value, durations in milliseconds"""
+        metrics = [
+            f'{phase};dur={seconds * 1000:.1f};desc="{int(count)}x"'
+            for phase, (seconds, count) in self.phases.items()
+        ]
+        metrics.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(metrics)
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        return {
+            phase: {"ms": round(seconds * 1000, 2), "count": int(count)}
+            for phase, (seconds, count) in self.phases.items()
+        }
+
+# Set per request by ServerTimingMiddleware; tasks spawned from it share the object
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+def start_request_timings() -> RequestTimings:
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+def record_phase(phase: str, seconds: float) -> None:
+    """Attribute time to a phase of the current request, if there is one"""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+@contextmanager
+def timed_phase(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
@@ -0,0 +1,91 @@
+"""Latency of N image generations: N sequential single submits vs one batch
+
+Run with ``python -m benchmarks.batch_submit`` from the backend directory.
+The API runs in-process on a temporary SQLite database against a local
+fake fal server. Token verification is stubbed out (as if cached), but the
+user lookup, fal submit and database commit are real. Prints one JSON line
+per (mode, items).
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.common import free_port, percentile, run_server
+
+async def bench(base_url: str, sizes, repeat: int):
+    import httpx
+
+    from app.config import settings
+    from app.database import AsyncSessionLocal, init_db
+    from app.middleware.auth import verify_token
+    from app.models.user import User
+    from main import app
+
+    settings.FAL_QUEUE_URL = base_url
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        db.add(User(stack_user_id="bench-user", email="bench@example.com", username="bench"))
+        await db.commit()
+    app.dependency_overrides[verify_token] = lambda: {
+        "id": "bench-user", "primary_email": "bench@example.com", "display_name": "bench"
+    }
+
+    def payload(run: int, i: int) -> dict:
+        return {"prompt": f"run {run} variant {i}", "use_cache": False}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api") as client:
+        async def sequential(run: int, items: int) -> int:
+            failed = 0
+            for i in range(items):
+                response = await client.post("/api/images/generate", json=payload(run, i))
+                failed += response.status_code != 200
+            return failed
+
+        async def batch(run: int, items: int) -> int:
+            response = await client.post("/api/images/generate/batch", json={
+                "items": [payload(run, i) for i in range(items)]
+            })
+            response.raise_for_status()
+            return sum(item["status_code"] != 200 for item in response.json()["items"])
+
+        run = 0
+        for items in sizes:
+            for mode, submit in (("sequential", sequential), ("batch", batch)):
+                latencies, failed = [], 0
+                for _ in range(repeat):
+                    run += 1
+                    start = time.perf_counter()
+                    failed += await submit(run, items)
+                    latencies.append(time.perf_counter() - start)
+                print(json.dumps({
+                    "benchmark": "batch_submit",
+                    "mode": mode,
+                    "items": items,
+                    "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                    "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                    "failed_items": failed,
+                }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, nargs="+", default=[4, 16])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Before app.config is imported
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["GENERATION_POLLER_ENABLED"] = "false"
+        os.environ["ASSET_MIRROR_ENABLED"] = "false"
+        os.environ["FAL_MAX_ACTIVE_JOBS"] = "100000"
+        os.environ["GENERATION_BATCH_MAX_ITEMS"] = str(max(args.items))
+        port = free_port()
+        with run_server("benchmarks.fake_fal", port, {"FAKE_FAL_LATENCY_MS": str(args.latency_ms)}) as base_url:
+            asyncio.run(bench(base_url, args.items, args.repeat))
+
+if __name__ == "__main__":
+    main()
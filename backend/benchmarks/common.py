@@ -0,0 +1,49 @@
+"""Helpers shared by the benchmark scripts"""
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+# Settings has required fields; benchmarks run without a .env
+for name in ("STACK_AUTH_PROJECT_ID", "STACK_AUTH_SECRET_KEY", "STACK_AUTH_PUBLISHABLE_KEY", "FAL_KEY"):
+    os.environ.setdefault(name, "benchmark")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def run_server(module: str, port: int, env: Dict[str, str] = None) -> Iterator[str]:
+    """Run ``module`` as a uvicorn app in a subprocess and yield its base URL"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **(env or {})}
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{base_url}/health-probe", timeout=0.5)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait()
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
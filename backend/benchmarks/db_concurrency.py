@@ -0,0 +1,158 @@
+"""Concurrent generation reads and status writes against the database engine
+
+Run with ``python -m benchmarks.db_concurrency`` from the backend directory.
+Several worker processes (like uvicorn workers) each run many tasks that
+mostly list a user's recent generations and sometimes update one's status,
+the write the poller and webhooks do. SQLite runs twice on fresh files:
+"baseline" is the engine as it used to be created (default pool and
+journal, no pragmas) and "tuned" is app.database.make_engine. Pass
+``--postgres-url`` (needs asyncpg and a reachable server) to run the tuned
+engine against PostgreSQL as well. Prints one JSON line per run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import benchmarks.common  # noqa: F401 - default settings env
+from benchmarks.common import percentile
+
+USERS = 50
+ROWS = 5_000
+
+async def _seed(engine) -> None:
+    from sqlalchemy import delete, insert
+
+    from app.database import Base
+    from app.models import project  # noqa: F401 - register tables
+    from app.models.generation import Generation
+    from app.models.user import User
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(delete(Generation))
+        await conn.execute(delete(User))
+        await conn.execute(insert(User), [
+            {"id": i, "stack_user_id": f"user-{i}", "email": f"user-{i}@example.com", "username": f"user-{i}"}
+            for i in range(1, USERS + 1)
+        ])
+        await conn.execute(insert(Generation), [
+            {
+                "user_id": i % USERS + 1,
+                "generation_type": "image",
+                "model_name": "fal-ai/flux/schnell",
+                "prompt": f"prompt {i}",
+                "status": "processing",
+            }
+            for i in range(ROWS)
+        ])
+
+def _build_engine(mode: str, url: str):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.database import async_database_url, make_engine
+
+    if mode == "baseline":
+        return create_async_engine(async_database_url(url))
+    return make_engine(url)
+
+async def _worker(mode: str, url: str, tasks: int, seconds: float, write_ratio: float):
+    from sqlalchemy import select, update
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+    from app.models import project, user  # noqa: F401 - resolve relationships
+    from app.models.generation import Generation
+
+    engine = _build_engine(mode, url)
+    sessions = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    reads, writes, errors = [], [], {}
+    deadline = time.perf_counter() + seconds
+
+    async def loop(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            write = rng.random() < write_ratio
+            start = time.perf_counter()
+            try:
+                async with sessions() as db:
+                    if write:
+                        await db.execute(
+                            update(Generation)
+                            .where(Generation.id == rng.randint(1, ROWS))
+                            .values(status=rng.choice(("processing", "completed")))
+                        )
+                        await db.commit()
+                    else:
+                        result = await db.execute(
+                            select(Generation)
+                            .where(Generation.user_id == rng.randint(1, USERS))
+                            .order_by(Generation.created_at.desc())
+                            .limit(50)
+                        )
+                        result.scalars().all()
+            except Exception as e:
+                name = type(e.orig if hasattr(e, "orig") else e).__name__ + ": " + str(getattr(e, "orig", e))[:60]
+                errors[name] = errors.get(name, 0) + 1
+                continue
+            (writes if write else reads).append(time.perf_counter() - start)
+
+    await asyncio.gather(*(loop(os.getpid() * 1000 + i) for i in range(tasks)))
+    await engine.dispose()
+    return reads, writes, errors
+
+def _run_worker(args):
+    return asyncio.run(_worker(*args))
+
+def run(mode: str, url: str, processes: int, tasks: int, seconds: float, write_ratio: float) -> dict:
+    async def seed():
+        engine = _build_engine(mode, url)
+        await _seed(engine)
+        await engine.dispose()
+    asyncio.run(seed())
+
+    with ProcessPoolExecutor(processes) as pool:
+        results = list(pool.map(_run_worker, [(mode, url, tasks, seconds, write_ratio)] * processes))
+
+    reads = [latency for result in results for latency in result[0]]
+    writes = [latency for result in results for latency in result[1]]
+    errors = {}
+    for result in results:
+        for name, count in result[2].items():
+            errors[name] = errors.get(name, 0) + count
+
+    return {
+        "backend": url.split(":", 1)[0],
+        "mode": mode,
+        "processes": processes,
+        "tasks_per_process": tasks,
+        "ops_per_second": round((len(reads) + len(writes)) / seconds, 1),
+        "read_p50_ms": round(percentile(reads, 50) * 1000, 2),
+        "read_p99_ms": round(percentile(reads, 99) * 1000, 2),
+        "write_p50_ms": round(percentile(writes, 50) * 1000, 2),
+        "write_p99_ms": round(percentile(writes, 99) * 1000, 2),
+        "errors": errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--tasks", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--write-ratio", type=float, default=0.3)
+    parser.add_argument("--postgres-url", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("baseline", "tuned"):
+            url = f"sqlite:///{os.path.join(tmp, mode + '.db')}"
+            print(json.dumps(run(mode, url, args.processes, args.tasks, args.seconds, args.write_ratio)))
+
+    if args.postgres_url:
+        print(json.dumps(run("tuned", args.postgres_url, args.processes, args.tasks, args.seconds, args.write_ratio)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Thumbnail render throughput per core, and event loop lag while rendering
+
+Run with ``python -m benchmarks.derivatives`` from the backend directory
+(needs Pillow). Renders thumbnails of synthetic JPEGs through
+DerivativeRenderer with 1, 2, ... up to ``--max-workers`` pool processes,
+every render a cache miss. A ticker task measures how late the event loop
+wakes up meanwhile. "inline" renders on the loop itself for comparison.
+Prints one JSON line per configuration.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import benchmarks.common  # noqa: F401 - default settings env
+from benchmarks.common import percentile
+
+def make_sources(directory: str, count: int, size: int):
+    from PIL import Image
+
+    paths = []
+    for i in range(count):
+        # Noise plus a gradient: compresses like a photo, unlike a flat fill
+        image = Image.effect_noise((size, size), 40 + i % 20).convert("RGB")
+        image = Image.blend(image, Image.linear_gradient("L").resize((size, size)).convert("RGB"), 0.5)
+        path = os.path.join(directory, f"source-{i}.jpg")
+        image.save(path, "JPEG", quality=90)
+        paths.append(path)
+    return paths
+
+async def _measure_lag(stop: asyncio.Event, lags: list, interval: float = 0.005) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+async def run(sources, workers, size: int, store_dir: str) -> dict:
+    from app.services.derivatives import DerivativeRenderer
+    from app.utils import imaging
+
+    renderer = DerivativeRenderer(store_dir, workers=workers or 1, max_pending=len(sources))
+    stop, lags = asyncio.Event(), []
+    ticker = asyncio.create_task(_measure_lag(stop, lags))
+
+    start = time.perf_counter()
+    if workers is None:
+        for i, source in enumerate(sources):
+            imaging.render_image_thumbnail(source, renderer.path(f"{i:064x}", "thumbnail", size), size, 80)
+            await asyncio.sleep(0)
+    else:
+        # Start the pool outside the timed region
+        await asyncio.get_running_loop().run_in_executor(renderer._get_pool(), os.getpid)
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            renderer.get(f"{i:064x}", source, "image/jpeg", "thumbnail", size)
+            for i, source in enumerate(sources)
+        ))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await ticker
+    renderer.close()
+    processes = workers or 1
+    return {
+        "mode": "inline" if workers is None else "pool",
+        "workers": processes,
+        "renders": len(sources),
+        "renders_per_second": round(len(sources) / elapsed, 1),
+        "renders_per_second_per_core": round(len(sources) / elapsed / min(processes, os.cpu_count() or 1), 1),
+        "loop_lag_p99_ms": round(percentile(lags, 99) * 1000, 2),
+        "loop_lag_max_ms": round(max(lags, default=0.0) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--source-size", type=int, default=2048)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = make_sources(tmp, args.images, args.source_size)
+        configurations = [None] + [1 << n for n in range(args.max_workers.bit_length()) if 1 << n <= args.max_workers]
+        if args.max_workers not in configurations:
+            configurations.append(args.max_workers)
+        for workers in configurations:
+            store_dir = tempfile.mkdtemp(dir=tmp)
+            print(json.dumps(asyncio.run(run(sources, workers, args.size, store_dir))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Local stand-in for the fal queue API
+
+Run with ``python -m benchmarks.fake_fal`` from the backend directory.
+FAKE_FAL_LATENCY_MS adds latency to every response, FAKE_FAL_JOB_SECONDS
+sets how long a job stays queued or in progress, and FAKE_FAL_FAILURE_RATE
+makes that share of jobs fail. Jobs submitted with ``fal_webhook`` get a
+callback once they finish.
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from typing import Any, Dict
+import asyncio
+import httpx
+import os
+import random
+import time
+import uuid
+
+LATENCY = float(os.environ.get("FAKE_FAL_LATENCY_MS", "20")) / 1000
+JOB_SECONDS = float(os.environ.get("FAKE_FAL_JOB_SECONDS", "2"))
+FAILURE_RATE = float(os.environ.get("FAKE_FAL_FAILURE_RATE", "0"))
+
+app = FastAPI(title="Fake fal queue")
+jobs: Dict[str, Dict[str, Any]] = {}
+_webhook_tasks = set()
+
+def _result(job: Dict[str, Any]) -> Dict[str, Any]:
+    url = f"https://fake.fal.media/{job['id']}"
+    if "duration" in job["arguments"]:
+        return {"video": {"url": f"{url}.mp4"}}
+    return {"images": [{"url": f"{url}.png"}]}
+
+async def _deliver_webhook(job: Dict[str, Any], webhook_url: str) -> None:
+    await asyncio.sleep(JOB_SECONDS)
+    if job["failed"]:
+        body = {"request_id": job["id"], "status": "ERROR", "error": "Fake failure", "payload": {"detail": "Fake failure"}}
+    else:
+        body = {"request_id": job["id"], "status": "OK", "payload": _result(job)}
+    async with httpx.AsyncClient() as client:
+        await client.post(webhook_url, json=body)
+
+@app.get("/{owner}/{name}/requests/{request_id}/status")
+async def job_status(owner: str, name: str, request_id: str):
+    await asyncio.sleep(LATENCY)
+    job = jobs.get(request_id)
+    if job is None:
+        return JSONResponse({"detail": "Request not found"}, status_code=404)
+
+    elapsed = time.monotonic() - job["submitted_at"]
+    if elapsed >= JOB_SECONDS:
+        return {"status": "COMPLETED", "logs": None, "metrics": {"inference_time": JOB_SECONDS}}
+    if elapsed >= JOB_SECONDS / 2:
+        return {"status": "IN_PROGRESS", "logs": None}
+    return {"status": "IN_QUEUE", "queue_position": 0}
+
+@app.get("/{owner}/{name}/requests/{request_id}")
+async def job_result(owner: str, name: str, request_id: str):
+    await asyncio.sleep(LATENCY)
+    job = jobs.get(request_id)
+    if job is None:
+        return JSONResponse({"detail": "Request not found"}, status_code=404)
+    if job["failed"]:
+        return JSONResponse({"detail": "Fake failure"}, status_code=422)
+    return _result(job)
+
+@app.post("/{model:path}")
+async def submit(model: str, request: Request):
+    await asyncio.sleep(LATENCY)
+    request_id = str(uuid.uuid4())
+    jobs[request_id] = {
+        "id": request_id,
+        "model": model,
+        "arguments": await request.json(),
+        "submitted_at": time.monotonic(),
+        "failed": random.random() < FAILURE_RATE,
+        "webhook_url": request.query_params.get("fal_webhook"),
+    }
+
+    webhook_url = jobs[request_id]["webhook_url"]
+    if webhook_url:
+        task = asyncio.create_task(_deliver_webhook(jobs[request_id], webhook_url))
+        _webhook_tasks.add(task)
+        task.add_done_callback(_webhook_tasks.discard)
+
+    base_url = f"{request.base_url}{model}/requests/{request_id}"
+    return {
+        "request_id": request_id,
+        "response_url": base_url,
+        "status_url": f"{base_url}/status",
+        "cancel_url": f"{base_url}/cancel",
+    }
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.environ.get("FAKE_FAL_PORT", "8900")), log_level="warning")
@@ -0,0 +1,33 @@
+"""Local stand-in for Stack Auth's current-user endpoint
+
+Run with ``python -m benchmarks.fake_stack_auth`` from the backend directory.
+Any bearer token starting with FAKE_STACK_AUTH_TOKEN_PREFIX is accepted and
+names its own user: "load-user-7" is the user with id "load-user-7". Other
+tokens get 401. FAKE_STACK_AUTH_LATENCY_MS adds latency to every response.
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import asyncio
+import os
+
+LATENCY = float(os.environ.get("FAKE_STACK_AUTH_LATENCY_MS", "30")) / 1000
+TOKEN_PREFIX = os.environ.get("FAKE_STACK_AUTH_TOKEN_PREFIX", "load-user-")
+
+app = FastAPI(title="Fake Stack Auth")
+
+@app.get("/api/v1/users/me")
+async def current_user(request: Request):
+    await asyncio.sleep(LATENCY)
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token.startswith(TOKEN_PREFIX):
+        return JSONResponse({"error": "Invalid access token"}, status_code=401)
+    return {
+        "id": token,
+        "primary_email": f"{token}@example.com",
+        "display_name": token,
+        "profile_image_url": None,
+    }
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.environ.get("FAKE_STACK_AUTH_PORT", "8901")), log_level="warning")
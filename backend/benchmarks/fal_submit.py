@@ -0,0 +1,76 @@
+"""Compare fal submit throughput: thread-wrapped sync client vs the pooled async client
+
+Run with ``python -m benchmarks.fal_submit`` from the backend directory.
+Each level submits that many requests at once to a local fake fal
+server and prints one JSON line per (mode, concurrency).
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import free_port, percentile, run_server
+
+async def _timed(coro_factory, concurrency: int):
+    latencies = []
+
+    async def one():
+        start = time.perf_counter()
+        await coro_factory()
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(concurrency)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    errors = sum(1 for result in results if isinstance(result, Exception))
+    return elapsed, latencies, errors
+
+async def bench_threaded(base_url: str, concurrency: int):
+    # What FalService did before: a blocking client call per default-executor thread
+    client = httpx.Client(base_url=base_url, timeout=60)
+    try:
+        return await _timed(
+            lambda: asyncio.to_thread(client.post, "/fal-ai/flux/schnell", json={"prompt": "bench"}),
+            concurrency
+        )
+    finally:
+        client.close()
+
+async def bench_async(base_url: str, concurrency: int):
+    from app.config import settings
+    from app.services import fal_service
+
+    settings.FAL_QUEUE_URL = base_url
+    await fal_service.start_fal_client()
+    try:
+        return await _timed(
+            lambda: fal_service.FalService.generate_image(model="fal-ai/flux/schnell", prompt="bench"),
+            concurrency
+        )
+    finally:
+        await fal_service.close_fal_client()
+
+async def main(levels, latency_ms):
+    port = free_port()
+    with run_server("benchmarks.fake_fal", port, {"FAKE_FAL_LATENCY_MS": str(latency_ms)}) as base_url:
+        for concurrency in levels:
+            for mode, bench in (("threaded", bench_threaded), ("async", bench_async)):
+                elapsed, latencies, errors = await bench(base_url, concurrency)
+                print(json.dumps({
+                    "benchmark": "fal_submit",
+                    "mode": mode,
+                    "concurrency": concurrency,
+                    "throughput_rps": round(concurrency / elapsed, 1),
+                    "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                    "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                    "errors": errors,
+                }))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--levels", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.levels, args.latency_ms))
@@ -0,0 +1,176 @@
+"""Time generation listings on a large seeded SQLite database
+
+Run with ``python -m benchmarks.list_pagination`` from the backend directory.
+Seeds ``--rows`` generations (default 1M) spread over ``--users`` users, with
+one heavy user owning ``--heavy-share`` of them, then walks the heavy user's
+image history page by page through the real endpoint and prints one JSON
+line per scenario: the old unpaginated query, and keyset pages with and
+without the composite index.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import percentile
+
+HEAVY_USER = "heavy"
+
+def seed(path: str, rows: int, users: int, heavy_share: float) -> None:
+    from sqlalchemy import create_engine
+
+    from app.database import Base
+    from app.models import generation, project, user  # noqa: F401 - register tables
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO users (id, stack_user_id, email, username, is_active, is_premium) VALUES (?, ?, ?, ?, 1, 0)",
+        [
+            (i, HEAVY_USER if i == 1 else f"user-{i}", f"user-{i}@example.com", f"user-{i}")
+            for i in range(1, users + 1)
+        ]
+    )
+
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    batch = []
+    for i in range(rows):
+        user_id = 1 if rng.random() < heavy_share else rng.randint(2, users)
+        # Several rows per second, so pages regularly split a timestamp tie
+        created_at = (start + timedelta(seconds=i // 4)).strftime("%Y-%m-%d %H:%M:%S")
+        batch.append((
+            user_id,
+            "image" if rng.random() < 0.8 else "video",
+            "fal-ai/flux/schnell",
+            f"prompt {i}",
+            "completed",
+            f"https://example.com/{i}.png",
+            created_at
+        ))
+        if len(batch) == 50_000:
+            conn.executemany(
+                "INSERT INTO generations (user_id, generation_type, model_name, prompt, status, result_url, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            batch.clear()
+    if batch:
+        conn.executemany(
+            "INSERT INTO generations (user_id, generation_type, model_name, prompt, status, result_url, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            batch
+        )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+async def time_unpaginated(samples: int):
+    from sqlalchemy import select
+
+    from app.database import AsyncSessionLocal
+    from app.models.generation import Generation
+
+    latencies = []
+    count = 0
+    for _ in range(samples):
+        async with AsyncSessionLocal() as db:
+            start = time.perf_counter()
+            # The listing query before pagination
+            result = await db.execute(
+                select(Generation)
+                .where(Generation.user_id == 1)
+                .where(Generation.generation_type == "image")
+                .order_by(Generation.created_at.desc())
+            )
+            count = len(result.scalars().all())
+            latencies.append(time.perf_counter() - start)
+    return latencies, count
+
+async def time_pages(pages: int, limit: int):
+    import httpx
+
+    import main
+    from app.middleware.auth import get_current_user
+
+    main.app.dependency_overrides[get_current_user] = lambda: {"id": HEAVY_USER}
+    latencies = []
+    seen = set()
+    duplicates = 0
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        cursor = None
+        for _ in range(pages):
+            params = {"limit": limit}
+            if cursor:
+                params["before"] = cursor
+            start = time.perf_counter()
+            response = await client.get("/api/images/generations", params=params)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+            for item in response.json():
+                duplicates += item["id"] in seen
+                seen.add(item["id"])
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+    return latencies, len(seen), duplicates
+
+def report(scenario: str, latencies, **extra) -> None:
+    print(json.dumps({
+        "scenario": scenario,
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        **extra
+    }))
+
+async def run(args, path: str) -> None:
+    from app.database import engine
+
+    engine.echo = False
+
+    latencies, count = await time_unpaginated(args.full_samples)
+    report("unpaginated", latencies, rows=count)
+
+    latencies, count, duplicates = await time_pages(args.pages, args.limit)
+    report("keyset", latencies, limit=args.limit, rows=count, duplicates=duplicates)
+
+    conn = sqlite3.connect(path)
+    conn.execute("DROP INDEX ix_generations_user_type_created")
+    conn.commit()
+    conn.close()
+    await engine.dispose()
+
+    latencies, count, duplicates = await time_pages(args.pages, args.limit)
+    report("keyset_without_index", latencies, limit=args.limit, rows=count, duplicates=duplicates)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--heavy-share", type=float, default=0.1)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--full-samples", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        # The app reads its database URL at import time
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+        started = time.perf_counter()
+        seed(path, args.rows, args.users, args.heavy_share)
+        print(json.dumps({"seeded_rows": args.rows, "seconds": round(time.perf_counter() - started, 1)}))
+        asyncio.run(run(args, path))
+
+if __name__ == "__main__":
+    main()
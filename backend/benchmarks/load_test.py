@@ -0,0 +1,331 @@
+"""End-to-end load test: the real app under a mix of user traffic
+
+Run with ``python -m benchmarks.load_test`` from the backend directory.
+Seeds a database (a temporary SQLite file unless ``--database-url`` names
+a scratch database, e.g. Postgres), then starts fake Stack Auth and fal
+servers and the app itself under uvicorn, each in its own process.
+``--concurrency`` virtual users then run for ``--duration`` seconds,
+each repeatedly picking a request from the ``--mix`` weights:
+
+    generate      POST /api/images/generate (fresh prompt, no cache)
+    status        GET  /api/images/generations/{id}/status
+    list          GET  /api/images/generations?limit=20
+    projects      GET  /api/projects/
+    project_save  PATCH /api/projects/{id} with If-Match
+
+Prints one JSON line per endpoint (throughput, p50/p95/p99, errors) and a
+summary line, all tagged with the git commit, so runs can be diffed:
+``--output run.jsonl`` also appends them to a file, and
+``--compare base.jsonl run.jsonl`` prints the change in each endpoint's
+throughput and latency percentiles between two such files.
+
+Client and server share the machine, so compare runs from the same host.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+import benchmarks.common  # noqa: F401 - default settings env
+from benchmarks.common import BACKEND_DIR, free_port, percentile, run_server
+
+DEFAULT_MIX = "generate=1,status=6,list=3,projects=1,project_save=2"
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+def _project_document(layers: int) -> dict:
+    return {
+        "canvas": {"width": 1920, "height": 1080, "background": "#ffffff"},
+        "layers": [
+            {"id": f"layer-{i}", "type": "image", "x": i * 10, "y": i * 5, "opacity": 1.0,
+             "src": f"https://example.com/assets/{i}.png", "filters": {"blur": 0, "brightness": 1.0}}
+            for i in range(layers)
+        ],
+    }
+
+async def seed(users: int, generations_per_user: int, projects_per_user: int) -> Dict[str, Dict[str, List[int]]]:
+    """Insert users, completed generations and projects
+
+    Returns the generation and project ids of each user, by token.
+    """
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import insert, select
+
+    from app.database import AsyncSessionLocal, engine, init_db
+    from app.models.generation import Generation
+    from app.models.project import Project
+    from app.models.user import User
+
+    await init_db()
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(User), [
+            {"stack_user_id": f"load-user-{i}", "email": f"load-user-{i}@example.com", "username": f"load-user-{i}"}
+            for i in range(users)
+        ])
+        user_ids = dict((await db.execute(select(User.stack_user_id, User.id))).all())
+        for stack_user_id, user_id in user_ids.items():
+            await db.execute(insert(Generation), [
+                {
+                    "user_id": user_id, "generation_type": "image", "model_name": "fal-ai/flux/schnell",
+                    "prompt": f"seeded prompt {n}", "status": "completed", "parameters": "{}",
+                    "result_url": f"https://fake.fal.media/{stack_user_id}-{n}.png",
+                    "created_at": start + timedelta(minutes=n), "completed_at": start + timedelta(minutes=n, seconds=3),
+                }
+                for n in range(generations_per_user)
+            ])
+            await db.execute(insert(Project), [
+                {"user_id": user_id, "name": f"Project {n}", "project_type": "design", "data": _project_document(20)}
+                for n in range(projects_per_user)
+            ])
+        await db.commit()
+
+        generations = defaultdict(list)
+        projects = defaultdict(list)
+        stack_ids = {user_id: stack_user_id for stack_user_id, user_id in user_ids.items()}
+        for user_id, generation_id in (await db.execute(select(Generation.user_id, Generation.id))).all():
+            generations[stack_ids[user_id]].append(generation_id)
+        for user_id, project_id in (await db.execute(select(Project.user_id, Project.id))).all():
+            projects[stack_ids[user_id]].append(project_id)
+    await engine.dispose()
+    return {"generations": generations, "projects": projects}
+
+class VirtualUser:
+    """One signed-in user clicking through the app, one request at a time"""
+
+    def __init__(self, client, token: str, generation_ids: List[int], project_ids: List[int], rng: random.Random):
+        self.client = client
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.token = token
+        self.generation_ids = list(generation_ids[-20:])
+        self.project_ids = project_ids
+        self.project_versions: Dict[int, int] = {}
+        self.rng = rng
+        self.submitted = 0
+
+    async def generate(self):
+        self.submitted += 1
+        response = await self.client.post("/api/images/generate", headers=self.headers, json={
+            "prompt": f"{self.token} prompt {self.submitted} {self.rng.random()}", "use_cache": False
+        })
+        if response.status_code == 200:
+            self.generation_ids.append(response.json()["id"])
+        return response
+
+    async def status(self):
+        generation_id = self.rng.choice(self.generation_ids)
+        return await self.client.get(f"/api/images/generations/{generation_id}/status", headers=self.headers)
+
+    async def list(self):
+        return await self.client.get("/api/images/generations", params={"limit": 20}, headers=self.headers)
+
+    async def projects(self):
+        return await self.client.get("/api/projects/", headers=self.headers)
+
+    async def project_save(self):
+        project_id = self.rng.choice(self.project_ids)
+        version = self.project_versions.get(project_id)
+        headers = {**self.headers, "Content-Type": "application/json-patch+json"}
+        if version is not None:
+            headers["If-Match"] = f'"{version}"'
+        layer = self.rng.randrange(20)
+        response = await self.client.patch(f"/api/projects/{project_id}", headers=headers, content=json.dumps([
+            {"op": "replace", "path": f"/layers/{layer}/x", "value": self.rng.randrange(1920)},
+            {"op": "replace", "path": f"/layers/{layer}/opacity", "value": round(self.rng.random(), 2)},
+        ]))
+        if response.status_code == 200:
+            self.project_versions[project_id] = response.json()["version"]
+        elif response.status_code == 409:
+            # Someone else's save won: start from the current version next time
+            self.project_versions.pop(project_id, None)
+        return response
+
+async def drive(base_url: str, seeded, args) -> List[dict]:
+    import httpx
+
+    mix = _parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    samples: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    tokens = sorted(seeded["generations"])
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        async def run_user(index: int, deadline: float):
+            rng = random.Random(index)
+            token = tokens[index % len(tokens)]
+            user = VirtualUser(client, token, seeded["generations"][token], seeded["projects"][token], rng)
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await getattr(user, name)()
+                    code = response.status_code
+                except httpx.HTTPError:
+                    code = 0
+                samples[name].append(time.perf_counter() - started)
+                statuses[name][code] += 1
+                # 409 is a save losing a race, not a server error
+                if code == 0 or (code >= 400 and code != 409):
+                    errors[name] += 1
+                if args.think_ms:
+                    await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+
+        # Warm-up traffic isn't measured: the token cache and pools fill first
+        warm_up = time.perf_counter() + args.warm_up
+        await asyncio.gather(*(run_user(i, warm_up) for i in range(args.concurrency)))
+        samples.clear()
+        errors.clear()
+        statuses.clear()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_user(i, started + args.duration) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    results = []
+    for name in names:
+        latencies = samples.get(name, [])
+        results.append({
+            "endpoint": name,
+            "requests": len(latencies),
+            "errors": errors.get(name, 0),
+            "statuses": {str(code): count for code, count in sorted(statuses[name].items())},
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        })
+    everything = [latency for latencies in samples.values() for latency in latencies]
+    results.append({
+        "endpoint": "all",
+        "requests": len(everything),
+        "errors": sum(errors.values()),
+        "rps": round(len(everything) / elapsed, 1),
+        "p50_ms": round(percentile(everything, 50) * 1000, 2),
+        "p95_ms": round(percentile(everything, 95) * 1000, 2),
+        "p99_ms": round(percentile(everything, 99) * 1000, 2),
+    })
+    return results
+
+def _wait_healthy(base_url: str, timeout: float = 30.0) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("App did not become healthy")
+
+def compare(base_path: str, run_path: str) -> None:
+    def load(path: str) -> Dict[str, dict]:
+        with open(path) as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        # The last run in the file wins
+        return {line["endpoint"]: line for line in lines if line.get("benchmark") == "load_test"}
+
+    base, run = load(base_path), load(run_path)
+    for endpoint, after in run.items():
+        before = base.get(endpoint)
+        if before is None:
+            continue
+        change = {"benchmark": "load_test_compare", "endpoint": endpoint,
+                  "base_commit": before.get("commit"), "commit": after.get("commit")}
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            change[metric] = after[metric]
+            change[f"{metric}_change_pct"] = (
+                round((after[metric] - before[metric]) / before[metric] * 100, 1) if before[metric] else None
+            )
+        print(json.dumps(change))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warm-up", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a user's requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--generations-per-user", type=int, default=200)
+    parser.add_argument("--projects-per-user", type=int, default=5)
+    parser.add_argument("--database-url", help="scratch database to seed; default a temporary SQLite file")
+    parser.add_argument("--auth-latency-ms", type=float, default=30)
+    parser.add_argument("--fal-latency-ms", type=float, default=50)
+    parser.add_argument("--fal-job-seconds", type=float, default=5)
+    parser.add_argument("--rate-limit", action="store_true", help="keep the app's rate limiter on")
+    parser.add_argument("--output", help="also append the result lines to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "RUN"), help="compare two --output files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Before app.config is imported, here and in the app process
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmp, 'load.db')}"
+        seeded = asyncio.run(seed(args.users, args.generations_per_user, args.projects_per_user))
+
+        fal_port, auth_port, app_port = free_port(), free_port(), free_port()
+        with run_server("benchmarks.fake_fal", fal_port, {
+            "FAKE_FAL_LATENCY_MS": str(args.fal_latency_ms),
+            "FAKE_FAL_JOB_SECONDS": str(args.fal_job_seconds),
+        }) as fal_url, run_server("benchmarks.fake_stack_auth", auth_port, {
+            "FAKE_STACK_AUTH_LATENCY_MS": str(args.auth_latency_ms),
+        }) as auth_url, run_server("main", app_port, {
+            "FAL_QUEUE_URL": fal_url,
+            "STACK_AUTH_API_URL": auth_url,
+            "STACK_AUTH_VERIFICATION_MODE": "remote",
+            "RATE_LIMIT_ENABLED": str(args.rate_limit).lower(),
+            # Results point at fake URLs there is nothing to download from
+            "ASSET_MIRROR_ENABLED": "false",
+            "FAL_MAX_ACTIVE_JOBS": "100000",
+            "FAL_MAX_QUEUE_DEPTH": "100000",
+            "FAL_MAX_QUEUED_PER_USER": "100000",
+            "ASSET_STORE_DIR": os.path.join(tmp, "assets"),
+            "DERIVATIVE_STORE_DIR": os.path.join(tmp, "derivatives"),
+        }) as app_url:
+            _wait_healthy(app_url)
+            results = asyncio.run(drive(app_url, seeded, args))
+
+    meta = {
+        "benchmark": "load_test",
+        "commit": _git_commit(),
+        "database": "postgresql" if (args.database_url or "").startswith("postgres") else "sqlite",
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "mix": args.mix,
+    }
+    lines = [json.dumps({**meta, **result}) for result in results]
+    for line in lines:
+        print(line)
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Per-request cost of RateLimitMiddleware, by bucket store
+
+Run with ``python -m benchmarks.rate_limit`` from the backend directory.
+Drives the middleware directly over ASGI in front of an app that does
+nothing, so the timings are the limiter's own overhead: route matching,
+the client key and the store round trip. "none" is the bare app. Requests
+come from ``--users`` distinct users with verified (cached) tokens and are
+never rejected. Prints one JSON line per store.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import benchmarks.common  # noqa: F401 - default settings env
+from benchmarks.common import percentile
+
+async def _noop_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+async def run(name: str, store, requests: int, users: int) -> dict:
+    from app.middleware.auth import _token_key, token_cache
+    from app.middleware.rate_limit import RateLimitMiddleware, parse_rule
+
+    rules = {"status": parse_rule("status", f"{requests * 10}/second")}
+    app = _noop_app if store is None else RateLimitMiddleware(_noop_app, store=store, rules=rules)
+    scopes = []
+    for user in range(users):
+        token_cache.set(_token_key(f"bench-token-{user}"), {"id": f"bench-user-{user}"})
+        scopes.append({
+            "type": "http",
+            "method": "GET",
+            "path": f"/api/images/generations/{user + 1}/status",
+            "headers": [(b"authorization", f"Bearer bench-token-{user}".encode())],
+            "client": ("127.0.0.1", 50000),
+        })
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        await app(scopes[i % users], receive, send)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "benchmark": "rate_limit",
+        "store": name,
+        "users": users,
+        "requests": requests,
+        "p50_us": round(percentile(latencies, 50) * 1e6, 2),
+        "p99_us": round(percentile(latencies, 99) * 1e6, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    from app.middleware.rate_limit import LocalScriptClient, MemoryBucketStore, SharedBucketStore
+
+    stores = [
+        ("none", None),
+        ("memory", MemoryBucketStore()),
+        ("local", SharedBucketStore(LocalScriptClient())),
+    ]
+    for name, store in stores:
+        print(json.dumps(asyncio.run(run(name, store, args.requests, args.users))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Time turning a page of Generation rows into response bytes
+
+Run with ``python -m benchmarks.serialization`` from the backend directory.
+"before" is what the list endpoints used to do: build GenerationResponse
+objects by hand, then let FastAPI validate them against response_model and
+encode with the stdlib JSON encoder. "after" is the RowSerializer fast path.
+Prints one JSON line per path; both must produce the same document.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+import benchmarks.common  # noqa: F401 - default settings env
+from benchmarks.common import percentile
+
+def make_rows(count: int):
+    from app.models import project, user  # noqa: F401 - resolve relationships
+    from app.models.generation import Generation
+
+    now = datetime.now(timezone.utc)
+    return [
+        Generation(
+            id=i,
+            user_id=1,
+            generation_type="image",
+            model_name="fal-ai/flux/schnell",
+            prompt=f"a watercolor painting of a lighthouse at dusk, variation {i}",
+            fal_request_id=f"{i:08d}-0000-4000-8000-000000000000",
+            status="completed" if i % 10 else "failed",
+            result_url=f"https://fal.media/files/{i}.png" if i % 10 else None,
+            error_message=None if i % 10 else "Generation failed",
+            created_at=now,
+            completed_at=now
+        )
+        for i in range(count)
+    ]
+
+def before(rows, response_field) -> bytes:
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+
+    from app.schemas.generation import GenerationResponse
+
+    items = [
+        GenerationResponse(
+            id=gen.id,
+            request_id=gen.fal_request_id,
+            status=gen.status,
+            generation_type=gen.generation_type,
+            model_name=gen.model_name,
+            prompt=gen.prompt,
+            result_url=gen.result_url,
+            error_message=gen.error_message,
+            created_at=gen.created_at,
+            completed_at=gen.completed_at
+        )
+        for gen in rows
+    ]
+    content = asyncio.run(serialize_response(field=response_field, response_content=items, is_coroutine=True))
+    return JSONResponse(content).body
+
+def after(rows, response_field) -> bytes:
+    from app.schemas.generation import generation_serializer
+    from app.utils.serialization import json_response
+
+    return json_response(generation_serializer.dumps(rows)).body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    from main import app
+
+    route = next(route for route in app.routes if getattr(route, "path", None) == "/api/images/generations")
+    rows = make_rows(args.items)
+
+    outputs = {}
+    for name, serialize in (("before", before), ("after", after)):
+        serialize(rows, route.response_field)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            outputs[name] = serialize(rows, route.response_field)
+            timings.append(time.perf_counter() - start)
+        print(json.dumps({
+            "path": name,
+            "items": args.items,
+            "bytes": len(outputs[name]),
+            "p50_ms": round(percentile(timings, 50) * 1000, 2),
+            "p99_ms": round(percentile(timings, 99) * 1000, 2),
+        }))
+
+    assert json.loads(outputs["before"]) == json.loads(outputs["after"]), "fast path output differs"
+
+if __name__ == "__main__":
+    main()
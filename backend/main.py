@@ -1,29 +1,66 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import uvicorn
 from contextlib import asynccontextmanager
+import argparse
 
 from app.config import settings
-from app.routers import auth, images, videos, projects
-from app.middleware.auth import verify_token
-from app.database import init_db
+from app.routers import auth, images, videos, projects, generations, webhooks, assets
+from app.middleware.auth import verify_token, close_auth_client
+from app.middleware.deadline import DeadlineMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.server_timing import ServerTimingMiddleware
+from app.middleware.rate_limit import RATE_LIMIT_HEADERS, RateLimitMiddleware
+from app.database import init_db, count_queries
+from app.metrics import generation_counts, metrics_access_allowed, render_metrics
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.utils.serialization import TimedJSONResponse
+from app.services.asset_mirror import asset_mirror
+from app.services.derivatives import derivative_renderer
+from app.services.fal_service import close_fal_client
+from app.services.fal_scheduler import fal_scheduler
+from app.services.generation_poller import generation_poller
+from app.services.outbound import breaker_states
+from app.startup import startup, warm_pools
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    await init_db()
+    # Startup: only what the first request depends on; the HTTP clients and
+    # database pool warm up in the background and gate /health
+    async with startup.step("init_db"):
+        await init_db()
+    async with startup.step("fal_scheduler"):
+        await fal_scheduler.start()
+    if settings.GENERATION_POLLER_ENABLED:
+        await generation_poller.start()
+    if settings.ASSET_MIRROR_ENABLED:
+        await asset_mirror.start()
+    startup.begin_warm_up(warm_pools())
     yield
     # Shutdown
-    pass
+    await startup.cancel_warm_up()
+    await asset_mirror.stop()
+    derivative_renderer.close()
+    await generation_poller.stop()
+    await fal_scheduler.stop()
+    await close_fal_client()
+    await close_auth_client()
 
 app = FastAPI(
     title="Mode Design API",
     description="Backend API for Mode Design - AI-powered creative platform",
     version="1.0.0",
+    default_response_class=TimedJSONResponse,
     lifespan=lifespan
 )
 
+app.add_middleware(DeadlineMiddleware, seconds=settings.REQUEST_DEADLINE_SECONDS)
+
+# Added before CORS so CORS wraps it and 429s carry CORS headers too
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -31,13 +68,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, *RATE_LIMIT_HEADERS, "Retry-After", "Server-Timing"],
 )
 
+if settings.DB_QUERY_COUNT_HEADER:
+    @app.middleware("http")
+    async def query_count_header(request: Request, call_next):
+        counter = count_queries()
+        response = await call_next(request)
+        response.headers["X-DB-Query-Count"] = str(counter[0])
+        return response
+
+if settings.SERVER_TIMING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+
+# Outermost, so the timings cover the other middleware and their 429s too
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(images.router, prefix="/api/images", tags=["Images"])
 app.include_router(videos.router, prefix="/api/videos", tags=["Videos"])
 app.include_router(projects.router, prefix="/api/projects", tags=["Projects"])
+app.include_router(generations.router, prefix="/api/generations", tags=["Generations"])
+app.include_router(webhooks.router, prefix="/api/webhooks", tags=["Webhooks"])
+app.include_router(assets.router, prefix="/api/assets", tags=["Assets"])
 
 @app.get("/")
 async def root():
@@ -45,12 +101,42 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    """Healthy once the warm-up has opened the client and database pools
+
+    Also reports the outbound circuit breakers, which don't affect health:
+    an open breaker means fal or Stack Auth is down, not this worker.
+    """
+    if not startup.ready:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "starting", "error": startup.error}
+        )
+    return {"status": "healthy", "dependencies": breaker_states()}
+
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics(request: Request):
+        """Prometheus scrape endpoint, for METRICS_TOKEN holders or the scraper's network"""
+        client_host = request.client.host if request.client else None
+        if not metrics_access_allowed(request.headers.get("authorization"), client_host):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
+        await generation_counts.refresh()
+        body, content_type = render_metrics()
+        return Response(content=body, headers={"Content-Type": content_type})
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile-startup", action="store_true", help="print import and lifespan timings and exit")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from app.startup import profile_startup
+        profile_startup(app)
+    else:
+        import uvicorn
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True
+        )
\ No newline at end of file
@@ -0,0 +1,51 @@
+from logging.config import fileConfig
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine
+import asyncio
+
+from alembic import context
+
+from app.config import settings
+from app.database import Base, async_database_url
+from app.models import asset, generation, project, usage, user  # noqa: F401 - register tables
+
+config = context.config
+target_metadata = Base.metadata
+
+def run_migrations_offline() -> None:
+    """Emit the SQL instead of running it (``alembic upgrade head --sql``)"""
+    context.configure(
+        url=async_database_url(settings.DATABASE_URL),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=True
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def do_run_migrations(connection) -> None:
+    # Batch mode lets SQLite alter columns by copying the table
+    context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+async def run_async_migrations() -> None:
+    connectable = create_async_engine(async_database_url(settings.DATABASE_URL), poolclass=NullPool)
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await connectable.dispose()
+
+def run_migrations_online() -> None:
+    # init_db passes in the connection it holds; the CLI opens its own
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        do_run_migrations(connection)
+        return
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    asyncio.run(run_async_migrations())
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,181 @@
+"""listing indexes, cache and mirror columns, project versions, usage stats
+
+Brings a database created before these features up to the current
+models:
+
+- generations: cache_key (reuse of identical generations), asset_sha256
+  (local mirror), updated_at (list ETags), the fal_request_id index and the
+  listing indexes
+- projects: version (optimistic saves and ETags), a server default for
+  updated_at, and the listing index
+- assets, and the usage stats tables, filled from generation history
+
+Each step is skipped when its column, index or table already exists, so a
+database create_all made after some of these changes upgrades cleanly.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from collections import Counter
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _add_column(table: str, column: sa.Column) -> bool:
+    if column.name in {c["name"] for c in _inspector().get_columns(table)}:
+        return False
+    op.add_column(table, column)
+    return True
+
+
+def _create_index(name: str, table: str, columns, **kwargs) -> None:
+    if name not in {i["name"] for i in _inspector().get_indexes(table)}:
+        op.create_index(name, table, columns, **kwargs)
+
+
+def _create_table(name: str, *columns, **kwargs) -> bool:
+    if _inspector().has_table(name):
+        return False
+    op.create_table(name, *columns, **kwargs)
+    return True
+
+
+def _stats_key_columns():
+    return [
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("generation_type", sa.String(), nullable=False),
+        sa.Column("model_name", sa.String(), nullable=False),
+    ]
+
+
+def upgrade() -> None:
+    _add_column("generations", sa.Column("cache_key", sa.String(), nullable=True))
+    _add_column("generations", sa.Column("asset_sha256", sa.String(), nullable=True))
+    if _add_column("generations", sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True)):
+        op.execute("UPDATE generations SET updated_at = COALESCE(completed_at, created_at)")
+    _create_index("ix_generations_cache_key", "generations", ["cache_key"])
+    _create_index("ix_generations_fal_request_id", "generations", ["fal_request_id"])
+    _create_index("ix_generations_user_type_created", "generations", ["user_id", "generation_type", "created_at"])
+    _create_index("ix_generations_user_type_updated", "generations", ["user_id", "generation_type", "updated_at"])
+
+    _add_column("projects", sa.Column("version", sa.Integer(), server_default="1", nullable=False))
+    op.execute("UPDATE projects SET updated_at = created_at WHERE updated_at IS NULL")
+    with op.batch_alter_table("projects") as batch:
+        batch.alter_column(
+            "updated_at",
+            existing_type=sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            existing_nullable=True
+        )
+    _create_index("ix_projects_user_updated", "projects", ["user_id", "updated_at"])
+
+    _create_table(
+        "assets",
+        sa.Column("sha256", sa.String(), nullable=False),
+        sa.Column("content_type", sa.String(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint("sha256"),
+    )
+
+    stats_created = _create_table(
+        "user_generation_stats",
+        *_stats_key_columns(),
+        sa.Column("completed_count", sa.Integer(), nullable=False),
+        sa.Column("failed_count", sa.Integer(), nullable=False),
+        sa.Column("total_cost", sa.Float(), nullable=False),
+        sa.Column("processing_time_count", sa.Integer(), nullable=False),
+        sa.Column("processing_time_total", sa.Float(), nullable=False),
+        sa.Column("last_finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id", "generation_type", "model_name"),
+    )
+    buckets_created = _create_table(
+        "user_generation_processing_time_buckets",
+        *_stats_key_columns(),
+        sa.Column("bucket", sa.Integer(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id", "generation_type", "model_name", "bucket"),
+    )
+    if stats_created and buckets_created:
+        _backfill_usage_stats()
+
+
+def _backfill_usage_stats() -> None:
+    """Same totals as ``python -m app.services.usage_stats``, in this transaction"""
+    from app.services.usage_stats import sketch_bucket
+
+    bind = op.get_bind()
+    op.execute(
+        sa.text(
+            "INSERT INTO user_generation_stats (user_id, generation_type, model_name, completed_count,"
+            " failed_count, total_cost, processing_time_count, processing_time_total, last_finished_at)"
+            " SELECT user_id, generation_type, model_name,"
+            " SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END),"
+            " SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END),"
+            " COALESCE(SUM(cost), 0.0), COUNT(processing_time), COALESCE(SUM(processing_time), 0.0),"
+            " MAX(completed_at)"
+            " FROM generations WHERE status IN ('completed', 'failed')"
+            " GROUP BY user_id, generation_type, model_name"
+        )
+    )
+
+    # SQL has no portable log(), so the sketch buckets are counted here
+    buckets: Counter = Counter()
+    rows = bind.execute(sa.text(
+        "SELECT user_id, generation_type, model_name, processing_time FROM generations"
+        " WHERE status IN ('completed', 'failed') AND processing_time IS NOT NULL"
+    ))
+    for user_id, generation_type, model_name, processing_time in rows:
+        buckets[(user_id, generation_type, model_name, sketch_bucket(processing_time))] += 1
+    if buckets:
+        table = sa.table(
+            "user_generation_processing_time_buckets",
+            sa.column("user_id"), sa.column("generation_type"), sa.column("model_name"),
+            sa.column("bucket"), sa.column("count")
+        )
+        op.bulk_insert(table, [
+            dict(user_id=user_id, generation_type=generation_type, model_name=model_name, bucket=bucket, count=count)
+            for (user_id, generation_type, model_name, bucket), count in buckets.items()
+        ])
+
+
+def downgrade() -> None:
+    op.drop_table("user_generation_processing_time_buckets")
+    op.drop_table("user_generation_stats")
+    op.drop_table("assets")
+
+    op.drop_index("ix_projects_user_updated", table_name="projects")
+    with op.batch_alter_table("projects") as batch:
+        batch.alter_column(
+            "updated_at",
+            existing_type=sa.DateTime(timezone=True),
+            server_default=None,
+            existing_nullable=True
+        )
+        batch.drop_column("version")
+
+    op.drop_index("ix_generations_user_type_updated", table_name="generations")
+    op.drop_index("ix_generations_user_type_created", table_name="generations")
+    op.drop_index("ix_generations_fal_request_id", table_name="generations")
+    op.drop_index("ix_generations_cache_key", table_name="generations")
+    with op.batch_alter_table("generations") as batch:
+        batch.drop_column("updated_at")
+        batch.drop_column("asset_sha256")
+        batch.drop_column("cache_key")
@@ -0,0 +1,56 @@
+"""Shared fixtures; run with ``python -m pytest`` from the backend directory
+
+Settings are read when app.config is first imported, so the test
+environment is set up here, before any test module imports the app.
+"""
+import os
+import tempfile
+
+_tmp_dir = tempfile.mkdtemp(prefix="mode-design-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_tmp_dir}/test.db",
+    STACK_AUTH_PROJECT_ID="test-project",
+    STACK_AUTH_SECRET_KEY="test-secret-key",
+    STACK_AUTH_PUBLISHABLE_KEY="test-publishable-key",
+    FAL_KEY="test-fal-key",
+    FAL_QUEUE_URL="http://fake-fal",
+    FAL_WEBHOOK_BASE_URL="http://testserver",
+    FAL_WEBHOOK_SECRET="test-webhook-secret",
+    GENERATION_POLLER_ENABLED="false",
+    ASSET_MIRROR_ENABLED="false",
+    RATE_LIMIT_ENABLED="false",
+    ASSET_STORE_DIR=f"{_tmp_dir}/assets",
+    DERIVATIVE_STORE_DIR=f"{_tmp_dir}/derivatives",
+    PROFILER_OUTPUT_DIR=f"{_tmp_dir}/profiles",
+    FAKE_FAL_LATENCY_MS="0",
+    FAKE_FAL_JOB_SECONDS="3600",  # tests deliver callbacks themselves
+)
+
+import pytest
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def db():
+    """A session on a freshly created schema"""
+    from app.database import AsyncSessionLocal, Base, engine
+    from app.models import asset, generation, project, usage, user  # noqa: F401 - register tables
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as session:
+        yield session
+    # Pooled connections belong to this test's event loop
+    await engine.dispose()
+
+@pytest.fixture
+async def user(db):
+    from app.models.user import User
+
+    row = User(stack_user_id="stack-user-1", email="user@example.com", username="user")
+    db.add(row)
+    await db.commit()
+    return row
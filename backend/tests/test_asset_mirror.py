@@ -0,0 +1,39 @@
+import httpx
+import pytest
+
+from app.services.asset_mirror import AssetHostNotAllowed, AssetMirror
+
+pytestmark = pytest.mark.anyio
+
+def _mirror(tmp_path) -> AssetMirror:
+    return AssetMirror(
+        store_dir=str(tmp_path),
+        concurrency=1,
+        queue_size=10,
+        backfill_limit=0,
+        max_bytes=1024,
+        timeout=5,
+        allowed_hosts=["fal.media"]
+    )
+
+def test_mirror_host_allowlist(tmp_path):
+    mirror = _mirror(tmp_path)
+
+    assert mirror.url_allowed("https://fal.media/files/a.png")
+    assert mirror.url_allowed("https://v3.fal.media/files/a.png")
+    assert not mirror.url_allowed("https://evilfal.media/a.png")
+    assert not mirror.url_allowed("http://169.254.169.254/latest/meta-data/")
+    assert not mirror.url_allowed("file:///etc/passwd")
+
+async def test_mirror_refuses_redirects_off_the_allowlist(tmp_path):
+    mirror = _mirror(tmp_path)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "v3.fal.media":
+            return httpx.Response(302, headers={"Location": "http://169.254.169.254/latest/meta-data/"})
+        return httpx.Response(200, content=b"secret")
+
+    mirror._get_client()._transport = httpx.MockTransport(handler)
+    with pytest.raises(AssetHostNotAllowed):
+        await mirror._download("https://v3.fal.media/files/a.png")
+    await mirror.stop()
@@ -0,0 +1,132 @@
+import time
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from fastapi import HTTPException
+from jose import jwk, jwt
+
+from app.config import settings
+from app.middleware import auth
+
+pytestmark = pytest.mark.anyio
+
+def _key_pair(algorithm: str):
+    if algorithm == "ES256":
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_pem, public_pem
+
+def _jwk(public_pem: bytes, algorithm: str, kid: str) -> dict:
+    key_data = jwk.construct(public_pem, algorithm).to_dict()
+    return {**key_data, "kid": kid, "alg": algorithm}
+
+def _token(private_pem: bytes, algorithm: str, kid: str, **claims) -> str:
+    claims = {
+        "sub": "stack-user-1",
+        "aud": settings.STACK_AUTH_PROJECT_ID,
+        "exp": int(time.time()) + 300,
+        **claims,
+    }
+    return jwt.encode(claims, private_pem, algorithm=algorithm, headers={"kid": kid})
+
+class FakeJWKS:
+    """Stands in for Stack Auth's JWKS endpoint and counts fetches"""
+
+    def __init__(self, *keys: dict):
+        self.keys = list(keys)
+        self.fetches = 0
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        self.fetches += 1
+        return httpx.Response(200, json={"keys": self.keys}, request=httpx.Request("GET", url))
+
+@pytest.fixture
+def keys():
+    return {algorithm: _key_pair(algorithm) for algorithm in ("ES256", "RS256")}
+
+@pytest.fixture
+def jwks(monkeypatch, keys):
+    fake = FakeJWKS(*(
+        _jwk(public_pem, algorithm, f"{algorithm}-1")
+        for algorithm, (_, public_pem) in keys.items()
+    ))
+    monkeypatch.setattr(auth, "_stack_auth_get", fake.get)
+    monkeypatch.setattr(auth, "jwks_store", auth.JWKSKeyStore(
+        url="http://stack-auth/jwks.json",
+        max_age=3600,
+        min_refresh_interval=30
+    ))
+    return fake
+
+@pytest.mark.parametrize("algorithm", ["ES256", "RS256"])
+async def test_valid_token(jwks, keys, algorithm):
+    private_pem, _ = keys[algorithm]
+    token = _token(private_pem, algorithm, f"{algorithm}-1", email="user@example.com")
+
+    user = await auth.verify_stack_auth_token_locally(token)
+
+    assert user == {"id": "stack-user-1", "email": "user@example.com"}
+    assert jwks.fetches == 1
+
+async def test_bad_signature(jwks, keys):
+    other_private_pem, _ = _key_pair("ES256")
+    token = _token(other_private_pem, "ES256", "ES256-1")
+
+    with pytest.raises(HTTPException) as error:
+        await auth.verify_stack_auth_token_locally(token)
+    assert error.value.status_code == 401
+
+async def test_expired_token(jwks, keys):
+    private_pem, _ = keys["ES256"]
+    token = _token(private_pem, "ES256", "ES256-1", exp=int(time.time()) - 60)
+
+    with pytest.raises(HTTPException) as error:
+        await auth.verify_stack_auth_token_locally(token)
+    assert error.value.status_code == 401
+
+async def test_wrong_audience(jwks, keys):
+    private_pem, _ = keys["RS256"]
+    token = _token(private_pem, "RS256", "RS256-1", aud="another-project")
+
+    with pytest.raises(HTTPException) as error:
+        await auth.verify_stack_auth_token_locally(token)
+    assert error.value.status_code == 401
+
+async def test_unknown_kid_refreshes_keys(jwks, keys):
+    private_pem, _ = keys["ES256"]
+    await auth.jwks_store.refresh()
+    assert jwks.fetches == 1
+
+    # Stack Auth rotates in a new key after our copy of the set was fetched
+    rotated_private_pem, rotated_public_pem = _key_pair("ES256")
+    jwks.keys.append(_jwk(rotated_public_pem, "ES256", "ES256-2"))
+    auth.jwks_store._fetched_at -= auth.jwks_store.min_refresh_interval
+
+    user = await auth.verify_stack_auth_token_locally(_token(rotated_private_pem, "ES256", "ES256-2"))
+
+    assert user["id"] == "stack-user-1"
+    assert jwks.fetches == 2
+
+async def test_unknown_kid_refresh_is_throttled(jwks, keys):
+    private_pem, _ = keys["ES256"]
+    await auth.jwks_store.refresh()
+
+    for _ in range(5):
+        with pytest.raises(HTTPException) as error:
+            await auth.verify_stack_auth_token_locally(_token(private_pem, "ES256", "bogus-kid"))
+        assert error.value.status_code == 401
+
+    # Only the initial fetch: the set is younger than the minimum refresh interval
+    assert jwks.fetches == 1
@@ -0,0 +1,230 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, update
+
+import main
+from app.middleware.auth import DbUser, get_db_user
+from app.models.generation import Generation
+from app.routers import images, videos
+from app.services import fal_scheduler as fal_scheduler_module
+from app.services.fal_scheduler import FalScheduler
+from app.services.fal_service import FalService
+from app.services.generation_events import generation_events
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def scheduler():
+    return FalScheduler(
+        max_active=2,
+        max_queue_depth=10,
+        max_queued_per_user=10,
+        premium_weight=3,
+        retry_after=30,
+        reconcile_interval=30
+    )
+
+@pytest.fixture
+def submits(monkeypatch):
+    calls = []
+
+    async def submit_generation(*args, generation_id=None):
+        calls.append(generation_id)
+        await asyncio.sleep(0)
+        return {"request_id": f"req-{generation_id}"}
+
+    monkeypatch.setattr(FalService, "submit_generation", staticmethod(submit_generation))
+    return calls
+
+async def _pending(db, user) -> Generation:
+    generation = Generation(
+        user_id=user.id,
+        generation_type="image",
+        model_name="fal-ai/flux/schnell",
+        prompt="a lighthouse",
+        parameters="{}",
+        status="pending"
+    )
+    db.add(generation)
+    await db.commit()
+    return generation
+
+async def test_queued_row_is_submitted_once(db, user, scheduler, submits):
+    generation = await _pending(db, user)
+    # Two workers both queued the row
+    other = FalScheduler(
+        max_active=2, max_queue_depth=10, max_queued_per_user=10,
+        premium_weight=3, retry_after=30, reconcile_interval=30
+    )
+    scheduler.active += 1
+    other.active += 1
+
+    await asyncio.gather(scheduler._dispatch(generation.id), other._dispatch(generation.id))
+
+    assert submits == [generation.id]
+    assert scheduler.active + other.active == 1
+    result = await db.execute(select(Generation.status, Generation.fal_request_id))
+    assert result.one() == ("processing", f"req-{generation.id}")
+
+async def test_only_own_slots_are_released(db, user, scheduler, submits):
+    mine = Generation(
+        user_id=user.id, generation_type="image", model_name="fal-ai/flux/schnell",
+        prompt="mine", parameters="{}"
+    )
+    await scheduler.submit(user.id, False, mine)
+    assert scheduler.active == 1
+
+    # Another worker's generation finishing here frees nothing
+    generation_events.publish(user.id, mine.id + 1000, "completed", progress=1.0)
+    assert scheduler.active == 1
+
+    generation_events.publish(user.id, mine.id, "completed", progress=1.0)
+    assert scheduler.active == 0
+
+async def test_reconcile_frees_slots_finished_elsewhere(db, user, scheduler, submits):
+    generation = Generation(
+        user_id=user.id, generation_type="image", model_name="fal-ai/flux/schnell",
+        prompt="a lighthouse", parameters="{}"
+    )
+    await scheduler.submit(user.id, False, generation)
+
+    # Finalized by another worker's webhook: no event reaches this process
+    await db.execute(update(Generation).where(Generation.id == generation.id).values(status="completed"))
+    await db.commit()
+    await scheduler._reconcile()
+
+    assert scheduler.active == 0
+
+def _new(user_id: int, prompt: str = "a lighthouse") -> Generation:
+    return Generation(
+        user_id=user_id, generation_type="image", model_name="fal-ai/flux/schnell",
+        prompt=prompt, parameters="{}"
+    )
+
+def _drain(scheduler) -> list:
+    order = []
+    while scheduler.queued:
+        order.append(scheduler._pop())
+    return order
+
+def test_users_take_turns(scheduler):
+    for generation_id in (1, 2, 3, 4):
+        scheduler.enqueue(1, False, generation_id)
+    for generation_id in (11, 12):
+        scheduler.enqueue(2, False, generation_id)
+
+    # A user with a backlog doesn't hold up one who queued later
+    assert _drain(scheduler) == [1, 11, 2, 12, 3, 4]
+
+def test_premium_users_get_more_of_the_slots(scheduler):
+    for generation_id in (1, 2, 3):
+        scheduler.enqueue(1, False, generation_id)
+    for generation_id in (21, 22, 23, 24, 25, 26):
+        scheduler.enqueue(2, True, generation_id)
+
+    # premium_weight=3: three premium jobs for each standard one
+    assert _drain(scheduler) == [1, 21, 22, 23, 2, 24, 25, 26, 3]
+
+def test_idle_users_bank_no_credit(scheduler):
+    for generation_id in (1, 2, 3, 4):
+        scheduler.enqueue(1, False, generation_id)
+    assert scheduler._pop() == 1
+    assert scheduler._pop() == 2
+
+    # Joins at the start tag of the job just dispatched, not at zero, so it
+    # gets no turns for the time it wasn't queuing
+    scheduler.enqueue(2, False, 11)
+    scheduler.enqueue(2, False, 12)
+
+    assert _drain(scheduler) == [11, 3, 12, 4]
+
+def test_position_matches_dispatch_order(scheduler):
+    for generation_id in (1, 2, 3):
+        scheduler.enqueue(1, False, generation_id)
+    for generation_id in (21, 22, 23, 24):
+        scheduler.enqueue(2, True, generation_id)
+    scheduler.enqueue(3, False, 31)
+
+    positions = {generation_id: scheduler.position(generation_id) for generation_id in (1, 2, 3, 21, 22, 23, 24, 31)}
+
+    order = _drain(scheduler)
+    assert positions == {generation_id: index for index, generation_id in enumerate(order)}
+    assert scheduler.position(1) is None
+
+async def test_full_scheduler_queues_with_a_position(db, user, scheduler, submits):
+    scheduler.active = scheduler.max_active
+    first, second = _new(user.id, "first"), _new(user.id, "second")
+
+    await scheduler.submit(user.id, False, first)
+    await scheduler.submit(user.id, False, second)
+
+    assert submits == []
+    assert (scheduler.position(first.id), scheduler.position(second.id)) == (0, 1)
+    result = await db.execute(select(Generation.status).order_by(Generation.id))
+    assert result.scalars().all() == ["pending", "pending"]
+
+async def test_per_user_queue_limit(db, user, scheduler, submits):
+    scheduler.active = scheduler.max_active
+    scheduler.max_queued_per_user = 2
+    for n in range(2):
+        await scheduler.submit(user.id, False, _new(user.id, f"queued {n}"))
+
+    with pytest.raises(HTTPException) as error:
+        await scheduler.submit(user.id, False, _new(user.id, "one too many"))
+
+    assert error.value.status_code == 429
+    assert error.value.headers == {"Retry-After": "30"}
+    # Other users still get in line
+    scheduler.enqueue(user.id + 1, False, 999)
+    assert scheduler.queued == 3
+
+async def test_global_queue_limit(db, user, scheduler, submits):
+    scheduler.active = scheduler.max_active
+    scheduler.max_queue_depth = 2
+    scheduler.enqueue(user.id + 1, False, 999)
+    await scheduler.submit(user.id, False, _new(user.id, "queued"))
+
+    with pytest.raises(HTTPException) as error:
+        await scheduler.submit(user.id, False, _new(user.id, "one too many"))
+
+    assert error.value.status_code == 429
+    result = await db.execute(select(Generation.prompt))
+    assert result.scalars().all() == ["queued"]
+
+@pytest.fixture
+async def api(user):
+    main.app.dependency_overrides[get_db_user] = lambda: DbUser(
+        id=user.id, stack_user_id=user.stack_user_id, is_premium=False
+    )
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://testserver") as client:
+        yield client
+    main.app.dependency_overrides.clear()
+
+@pytest.fixture
+def full_scheduler(monkeypatch, scheduler):
+    """The app's scheduler with every slot taken and nothing dispatching"""
+    monkeypatch.setattr(fal_scheduler_module, "fal_scheduler", scheduler)
+    for module in (images, videos):
+        monkeypatch.setattr(module, "fal_scheduler", scheduler)
+    scheduler.active = scheduler.max_active
+    return scheduler
+
+async def test_generate_reports_the_queue_position(api, full_scheduler, submits):
+    full_scheduler.enqueue(999, False, 999)
+
+    response = await api.post("/api/images/generate", json={"prompt": "a lighthouse"})
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "pending"
+    assert response.json()["queue_position"] == 1
+
+async def test_generate_is_rejected_when_the_queue_is_full(api, full_scheduler, submits):
+    full_scheduler.max_queued_per_user = 0
+
+    response = await api.post("/api/videos/generate", json={"prompt": "a lighthouse"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "30"
@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from sqlalchemy import select, update
+
+import main
+from app.config import settings
+from app.middleware.auth import DbUser, get_db_user
+from app.models.generation import Generation
+from app.services.fal_service import FalService
+from app.services.generation_cache import cache_enabled
+
+pytestmark = pytest.mark.anyio
+
+REQUEST = {"prompt": "a lighthouse", "seed": 7}
+
+def test_unseeded_requests_are_never_shared():
+    assert not cache_enabled(True, None)
+    assert not cache_enabled(False, 42)
+    assert cache_enabled(True, 42)
+    assert cache_enabled(True, 0)
+
+@pytest.fixture
+async def api(user):
+    main.app.dependency_overrides[get_db_user] = lambda: DbUser(
+        id=user.id, stack_user_id=user.stack_user_id, is_premium=False
+    )
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://testserver") as client:
+        yield client
+    main.app.dependency_overrides.clear()
+
+class FakeFal:
+    """Stands in for FalService.submit_generation; clear ``open`` to hold submits"""
+
+    def __init__(self):
+        self.calls = []
+        self.open = asyncio.Event()
+        self.open.set()
+
+    async def submit_generation(self, *args, generation_id=None):
+        self.calls.append(generation_id)
+        await self.open.wait()
+        return {"request_id": f"req-{generation_id}"}
+
+@pytest.fixture
+def fal(monkeypatch):
+    fake = FakeFal()
+    monkeypatch.setattr(FalService, "submit_generation", staticmethod(fake.submit_generation))
+    return fake
+
+async def _rows(db):
+    result = await db.execute(
+        select(Generation.id, Generation.project_id)
+        .order_by(Generation.id)
+        .execution_options(populate_existing=True)
+    )
+    return result.all()
+
+async def test_completed_generation_is_reused(db, api, fal):
+    first = (await api.post("/api/images/generate", json=REQUEST)).json()
+    await db.execute(
+        update(Generation)
+        .where(Generation.id == first["id"])
+        .values(status="completed", result_url="https://fal.media/files/a.png")
+    )
+    await db.commit()
+
+    second = (await api.post("/api/images/generate", json=REQUEST)).json()
+
+    assert second["id"] == first["id"]
+    assert second["status"] == "completed"
+    assert second["result_url"] == "https://fal.media/files/a.png"
+    assert len(fal.calls) == 1
+
+async def test_identical_submits_in_flight_share_one_job(db, api, fal):
+    fal.open.clear()
+
+    async def open_later():
+        while not fal.calls:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        fal.open.set()
+
+    first, second, _ = await asyncio.gather(
+        api.post("/api/images/generate", json=REQUEST),
+        api.post("/api/images/generate", json=REQUEST),
+        open_later()
+    )
+
+    assert first.json()["id"] == second.json()["id"]
+    assert len(fal.calls) == 1
+    assert len(await _rows(db)) == 1
+
+async def test_generations_older_than_the_ttl_are_not_reused(db, api, fal):
+    first = (await api.post("/api/images/generate", json=REQUEST)).json()
+    expired = datetime.now(timezone.utc) - timedelta(seconds=settings.GENERATION_CACHE_TTL_SECONDS + 60)
+    await db.execute(update(Generation).where(Generation.id == first["id"]).values(created_at=expired))
+    await db.commit()
+
+    second = (await api.post("/api/images/generate", json=REQUEST)).json()
+
+    assert second["id"] != first["id"]
+    assert len(fal.calls) == 2
+
+async def test_unseeded_requests_are_submitted_each_time(api, fal):
+    for _ in range(2):
+        await api.post("/api/images/generate", json={"prompt": "a lighthouse"})
+
+    assert len(fal.calls) == 2
+
+async def test_reuse_stays_within_a_project(db, api, fal):
+    project = (await api.post("/api/projects/", json={"name": "Poster", "project_type": "design"})).json()
+
+    loose = (await api.post("/api/images/generate", json=REQUEST)).json()
+    filed = (await api.post("/api/images/generate", json={**REQUEST, "project_id": project["id"]})).json()
+    again = (await api.post("/api/images/generate", json={**REQUEST, "project_id": project["id"]})).json()
+
+    assert filed["id"] != loose["id"]
+    assert again["id"] == filed["id"]
+    assert len(fal.calls) == 2
+    assert await _rows(db) == [(loose["id"], None), (filed["id"], project["id"])]
+
+async def test_batch_reuse_stays_within_a_project(db, api, fal):
+    project = (await api.post("/api/projects/", json={"name": "Poster", "project_type": "design"})).json()
+    loose = (await api.post("/api/images/generate", json=REQUEST)).json()
+
+    response = await api.post("/api/images/generate/batch", json={"items": [
+        REQUEST,
+        {**REQUEST, "project_id": project["id"]},
+        {**REQUEST, "project_id": project["id"]},
+    ]})
+
+    ids = [item["generation"]["id"] for item in response.json()["items"]]
+    assert ids[0] == loose["id"]
+    assert ids[1] == ids[2] != loose["id"]
+    assert len(fal.calls) == 2
+    assert await _rows(db) == [(loose["id"], None), (ids[1], project["id"])]
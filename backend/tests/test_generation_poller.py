@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.models.generation import Generation
+from app.services.fal_service import FalService
+from app.services.generation_poller import GenerationPoller
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def poller():
+    return GenerationPoller(
+        interval=1,
+        batch_size=10,
+        concurrency=2,
+        backoff_base=1,
+        backoff_max=60,
+        initial_delay=30,
+        max_processing=3600
+    )
+
+@pytest.fixture
+def status_calls(monkeypatch):
+    calls = []
+
+    async def get_status(model, request_id):
+        calls.append(request_id)
+        return {"status": "in_progress"}
+
+    monkeypatch.setattr(FalService, "get_status", staticmethod(get_status))
+    return calls
+
+async def _processing(db, user, request_id, **columns) -> Generation:
+    generation = Generation(
+        user_id=user.id,
+        generation_type="image",
+        model_name="fal-ai/flux/schnell",
+        prompt="a lighthouse",
+        fal_request_id=request_id,
+        status="processing",
+        **columns
+    )
+    db.add(generation)
+    await db.commit()
+    return generation
+
+async def test_unseen_rows_get_the_grace_period(db, user, poller, status_calls):
+    generation = await _processing(db, user, "req-1")
+
+    # Found by the sweep rather than tracked, e.g. submitted by another worker
+    await poller.sweep()
+
+    assert status_calls == []
+    assert generation.id in poller._schedule
+
+async def test_sweep_keeps_entries_tracked_while_it_runs(db, user, poller, status_calls, monkeypatch):
+    await _processing(db, user, "req-1")
+    original = poller._is_due
+
+    def is_due(generation_id, now):
+        # A submission lands after the sweep's query ran
+        poller.track(999)
+        return original(generation_id, now)
+
+    monkeypatch.setattr(poller, "_is_due", is_due)
+    await poller.sweep()
+
+    assert 999 in poller._schedule
+
+async def test_stuck_generations_time_out(db, user, poller, status_calls):
+    long_ago = datetime.now(timezone.utc) - timedelta(hours=2)
+    stuck = await _processing(db, user, "req-lost", updated_at=long_ago)
+    never_sent = await _processing(db, user, None, updated_at=long_ago)
+    running = await _processing(db, user, "req-2")
+
+    await poller.sweep()
+
+    result = await db.execute(select(Generation.id, Generation.status).order_by(Generation.id))
+    assert result.all() == [(stuck.id, "failed"), (never_sent.id, "failed"), (running.id, "processing")]
+    assert status_calls == []
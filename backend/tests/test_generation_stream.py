@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import pytest
+
+from app.middleware.auth import DbUser
+from app.models.generation import Generation
+from app.routers.generations import stream_generation_status
+from app.services.generation_events import generation_events
+
+pytestmark = pytest.mark.anyio
+
+async def _events(body_iterator, count: int):
+    events = []
+    while len(events) < count:
+        chunk = await asyncio.wait_for(body_iterator.__anext__(), timeout=1)
+        if chunk.startswith("event: status"):
+            events.append(json.loads(chunk.split("data: ", 1)[1]))
+    return events
+
+@pytest.fixture
+async def generation(db, user):
+    row = Generation(
+        user_id=user.id,
+        generation_type="image",
+        model_name="fal-ai/flux/schnell",
+        prompt="a lighthouse",
+        fal_request_id="req-1",
+        status="processing"
+    )
+    db.add(row)
+    await db.commit()
+    return row
+
+async def test_completion_published_while_reading_the_snapshot(db, user, generation, monkeypatch):
+    latest = generation_events.latest
+
+    def publish_then_latest(generation_id):
+        # The generation finishes after the snapshot query saw it processing
+        generation_events.publish(user.id, generation_id, "completed", result_url="https://fal.media/a.png", progress=1.0)
+        return latest(generation_id)
+
+    monkeypatch.setattr(generation_events, "latest", publish_then_latest)
+    response = await stream_generation_status(
+        user=DbUser(id=user.id, stack_user_id=user.stack_user_id, is_premium=False),
+        db=db
+    )
+
+    events = await _events(response.body_iterator, 2)
+    await response.body_iterator.aclose()
+
+    assert [event["status"] for event in events] == ["processing", "completed"]
+    assert events[1]["result_url"] == "https://fal.media/a.png"
+
+async def test_events_repeating_the_snapshot_are_dropped(db, user, generation, monkeypatch):
+    latest = generation_events.latest
+
+    def publish_then_latest(generation_id):
+        # Queued for the stream and picked up by the snapshot
+        generation_events.publish(user.id, generation_id, "processing", progress=0.5)
+        return latest(generation_id)
+
+    monkeypatch.setattr(generation_events, "latest", publish_then_latest)
+    response = await stream_generation_status(
+        user=DbUser(id=user.id, stack_user_id=user.stack_user_id, is_premium=False),
+        db=db
+    )
+    generation_events.publish(user.id, generation.id, "completed", progress=1.0)
+
+    events = await _events(response.body_iterator, 2)
+    await response.body_iterator.aclose()
+
+    assert [(event["status"], event["progress"]) for event in events] == [
+        ("processing", 0.5), ("completed", 1.0)
+    ]
@@ -0,0 +1,84 @@
+import httpx
+import pytest
+
+import main
+from app.config import settings
+from app.metrics import (
+    GENERATIONS_FINISHED,
+    GenerationCounts,
+    metrics_access_allowed,
+    model_label,
+    observe_generation_outcome,
+)
+from app.services.usage_stats import record_generation_outcome
+
+pytestmark = pytest.mark.anyio
+
+def _scraper(client_host: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=main.app, client=(client_host, 40000)),
+        base_url="http://testserver"
+    )
+
+def test_access_by_network():
+    assert metrics_access_allowed(None, "127.0.0.1")
+    assert metrics_access_allowed(None, "10.2.3.4")
+    assert not metrics_access_allowed(None, "203.0.113.7")
+    assert not metrics_access_allowed(None, None)
+
+def test_access_by_token(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-token")
+
+    assert metrics_access_allowed("Bearer scrape-token", "203.0.113.7")
+    assert not metrics_access_allowed("Bearer wrong-token", "127.0.0.1")
+    assert not metrics_access_allowed(None, "127.0.0.1")
+
+async def test_public_scrape_is_refused(db):
+    async with _scraper("203.0.113.7") as client:
+        response = await client.get("/metrics")
+    assert response.status_code == 403
+
+    async with _scraper("127.0.0.1") as client:
+        response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert b"generations_finished_total" in response.content
+
+async def test_generation_counts_refresh_on_an_interval(monkeypatch):
+    now = [1000.0]
+    counts = GenerationCounts(interval=60, clock=lambda: now[0])
+    queries = []
+
+    async def count():
+        queries.append(now[0])
+
+    monkeypatch.setattr(counts, "_count", count)
+    for _ in range(3):
+        await counts.refresh()
+    now[0] += 60
+    await counts.refresh()
+
+    assert queries == [1000.0, 1060.0]
+
+async def test_outcome_is_not_counted_before_commit(db, user):
+    labels = ("image", "fal-ai/flux/schnell", "completed")
+    before = GENERATIONS_FINISHED.labels(*labels)._value.get()
+
+    await record_generation_outcome(
+        db, user.id, "image", "fal-ai/flux/schnell", {"status": "completed", "cost": 0.003}
+    )
+    await db.rollback()
+
+    assert GENERATIONS_FINISHED.labels(*labels)._value.get() == before
+
+def test_unknown_models_share_one_label():
+    assert model_label("fal-ai/flux/schnell") == "fal-ai/flux/schnell"
+    assert model_label("made-up/model-1") == "other"
+    assert model_label(None) == "other"
+
+def test_client_chosen_models_do_not_add_series():
+    for n in range(5):
+        observe_generation_outcome("image", f"made-up/model-{n}", {"status": "failed"})
+
+    series = {sample.labels["model"] for sample in list(GENERATIONS_FINISHED.collect())[0].samples}
+    assert not any(model.startswith("made-up/") for model in series)
+    assert "other" in series
@@ -0,0 +1,81 @@
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import create_engine, inspect, text
+
+from app.config import settings
+from app.database import Base, upgrade_schema
+from app.models import asset, generation, project, usage, user  # noqa: F401 - register tables
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/mode_design.db")
+    yield engine
+    engine.dispose()
+
+def _head(connection) -> str:
+    return MigrationContext.configure(connection).get_current_revision()
+
+def _create_all_before_migrations(engine) -> None:
+    """A database as create_all made it before migrations were added"""
+    config = Config(settings.ALEMBIC_CONFIG)
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        command.upgrade(config, "0001")
+        connection.execute(text("DROP TABLE alembic_version"))
+
+def test_migrations_build_the_current_models(engine):
+    with engine.begin() as connection:
+        upgrade_schema(connection)
+
+    with engine.connect() as connection:
+        assert compare_metadata(MigrationContext.configure(connection), Base.metadata) == []
+        assert _head(connection) == "0002"
+
+def test_upgrades_a_database_from_before_migrations(engine):
+    _create_all_before_migrations(engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO users (id, stack_user_id, email) VALUES (1, 'stack-user-1', 'user@example.com')"
+        ))
+        connection.execute(text(
+            "INSERT INTO projects (id, user_id, name, project_type, created_at)"
+            " VALUES (1, 1, 'Poster', 'design', '2026-01-01 00:00:00')"
+        ))
+        connection.execute(text(
+            "INSERT INTO generations (user_id, generation_type, model_name, prompt, status, processing_time,"
+            " cost, created_at, completed_at) VALUES"
+            " (1, 'image', 'fal-ai/flux/schnell', 'a', 'completed', 2.5, 0.003, '2026-01-01 00:00:00', '2026-01-01 00:00:03'),"
+            " (1, 'image', 'fal-ai/flux/schnell', 'b', 'failed', NULL, 0.0, '2026-01-01 00:00:00', '2026-01-01 00:00:01')"
+        ))
+
+    with engine.begin() as connection:
+        upgrade_schema(connection)
+
+    with engine.connect() as connection:
+        assert _head(connection) == "0002"
+        indexes = {index["name"] for index in inspect(connection).get_indexes("generations")}
+        assert {"ix_generations_user_type_created", "ix_generations_user_type_updated"} <= indexes
+        assert connection.execute(text("SELECT version, updated_at FROM projects")).one() == (1, "2026-01-01 00:00:00")
+        assert connection.execute(text("SELECT updated_at FROM generations ORDER BY id")).scalars().all() == [
+            "2026-01-01 00:00:03", "2026-01-01 00:00:01"
+        ]
+        assert connection.execute(text(
+            "SELECT completed_count, failed_count, processing_time_count FROM user_generation_stats"
+        )).one() == (1, 1, 1)
+        assert connection.execute(text(
+            "SELECT SUM(count) FROM user_generation_processing_time_buckets"
+        )).scalar() == 1
+
+def test_upgrades_a_database_create_all_made_recently(engine):
+    # Made by create_all after some of the new columns were added, e.g. in development
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as connection:
+        upgrade_schema(connection)
+
+    with engine.connect() as connection:
+        assert _head(connection) == "0002"
+        assert compare_metadata(MigrationContext.configure(connection), Base.metadata) == []
@@ -0,0 +1,143 @@
+import httpx
+import pytest
+
+import main
+from app.middleware.auth import DbUser, get_db_user
+from app.models.generation import Generation
+from app.models.project import Project
+from app.models.user import User
+from app.services.asset_mirror import AssetMirror
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def api(user):
+    main.app.dependency_overrides[get_db_user] = lambda: DbUser(
+        id=user.id, stack_user_id=user.stack_user_id, is_premium=False
+    )
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://testserver") as client:
+        yield client
+    main.app.dependency_overrides.clear()
+
+@pytest.fixture
+async def project(api):
+    response = await api.post("/api/projects/", json={
+        "name": "Poster", "project_type": "design", "data": {"layers": []}
+    })
+    return response.json()
+
+async def test_put_with_current_version(api, project):
+    response = await api.put(
+        f"/api/projects/{project['id']}",
+        json={"name": "Poster v2"},
+        headers={"If-Match": f'"{project["version"]}"'}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["name"] == "Poster v2"
+    assert response.json()["data"] == {"layers": []}
+    assert response.json()["version"] == project["version"] + 1
+
+async def test_put_does_not_overwrite_a_newer_save(api, project):
+    await api.patch(
+        f"/api/projects/{project['id']}",
+        content=b'[{"op": "add", "path": "/layers/-", "value": "text"}]',
+        headers={"Content-Type": "application/json-patch+json", "If-Match": f'"{project["version"]}"'}
+    )
+
+    response = await api.put(
+        f"/api/projects/{project['id']}",
+        json={"data": {"layers": []}},
+        headers={"If-Match": f'"{project["version"]}"'}
+    )
+
+    assert response.status_code == 409
+    saved = (await api.get(f"/api/projects/{project['id']}")).json()
+    assert saved["data"] == {"layers": ["text"]}
+    assert saved["version"] == project["version"] + 1
+
+async def test_put_without_if_match(api, project):
+    response = await api.put(f"/api/projects/{project['id']}", json={"is_public": True})
+
+    assert response.status_code == 200
+    assert response.json()["is_public"] is True
+
+@pytest.fixture
+async def foreign_project(db):
+    owner = User(stack_user_id="stack-user-2", email="other@example.com", username="other")
+    db.add(owner)
+    await db.flush()
+    row = Project(user_id=owner.id, name="Not yours", project_type="design", data="{}")
+    db.add(row)
+    await db.commit()
+    return {"id": row.id, "user_id": owner.id, "version": row.version}
+
+async def _mirror(generation_id: int, tmp_path) -> str:
+    mirror = AssetMirror(
+        store_dir=str(tmp_path), concurrency=1, queue_size=10, backfill_limit=0,
+        max_bytes=1024, timeout=5, allowed_hosts=["fal.media"]
+    )
+    mirror._get_client()._transport = httpx.MockTransport(
+        lambda request: httpx.Response(200, content=b"png", headers={"Content-Type": "image/png"})
+    )
+    sha256 = await mirror.mirror(generation_id)
+    await mirror.stop()
+    return sha256
+
+async def test_new_thumbnail_changes_the_etag(db, user, api, project, tmp_path):
+    response = await api.get(f"/api/projects/{project['id']}")
+    etag = response.headers["ETag"]
+    generation = Generation(
+        user_id=user.id,
+        project_id=project["id"],
+        generation_type="image",
+        model_name="fal-ai/flux/schnell",
+        prompt="a lighthouse",
+        status="completed",
+        result_url="https://fal.media/files/lighthouse.png"
+    )
+    db.add(generation)
+    await db.commit()
+
+    sha256 = await _mirror(generation.id, tmp_path)
+
+    response = await api.get(f"/api/projects/{project['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["thumbnail_url"] == f"/api/assets/{sha256}/thumbnail"
+    assert response.headers["ETag"] != etag
+
+@pytest.mark.parametrize("path, body", [
+    ("/api/images/generate", {"prompt": "a lighthouse"}),
+    ("/api/videos/generate", {"prompt": "a lighthouse"}),
+])
+async def test_generate_into_someone_elses_project(api, foreign_project, path, body):
+    response = await api.post(path, json={**body, "project_id": foreign_project["id"]})
+
+    assert response.status_code == 404
+
+async def test_batch_item_for_someone_elses_project(api, foreign_project):
+    response = await api.post("/api/images/generate/batch", json={
+        "items": [{"prompt": "a lighthouse", "project_id": foreign_project["id"]}]
+    })
+
+    assert response.status_code == 200
+    assert response.json()["items"][0]["status_code"] == 404
+
+async def test_mirror_leaves_someone_elses_project_alone(db, user, foreign_project, tmp_path):
+    generation = Generation(
+        user_id=user.id,
+        project_id=foreign_project["id"],
+        generation_type="image",
+        model_name="fal-ai/flux/schnell",
+        prompt="a lighthouse",
+        status="completed",
+        result_url="https://fal.media/files/lighthouse.png"
+    )
+    db.add(generation)
+    await db.commit()
+
+    assert await _mirror(generation.id, tmp_path)
+
+    project = await db.get(Project, foreign_project["id"], populate_existing=True)
+    assert project.thumbnail_url is None
+    assert project.version == foreign_project["version"]
@@ -0,0 +1,70 @@
+import httpx
+import pytest
+
+from app.config import settings
+from app.middleware import auth
+from app.middleware.auth import _token_key, token_cache
+from app.middleware.rate_limit import (
+    LocalScriptClient,
+    MemoryBucketStore,
+    RateLimitMiddleware,
+    SharedBucketStore,
+    parse_rule,
+)
+
+pytestmark = pytest.mark.anyio
+
+def _scope(token: str = None, client: str = "203.0.113.7") -> dict:
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    return {"type": "http", "headers": headers, "client": (client, 40000)}
+
+@pytest.fixture(autouse=True)
+def empty_token_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+def test_unverified_tokens_share_the_client_bucket():
+    keys = {RateLimitMiddleware.client_key(_scope(f"bogus-{n}")) for n in range(3)}
+
+    assert keys == {"ip:203.0.113.7"}
+
+def test_verified_tokens_are_keyed_by_user():
+    token_cache.set(_token_key("good-token"), {"id": "stack-user-1"})
+
+    assert RateLimitMiddleware.client_key(_scope("good-token")) == "user:stack-user-1"
+
+async def test_local_verification_fills_the_identity_cache(monkeypatch):
+    async def verify_locally(token):
+        return {"id": "stack-user-1"}
+
+    monkeypatch.setattr(settings, "STACK_AUTH_VERIFICATION_MODE", "local")
+    monkeypatch.setattr(auth, "verify_stack_auth_token_locally", verify_locally)
+
+    await auth.verify_stack_auth_token("good-token")
+
+    assert RateLimitMiddleware.client_key(_scope("good-token")) == "user:stack-user-1"
+
+async def _ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+@pytest.mark.parametrize("store", [
+    MemoryBucketStore(),
+    SharedBucketStore(LocalScriptClient()),
+], ids=["memory", "shared"])
+async def test_route_classes_have_separate_buckets(store):
+    token_cache.set(_token_key("good-token"), {"id": "stack-user-1"})
+    middleware = RateLimitMiddleware(_ok, store=store, rules={
+        name: parse_rule(name, spec)
+        for name, spec in {"generate": "2/minute", "status": "2/minute", "default": "2/minute"}.items()
+    })
+    headers = {"Authorization": "Bearer good-token"}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url="http://testserver") as client:
+        generates = [(await client.post("/api/images/generate", headers=headers)).status_code for _ in range(3)]
+        status = await client.get("/api/images/generations/1/status", headers=headers)
+
+    assert generates == [200, 200, 429]
+    assert status.status_code == 200
+    assert status.headers["RateLimit-Remaining"] == "1"
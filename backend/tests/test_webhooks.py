@@ -0,0 +1,156 @@
+from urllib.parse import urlsplit
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+import main
+from app.config import settings
+from app.models.generation import Generation
+from app.services import fal_service
+from app.services.fal_scheduler import fal_scheduler
+from app.services.fal_service import FalService
+from benchmarks import fake_fal
+
+pytestmark = pytest.mark.anyio
+
+RESULT_URL = "https://v3.fal.media/files/lighthouse.png"
+
+@pytest.fixture
+async def fal(monkeypatch):
+    """Points the fal client at the fake queue API"""
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=fake_fal.app),
+        base_url=settings.FAL_QUEUE_URL
+    )
+    monkeypatch.setattr(fal_service, "_http_client", client)
+    yield fake_fal
+    # Callbacks are delivered by the tests, not by the fake
+    for task in list(fake_fal._webhook_tasks):
+        task.cancel()
+    await client.aclose()
+
+@pytest.fixture
+async def api():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://testserver") as client:
+        yield client
+
+async def _processing(db, user, request_id, prompt: str = "a lighthouse") -> Generation:
+    generation = Generation(
+        user_id=user.id,
+        generation_type="image",
+        model_name="fal-ai/flux/schnell",
+        prompt=prompt,
+        fal_request_id=request_id,
+        status="processing"
+    )
+    db.add(generation)
+    await db.commit()
+    await db.refresh(generation)
+    return generation
+
+async def _submit(user, prompt: str = "a lighthouse") -> Generation:
+    generation = Generation(
+        user_id=user.id,
+        generation_type="image",
+        model_name="fal-ai/flux/schnell",
+        prompt=prompt,
+        parameters="{}"
+    )
+    await fal_scheduler.submit(user.id, False, generation)
+    return generation
+
+async def _deliver(api, callback_url: str, request_id: str, result_url: str = RESULT_URL) -> httpx.Response:
+    url = urlsplit(callback_url)
+    return await api.post(
+        f"{url.path}?{url.query}",
+        json={"request_id": request_id, "status": "OK", "payload": {"images": [{"url": result_url}]}}
+    )
+
+async def _status(db, generation_id: int) -> Generation:
+    result = await db.execute(
+        select(Generation)
+        .where(Generation.id == generation_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one()
+
+async def test_submit_registers_a_callback_for_the_generation(fal):
+    result = await FalService.submit_generation(
+        "image", "fal-ai/flux/schnell", "a lighthouse", None, {}, generation_id=42
+    )
+
+    url = urlsplit(fal.jobs[result["request_id"]]["webhook_url"])
+    assert url.path == "/api/webhooks/fal"
+    assert url.query == f"generation_id=42&signature={FalService._sign(42)}"
+
+async def test_callback_finalizes_its_generation(db, user, api):
+    generation = await _processing(db, user, "req-1")
+
+    response = await _deliver(api, FalService.webhook_url(generation.id), "req-1")
+
+    assert response.json() == {"message": "Generation updated"}
+    stored = await _status(db, generation.id)
+    assert stored.status == "completed"
+    assert stored.result_url == RESULT_URL
+
+async def test_callback_url_is_bound_to_one_generation(db, user, api):
+    leaked = await _processing(db, user, "req-1", "first")
+    victim = await _processing(db, user, "req-2", "second")
+
+    # A leaked callback URL replayed with another generation's request id
+    response = await _deliver(api, FalService.webhook_url(leaked.id), "req-2", "https://evil.example/x.png")
+
+    assert response.json() == {"message": "Ignored"}
+    assert (await _status(db, victim.id)).status == "processing"
+    assert (await _status(db, leaked.id)).status == "processing"
+
+async def test_callback_is_not_replayable(db, user, api):
+    generation = await _processing(db, user, "req-1")
+    callback_url = FalService.webhook_url(generation.id)
+    await _deliver(api, callback_url, "req-1")
+
+    response = await _deliver(api, callback_url, "req-1", "https://evil.example/x.png")
+
+    assert response.json() == {"message": "Ignored"}
+    assert (await _status(db, generation.id)).result_url == RESULT_URL
+
+async def test_bad_signature_is_rejected(db, user, api):
+    generation = await _processing(db, user, "req-1")
+    forged = FalService.webhook_url(generation.id).replace("signature=", "signature=0")
+
+    response = await _deliver(api, forged, "req-1")
+
+    assert response.status_code == 401
+    assert (await _status(db, generation.id)).status == "processing"
+
+async def test_callback_before_request_id_is_stored(db, user, api):
+    generation = await _processing(db, user, None)
+
+    response = await _deliver(api, FalService.webhook_url(generation.id), "some-request-id")
+
+    # fal retries the callback once the submit has stored its request id
+    assert response.status_code == 409
+
+async def test_scheduled_submit_is_finalized_by_its_callback(db, user, fal, api):
+    generation = await _submit(user)
+    job = fal.jobs[generation.fal_request_id]
+
+    response = await _deliver(api, job["webhook_url"], generation.fal_request_id)
+
+    assert response.json() == {"message": "Generation updated"}
+    assert (await _status(db, generation.id)).status == "completed"
+
+async def test_failed_submit_leaves_a_failed_row(db, user, fal, monkeypatch):
+    async def refuse(*args, **kwargs):
+        raise fal_service.FalServiceError("fal said no")
+
+    monkeypatch.setattr(FalService, "submit_generation", staticmethod(refuse))
+    active = fal_scheduler.active
+
+    with pytest.raises(fal_service.FalServiceError):
+        await _submit(user)
+
+    result = await db.execute(select(Generation.status, Generation.error_message))
+    assert result.all() == [("failed", "fal said no")]
+    assert fal_scheduler.active == active